@@ -0,0 +1,151 @@
+"""Load test for the HTTP API (solar_fin.api) on localhost.
+
+    python benchmarks/load_test_api.py                          # starts a server, 2000 /evaluate calls
+    python benchmarks/load_test_api.py --concurrency 64 --distinct 50
+    python benchmarks/load_test_api.py --endpoint report --requests 100
+    python benchmarks/load_test_api.py --url http://127.0.0.1:8000   # an already running server
+
+Clients are threads with keep-alive connections. `--distinct` sets how many
+different scenarios are sent (fewer means more cache hits; 0 makes every
+request unique). Prints requests per second and p50/p90/p99 latency, plus
+the server's cache and coalescing counters.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from run_benchmarks import DEFAULT_INPUTS  # noqa: E402
+
+
+def scenario(index, distinct):
+    # Deterministic scenario for request `index`; `distinct` variants in total (0 = all different)
+    variant = index if distinct == 0 else index % distinct
+    rng = np.random.default_rng(variant)
+    return dict(DEFAULT_INPUTS, electricity_cost=round(float(rng.uniform(0.05, 0.3)), 6),
+                project_capacity=round(float(rng.uniform(1, 1000)), 3), client_name=f"Load test {variant}")
+
+
+def request_body(endpoint, index, distinct, batch_size):
+    if endpoint == 'batch':
+        return {'scenarios': [scenario(index * batch_size + i, distinct * batch_size) for i in range(batch_size)]}
+    return scenario(index, distinct)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workers):
+    command = [sys.executable, '-m', 'solar_fin.api', '--port', str(port)] + (['--workers', str(workers)] if workers else [])
+    server = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("The API server did not start")
+
+
+def run(host, port, endpoint, n_requests, concurrency, distinct, batch_size, first=0):
+    bodies = [json.dumps(request_body(endpoint, first + i, distinct, batch_size)).encode() for i in range(n_requests)]
+    latencies = [None] * n_requests
+    failures = []
+    next_index = iter(range(n_requests))
+    lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection(host, port, timeout=120)
+        while True:
+            with lock:
+                index = next(next_index, None)
+            if index is None:
+                break
+            start = time.perf_counter()
+            try:
+                connection.request('POST', f'/{endpoint}', body=bodies[index], headers={'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failures.append(response.status)
+            except OSError as error:
+                failures.append(repr(error))
+                connection = http.client.HTTPConnection(host, port, timeout=120)
+            latencies[index] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return elapsed, [latency for latency in latencies if latency is not None], failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="server to test (default: start one on a free localhost port)")
+    parser.add_argument('--endpoint', choices=('evaluate', 'batch', 'report'), default='evaluate')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--distinct', type=int, default=0, help="different scenarios sent (0 = every request unique)")
+    parser.add_argument('--batch-size', type=int, default=100, help="scenarios per /batch request")
+    parser.add_argument('--workers', type=int, default=0, help="model processes of a started server")
+    parser.add_argument('--warmup', type=int, default=20, help="requests sent before timing (worker start-up)")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        server = start_server(port, args.workers)
+    try:
+        if args.warmup:
+            # Warm-up scenarios outside the timed ones, so those still miss the cache
+            run(host, port, args.endpoint, args.warmup, min(args.concurrency, args.warmup), 0, 1, first=10 ** 9)
+        elapsed, latencies, failures = run(host, port, args.endpoint, args.requests, args.concurrency,
+                                           args.distinct, args.batch_size)
+        connection = http.client.HTTPConnection(host, port, timeout=10)
+        connection.request('GET', '/health')
+        health = json.loads(connection.getresponse().read())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(f"{args.requests} x /{args.endpoint}, concurrency {args.concurrency}, "
+          f"{'all distinct' if args.distinct == 0 else f'{args.distinct} distinct'}")
+    print(f"  requests/s   {len(latencies) / elapsed:,.1f}")
+    print(f"  p50          {quantiles[49] * 1000:.1f} ms")
+    print(f"  p90          {quantiles[89] * 1000:.1f} ms")
+    print(f"  p99          {quantiles[98] * 1000:.1f} ms")
+    print(f"  failures     {len(failures)}")
+    print(f"  server       {health}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
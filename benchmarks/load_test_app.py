@@ -0,0 +1,300 @@
+"""Load test for the Streamlit app (solar_fin_v01.py) with concurrent headless sessions.
+
+    python benchmarks/load_test_app.py                         # starts a server, 8 sessions x 3 submissions
+    python benchmarks/load_test_app.py --sessions 32 --submissions 5 --think 1
+    python benchmarks/load_test_app.py --url http://127.0.0.1:8501   # an already running server
+
+Each session is a thread speaking Streamlit's websocket protocol, as a
+browser tab does: it loads the page, then submits the form with its own
+tariff (so results are not shared between sessions) and downloads the files
+behind the download buttons of the results. Prints throughput and
+p50/p90/p99 latency of page loads and submissions. A server started here
+also reports its memory (RSS) before, at the peak, with every session still
+open and after they disconnect, the growth per session, and the files left
+in its temporary directory and working directory.
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from urllib.parse import urljoin, urlsplit
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from websockets.sync.client import connect
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, 'solar_fin_v01.py')
+STORE_NAME = 'load_test.sqlite'
+# ScriptFinishedStatus of a fragment run, which does not end the page run being waited for
+FRAGMENT_FINISHED = 3
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, work_dir):
+    # Temporary files go to work_dir/tmp and relative paths to work_dir, where they can be counted
+    temp_dir = os.path.join(work_dir, 'tmp')
+    os.makedirs(temp_dir)
+    env = dict(os.environ, TMPDIR=temp_dir, SOLAR_FIN_STORE=os.path.join(work_dir, STORE_NAME))
+    command = [sys.executable, '-m', 'streamlit', 'run', APP_PATH, '--server.headless', 'true', '--server.port', str(port),
+               '--browser.gatherUsageStats', 'false']
+    server = subprocess.Popen(command, cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("The Streamlit server did not start")
+
+
+def rss_mb(pid):
+    # Resident memory of a process from /proc (Linux); None elsewhere
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def files_in(directory, ignore=()):
+    found = set()
+    for root, _, names in os.walk(directory):
+        found.update(os.path.relpath(os.path.join(root, name), directory) for name in names)
+    return {name for name in found if not name.startswith(ignore)}
+
+
+class Session:
+    """One browser tab: a websocket to the app and the widget ids seen on the page."""
+
+    def __init__(self, base_url, socket):
+        self.base_url = base_url
+        self.socket = socket
+        self.widgets = {}
+        self.downloads = []
+
+    def run(self, widget_states=()):
+        """Rerun the script with `widget_states` and wait for it to finish.
+
+        Returns (seconds, bytes received, exceptions shown on the page).
+        """
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        message.rerun_script.widget_states.widgets.extend(widget_states)
+        start = time.perf_counter()
+        self.socket.send(message.SerializeToString())
+        self.downloads = []
+        received = exceptions = 0
+        while True:
+            data = self.socket.recv()
+            received += len(data)
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+            kind = forward.WhichOneof('type')
+            if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                element_type = element.WhichOneof('type')
+                widget = getattr(element, element_type)
+                if element_type == 'exception':
+                    exceptions += 1
+                elif element_type == 'download_button' and widget.url:
+                    self.downloads.append(widget.url)
+                elif getattr(widget, 'id', ''):
+                    self.widgets[widget.id] = widget
+            elif kind == 'script_finished' and forward.script_finished != FRAGMENT_FINISHED:
+                return time.perf_counter() - start, received, exceptions
+
+    def widget_id(self, key=None, label=None):
+        # Widget ids end with the widget's key
+        for widget_id, widget in self.widgets.items():
+            if (key is not None and widget_id.endswith(f'-{key}')) or (label is not None and getattr(widget, 'label', None) == label):
+                return widget_id
+        raise KeyError(key or label)
+
+    def submit(self, inputs):
+        # The form's values travel with the submit click, as from the browser
+        states = []
+        for key, value in inputs.items():
+            state = BackMsg().rerun_script.widget_states.widgets.add()
+            state.id = self.widget_id(key=key)
+            state.double_value = value
+            states.append(state)
+        trigger = BackMsg().rerun_script.widget_states.widgets.add()
+        trigger.id = self.widget_id(label='Calculate')
+        trigger.trigger_value = True
+        return self.run(states + [trigger])
+
+    def download(self):
+        # Bytes fetched from the download buttons of the last run
+        total = 0
+        for url in self.downloads:
+            with urllib.request.urlopen(urljoin(self.base_url, url), timeout=120) as response:
+                total += len(response.read())
+        return total
+
+
+def stream_url(base_url):
+    parts = urlsplit(base_url)
+    scheme = 'wss' if parts.scheme == 'https' else 'ws'
+    return f'{scheme}://{parts.netloc}{parts.path.rstrip("/")}/_stcore/stream'
+
+
+def run(base_url, sessions, submissions, think, first=0, while_open=None):
+    """Run the sessions; `while_open` is called once all of them are done but still connected."""
+    loads, submits, downloads, failures = [], [], [], []
+    received = [0]
+    lock = threading.Lock()
+    done = threading.Barrier(sessions + 1)
+    release = threading.Event()
+
+    def user(index):
+        try:
+            with connect(stream_url(base_url), subprotocols=['streamlit'], max_size=None) as socket:
+                work(index, Session(base_url, socket))
+                done.wait()
+                release.wait()
+        except threading.BrokenBarrierError:
+            pass
+        except Exception as error:
+            with lock:
+                failures.append(f"session {index}: {error!r}")
+            done.abort()
+
+    def work(index, session):
+        seconds, size, exceptions = session.run()
+        with lock:
+            loads.append(seconds)
+            received[0] += size
+        for submission in range(submissions):
+            # A tariff of its own for every submission, so no two share a saved result
+            tariff = round(0.05 + ((first + index) * submissions + submission) * 1e-6, 6)
+            seconds, size, exceptions = session.submit({'electricity_cost': tariff})
+            start = time.perf_counter()
+            size += session.download()
+            with lock:
+                submits.append(seconds)
+                downloads.append(time.perf_counter() - start)
+                received[0] += size
+                if exceptions:
+                    failures.append(f"session {index}: {exceptions} exception(s) on the page")
+            time.sleep(think)
+
+    threads = [threading.Thread(target=user, args=(index,)) for index in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        done.wait()
+    except threading.BrokenBarrierError:
+        pass
+    elapsed = time.perf_counter() - start
+    if while_open is not None and not failures:
+        while_open()
+    release.set()
+    for thread in threads:
+        thread.join()
+    return {'elapsed': elapsed, 'loads': loads, 'submits': submits, 'downloads': downloads,
+            'failures': failures, 'received': received[0]}
+
+
+def latency_line(name, seconds):
+    if not seconds:
+        return f"  {name:<13}none"
+    quantiles = statistics.quantiles(seconds, n=100) if len(seconds) > 1 else seconds * 99
+    return (f"  {name:<13}p50 {quantiles[49] * 1000:,.0f} ms   p90 {quantiles[89] * 1000:,.0f} ms   "
+            f"p99 {quantiles[98] * 1000:,.0f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="server to test (default: start one on a free localhost port)")
+    parser.add_argument('--sessions', type=int, default=8, help="concurrent browser sessions")
+    parser.add_argument('--submissions', type=int, default=3, help="form submissions per session")
+    parser.add_argument('--think', type=float, default=0.0, help="seconds between a session's submissions")
+    parser.add_argument('--warmup', type=int, default=1, help="sessions run before timing (imports, first charts)")
+    parser.add_argument('--settle', type=float, default=5.0, help="seconds to wait after disconnecting before the last RSS reading")
+    args = parser.parse_args(argv)
+
+    server = work_dir = None
+    if args.url:
+        base_url = args.url.rstrip('/') + '/'
+    else:
+        port = free_port()
+        work_dir = tempfile.mkdtemp(prefix='solar_fin_load_')
+        server = start_server(port, work_dir)
+        base_url = f'http://127.0.0.1:{port}/'
+
+    memory = {}
+    peak = [0.0]
+    sampling = threading.Event()
+
+    def sample():
+        while not sampling.wait(0.1):
+            peak[0] = max(peak[0], rss_mb(server.pid) or 0.0)
+
+    try:
+        if args.warmup:
+            # Warm-up tariffs are outside the timed ones
+            run(base_url, args.warmup, 1, 0.0, first=10 ** 6)
+        if server is not None:
+            time.sleep(1)
+            memory['before'] = rss_mb(server.pid)
+            before_files = (files_in(os.path.join(work_dir, 'tmp')), files_in(work_dir, ignore=('tmp', STORE_NAME)))
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+        results = run(base_url, args.sessions, args.submissions, args.think,
+                      while_open=lambda: memory.update(open=rss_mb(server.pid)) if server is not None else None)
+        if server is not None:
+            time.sleep(args.settle)
+            sampling.set()
+            memory['closed'] = rss_mb(server.pid)
+            memory['peak'] = peak[0]
+            temp_files = files_in(os.path.join(work_dir, 'tmp')) - before_files[0]
+            work_files = files_in(work_dir, ignore=('tmp', STORE_NAME)) - before_files[1]
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    submitted = len(results['submits'])
+    print(f"{args.sessions} sessions x {args.submissions} submissions, think time {args.think:g} s")
+    print(f"  submissions  {submitted} in {results['elapsed']:.1f} s = {submitted / results['elapsed']:.2f}/s")
+    print(latency_line('page load', results['loads']))
+    print(latency_line('submission', results['submits']))
+    print(latency_line('downloads', results['downloads']))
+    print(f"  received     {results['received'] / 1e6:,.1f} MB")
+    print(f"  failures     {len(results['failures'])}")
+    for failure in results['failures'][:10]:
+        print(f"    {failure}")
+    if server is not None and None not in (memory.get('before'), memory.get('open')):
+        print(f"  server RSS   {memory['before']:,.0f} MB before, {memory['peak']:,.0f} MB peak, "
+              f"{memory['open']:,.0f} MB with sessions open, {memory['closed']:,.0f} MB {args.settle:g} s after disconnecting")
+        print(f"  per session  {(memory['open'] - memory['before']) / args.sessions:,.1f} MB while open, "
+              f"{(memory['closed'] - memory['before']) / args.sessions:,.1f} MB after disconnecting")
+    if server is not None:
+        print(f"  temp files   {len(temp_files)} left in TMPDIR{': ' + ', '.join(sorted(temp_files)[:5]) if temp_files else ''}")
+        print(f"  work files   {len(work_files)} left in the working directory"
+              f"{': ' + ', '.join(sorted(work_files)[:5]) if work_files else ''}")
+    return 1 if results['failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,499 @@
+"""Benchmarks for the cash-flow model, charts, results table and PDF report.
+
+    python benchmarks/run_benchmarks.py            # full suite
+    python benchmarks/run_benchmarks.py --quick    # skip the 1M-project batch
+    python benchmarks/run_benchmarks.py -k chart   # only names containing "chart"
+
+Every run appends one JSON record to benchmarks/history.jsonl. The fastest
+round of each benchmark is compared with the previous record from the same
+machine, and anything slower by more than --threshold is reported as a
+regression (exit status 1).
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import matplotlib
+matplotlib.use('Agg')
+
+import numpy as np
+import numpy_financial as npf
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from solar_fin import (battery, capex_events, environment, escalation, live, metering, model, portfolio, report,  # noqa: E402
+                       scenario_files, store, sweeps, workbook)
+from solar_fin.results import ProjectResult  # noqa: E402
+from solar_fin.graph import model_graph  # noqa: E402
+
+HISTORY_PATH = os.path.join(REPO_ROOT, 'benchmarks', 'history.jsonl')
+BATCH_CHUNK = 100_000
+
+# Default values of the Streamlit form
+DEFAULT_INPUTS = {
+    'initial_investment': 1.0,
+    'project_capacity': 1.0,
+    'o_and_m_cost': 10.0,
+    'electricity_cost': 0.1,
+    'project_life': 25,
+    'energy_generation_first_year': 1500.0,
+    'yearly_degradation': 0.5,
+    'o_and_m_escalation': 2.0,
+    'electricity_tariff_escalation': 2.0,
+    'escalation_years': 1,
+    'discount_rate': 0.05,
+}
+
+BENCHMARKS = []
+
+
+def benchmark(name, items=1, slow=False):
+    # Register `setup`, which returns the zero-argument callable to time
+    def register(setup):
+        BENCHMARKS.append({'name': name, 'setup': setup, 'items': items, 'slow': slow})
+        return setup
+    return register
+
+
+def random_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    capacity = rng.uniform(1, 1000, n)
+    return dict(
+        DEFAULT_INPUTS,
+        initial_investment=rng.uniform(0.3, 1.5, n),
+        project_capacity=capacity,
+        electricity_cost=rng.uniform(0.05, 0.3, n),
+        energy_generation_first_year=capacity * rng.uniform(900, 1800, n),
+        discount_rate=rng.uniform(0.02, 0.12, n),
+    )
+
+
+def project_nodes(inputs=DEFAULT_INPUTS):
+    # Single-project intermediate results, as the app's calculation graph produces them
+    graph = model_graph()
+    graph.begin_run()
+    graph_inputs = dict(model.broadcast_inputs(inputs), grid_region='Default (EPA)', grid_decarbonization=True,
+                        start_year=datetime.now().year)
+    return {name: graph.compute(name, graph_inputs) for name in graph.nodes}
+
+
+def project_result(inputs=DEFAULT_INPUTS):
+    merged = {}
+    for outputs in project_nodes(inputs).values():
+        merged.update(outputs)
+    return ProjectResult.from_results(merged)
+
+
+@benchmark('model.single_project')
+def bench_single_project():
+    return lambda: model.evaluate(DEFAULT_INPUTS)
+
+
+@benchmark('model.irr_numpy_financial')
+def bench_irr_numpy_financial():
+    cash_flows = model.evaluate(DEFAULT_INPUTS)['cash_flows'][0]
+    return lambda: npf.irr(cash_flows)
+
+
+@benchmark('model.irr_vectorized')
+def bench_irr_vectorized():
+    cash_flows = model.evaluate(DEFAULT_INPUTS)['cash_flows']
+    # Leading zero years leave the IRR unchanged (no false root where discounting alone zeroes the NPV)
+    loss = model.evaluate(dict(DEFAULT_INPUTS, electricity_cost=0.02))['cash_flows']
+    assert np.allclose(model.irr(np.hstack([np.zeros((1, 10)), loss])), npf.irr(loss[0]))
+    return lambda: model.irr(cash_flows)
+
+
+def _batch(n):
+    def setup():
+        chunks = [random_inputs(min(BATCH_CHUNK, n - start), seed=start) for start in range(0, n, BATCH_CHUNK)]
+        return lambda: [model.evaluate(chunk)['npv'] for chunk in chunks]
+    return setup
+
+
+benchmark('model.batch_1k', items=1_000)(_batch(1_000))
+benchmark('model.batch_100k', items=100_000)(_batch(100_000))
+benchmark('model.batch_1m', items=1_000_000, slow=True)(_batch(1_000_000))
+
+
+@benchmark('model.batch_100k_cpi_index', items=100_000)
+def bench_batch_cpi_index():
+    # Every project shares one cached CPI-indexed tariff and O&M vector
+    index = escalation.multipliers(escalation.capped(escalation.cpi([4.0, 3.5, 3.0]), cap=3.5, floor=0.0), 25)[None, :]
+    chunks = [dict(random_inputs(BATCH_CHUNK, seed=start), tariff_index=index, o_and_m_index=index)
+              for start in range(0, 100_000, BATCH_CHUNK)]
+    return lambda: [model.evaluate(chunk)['npv'] for chunk in chunks]
+
+
+@benchmark('model.batch_100k_capex_events', items=100_000)
+def bench_batch_capex_events():
+    # Two inverter replacements for every project, plus an uncertain decommissioning cost
+    events = capex_events.event_table([capex_events.event(10, 120.0, 2.0), capex_events.event(20, 100.0, 2.0),
+                                       capex_events.event(25, 40.0, probability=0.5)])
+    chunks = [dict(random_inputs(BATCH_CHUNK, seed=start), capex_events=events) for start in range(0, 100_000, BATCH_CHUNK)]
+    return lambda: [model.evaluate(chunk)['npv'] for chunk in chunks]
+
+
+@benchmark('battery.dispatch_25_years')
+def bench_battery_dispatch():
+    # 25 x 8760 hourly steps for one project (compiled with numba when installed)
+    generation = model.evaluate(DEFAULT_INPUTS)['generation']
+    storage = battery.battery(2.0, 1.0)
+    battery.simulate(generation, storage)  # compile outside the timing
+    return lambda: battery.simulate(generation, storage)
+
+
+@benchmark('battery.dispatch_1k_projects', items=1_000, slow=True)
+def bench_battery_dispatch_batch():
+    generation = model.evaluate(random_inputs(1_000))['generation']
+    storage = battery.battery(np.linspace(100, 2000, 1_000), 500.0)
+    return lambda: battery.simulate(generation, storage)
+
+
+@benchmark('metering.500_customers', items=500)
+def bench_metering_customers():
+    # Every customer has their own hourly load; curves are cached after the first run
+    rng = np.random.default_rng(0)
+    loads = rng.uniform(0.05, 0.4, (500, 8760)) * rng.uniform(0.5, 3.0, (500, 1))
+    inputs = dict(random_inputs(500), energy_generation_first_year=1500 * rng.uniform(0.5, 3.0, 500),
+                  metering=metering.net_metering(loads, 0.04, 'annual'))
+    return lambda: model.evaluate(inputs)['npv']
+
+
+@benchmark('metering.battery_100_customers', items=100)
+def bench_metering_battery():
+    # Batteries dispatched against each customer's load: what they serve on site never exceeds the load
+    rng = np.random.default_rng(0)
+    loads = rng.uniform(0.05, 0.4, (100, 8760)) * rng.uniform(0.5, 3.0, (100, 1))
+    inputs = dict(random_inputs(100), energy_generation_first_year=1500 * rng.uniform(0.5, 3.0, 100),
+                  metering=metering.net_metering(loads, 0.04, 'annual'), battery=battery.battery(5.0, 2.5))
+    model.evaluate(inputs)  # compile outside the timing
+    oversized = dict(DEFAULT_INPUTS, project_life=1, metering=metering.net_metering(np.full(8760, 5.0), 0.0),
+                     battery=battery.battery(500.0, 100.0))
+    assert model.evaluate(oversized)['gross_revenue'][0, 0] <= 5.0 * 8760 * DEFAULT_INPUTS['electricity_cost']
+    return lambda: model.evaluate(inputs)['npv']
+
+
+@benchmark('sweeps.grid_200k', items=200_000)
+def bench_sweep_grid():
+    # 50 sites x 40 tariffs x 20 capex x 5 discount rates, reduced shard by shard in this process
+    rng = np.random.default_rng(0)
+    sites = {'project_capacity': rng.uniform(1, 1000, 50), 'energy_generation_first_year': rng.uniform(900, 1800, 50) * 500}
+    spec = sweeps.grid(DEFAULT_INPUTS, {'site': sites, 'electricity_cost': np.linspace(0.05, 0.3, 40),
+                                        'initial_investment': np.linspace(0.4, 1.2, 20), 'discount_rate': np.linspace(0.03, 0.1, 5)})
+    return lambda: sweeps.run(spec, 'local')
+
+
+def mixed_scenario_file(n):
+    # A hand-written file: the optional fields are set in some records and left out of the others
+    records = []
+    for i in range(n):
+        record = dict(DEFAULT_INPUTS, scenario_name=f"Scenario {i}")
+        if i % 3 == 1:
+            record['currency_code'] = 'EUR'
+        elif i % 3 == 2:
+            record.update(grid_region='India', grid_decarbonization=False)
+        records.append(record)
+    return json.dumps({'schema': scenario_files.SCHEMA, 'version': scenario_files.SCHEMA_VERSION, 'scenarios': records})
+
+
+@benchmark('scenario_files.round_trip_1k', items=1_000)
+def bench_scenario_round_trip():
+    # JSON in, Parquet out and back; checked once before timing
+    document = mixed_scenario_file(1_000)
+
+    def round_trip():
+        frame = scenario_files.from_json(document)
+        return frame, scenario_files.from_parquet(scenario_files.to_parquet(frame))
+
+    frame, reloaded = round_trip()
+    valid, errors = scenario_files.validate(frame)
+    assert valid.all(), errors.head().to_string()
+    assert (frame['currency_code'].iloc[:3].tolist(), frame['grid_decarbonization'].iloc[:3].tolist()) == (['USD', 'EUR', 'USD'], [True, True, False])
+    pd.testing.assert_frame_equal(frame, reloaded, check_dtype=False)
+    return round_trip
+
+
+@benchmark('live.headline_model')
+def bench_live_headline():
+    return lambda: live.headline(DEFAULT_INPUTS)
+
+
+@benchmark('live.surrogate_estimate')
+def bench_live_surrogate():
+    live.surrogate(live.surrogate_point(DEFAULT_INPUTS)[0])  # build the grid outside the timing
+    return lambda: live.estimate(DEFAULT_INPUTS)
+
+
+@benchmark('live.surrogate_build')
+def bench_live_surrogate_build():
+    fixed = live.surrogate_point(DEFAULT_INPUTS)[0]
+    return lambda: live.Surrogate(fixed)
+
+
+@benchmark('chart.generation')
+def bench_generation_chart():
+    result = project_result()
+    return lambda: report.generation_chart(result.yearly)
+
+
+@benchmark('chart.cash_flow')
+def bench_cash_flow_chart():
+    result = project_result()
+    return lambda: report.cash_flow_chart(result.yearly, result.payback_period, '$')
+
+
+@benchmark('chart.revenue')
+def bench_revenue_chart():
+    result = project_result()
+    return lambda: report.revenue_chart(result.yearly, '$')
+
+
+def project_yearly(project_life=25):
+    return project_result(dict(DEFAULT_INPUTS, project_life=project_life)).yearly
+
+
+def styler_html(yearly, currency_symbol):
+    # The pandas Styler rendering the app used before the table template, kept as a reference point
+    columns = report.cash_flow_columns(currency_symbol)
+    df = pd.DataFrame({label: yearly[field] for label, field, _ in columns})
+    formats = {label: '{' + ':' + number_format[1:] + '}' for label, _, number_format in columns}
+    return df.style.format(formats).set_table_styles(
+        [{'selector': 'td', 'props': [('text-align', 'center')]},
+         {'selector': 'th', 'props': [('text-align', 'center')]}]
+    ).to_html(index=False)
+
+
+@benchmark('table.html')
+def bench_table_html():
+    yearly = project_yearly()
+    return lambda: report.cash_flow_table_html(yearly, '$')
+
+
+@benchmark('table.html_5000_rows')
+def bench_table_html_long():
+    yearly = project_yearly(5000)
+    return lambda: report.cash_flow_table_html(yearly, '$')
+
+
+@benchmark('table.styler_reference')
+def bench_table_styler():
+    yearly = project_yearly()
+    return lambda: styler_html(yearly, '$')
+
+
+@benchmark('table.styler_reference_5000_rows', slow=True)
+def bench_table_styler_long():
+    yearly = project_yearly(5000)
+    return lambda: styler_html(yearly, '$')
+
+
+def report_arguments(result, options=None):
+    return dict(
+        {name: value for name, value in DEFAULT_INPUTS.items() if name != 'escalation_years'},
+        result=result,
+        chart_images=report.report_charts(result, '$', options),
+        currency_symbol='$',
+        client_name='Benchmark Client',
+        project_name='Benchmark Project',
+        options=options,
+    )
+
+
+@benchmark('report.pdf')
+def bench_pdf_report():
+    arguments = report_arguments(project_result())
+    return lambda: report.generate_pdf_report(None, **arguments)
+
+
+def _pdf_report(quality):
+    # Charts rendered for the preset, as the API does; the size is printed with the timing
+    def setup():
+        arguments = report_arguments(project_result(), report.pdf_options(quality))
+        print(f"  report.pdf_{quality}: {len(report.generate_pdf_report(None, **arguments).getvalue()) / 1024:.1f} KB")
+        return lambda: report.generate_pdf_report(None, **arguments)
+    return setup
+
+
+for quality in ('compact', 'vector', 'draft'):
+    benchmark(f'report.pdf_{quality}')(_pdf_report(quality))
+
+
+@benchmark('workbook.project')
+def bench_project_workbook():
+    result = project_result()
+    return lambda: workbook.project_workbook(result, DEFAULT_INPUTS['discount_rate'], '$')
+
+
+@benchmark('workbook.portfolio_1k', items=1_000, slow=True)
+def bench_portfolio_workbook():
+    # Written to a BytesIO; rows stream through xlsxwriter's temporary files
+    inputs = random_inputs(1_000)
+    return lambda: workbook.portfolio_workbook(inputs, currency_symbol='$')
+
+
+def _portfolio_batch(n, seed=0):
+    # Projects of varying life over several regions, clients and start years
+    rng = np.random.default_rng(seed)
+    inputs = dict(random_inputs(n, seed), project_life=rng.integers(15, 31, n))
+    regions = np.array(list(environment.GRID_EMISSION_FACTORS))[rng.integers(0, 3, n)]
+    clients = [f"Client {i}" for i in rng.integers(0, 50, n)]
+    return model.evaluate(inputs), rng.integers(2020, 2031, n), regions, clients
+
+
+@benchmark('portfolio.build_10k', items=10_000)
+def bench_portfolio_build():
+    results, start_years, regions, clients = _portfolio_batch(10_000)
+    # A group starting after the first calendar year keeps its project's own IRR (a loss here), not a
+    # false root at huge rates from its leading zero years
+    losses = model.evaluate(dict(DEFAULT_INPUTS, electricity_cost=np.array([0.02, 0.025])))
+    pair = portfolio.Portfolio()
+    pair.add_evaluated(['a', 'b'], losses, [2020, 2030], environment.DEFAULT_REGION, ['A', 'B'])
+    assert np.allclose(pair.irr('client').to_numpy(), losses['irr'] * 100) and (losses['irr'] < 0).all()
+
+    def build():
+        rollup = portfolio.Portfolio()
+        rollup.add_evaluated(range(10_000), results, start_years, regions, clients)
+        return rollup.summary('client')
+    return build
+
+
+@benchmark('portfolio.add_one_to_10k')
+def bench_portfolio_add_one():
+    # One project replaced in a 10k portfolio: its old rows come out of the sums and the new ones go in
+    results, start_years, regions, clients = _portfolio_batch(10_000)
+    rollup = portfolio.Portfolio()
+    rollup.add_evaluated(range(10_000), results, start_years, regions, clients)
+    one = _portfolio_batch(1, seed=1)
+
+    def add_one():
+        rollup.add_evaluated([0], *one)
+        return rollup.summary('client')
+    return add_one
+
+
+@benchmark('store.find_prefix_10k')
+def bench_store_find():
+    # Client prefix lookups among 10k saved proposals: case-insensitive, literal and served by the index
+    path = os.path.join(tempfile.mkdtemp(), 'find.sqlite')
+    results = store.ResultStore(path)
+    clients = ['Acme', 'ACME Solar', 'Ac%me', 'Bright', 'bright homes']
+    with sqlite3.connect(path) as db:
+        db.executemany('INSERT INTO proposals VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       [(f'k{i}', clients[i % 5], f'Project {i}', f'2026-01-01 00:{i // 600:02d}:{i // 10 % 60:02d}',
+                         '{}', '{"npv": 1.0}', b'') for i in range(10_000)])
+    assert {row[1] for row in results.find(client='acme', limit=10_000)} == {'Acme', 'ACME Solar'}
+    assert {row[1] for row in results.find(client='Ac%', limit=10_000)} == {'Ac%me'}
+    return lambda: results.find(client='bright', limit=100)
+
+
+def measure(function, repeat, min_time):
+    # Median wall time per call; short calls are looped until a round takes `min_time`
+    function()  # warm-up
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10
+    rounds = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        rounds.append((time.perf_counter() - start) / loops)
+    return {'median': statistics.median(rounds), 'min': min(rounds), 'rounds': len(rounds), 'loops': loops}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine_id():
+    return f"{platform.node()}/{platform.machine()}/{platform.python_version()}"
+
+
+def previous_record(path, machine):
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path) as history:
+        for line in history:
+            record = json.loads(line)
+            if record.get('machine') == machine:
+                previous = record
+    return previous
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='select', help='only run benchmarks whose name contains this string')
+    parser.add_argument('--quick', action='store_true', help='skip the slow benchmarks')
+    parser.add_argument('--repeat', type=int, default=5, help='timed rounds per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per round')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio reported as a regression')
+    parser.add_argument('--history', default=HISTORY_PATH, help='JSON-lines file the results are appended to')
+    parser.add_argument('--no-save', action='store_true', help='do not append this run to the history')
+    args = parser.parse_args(argv)
+
+    machine = machine_id()
+    previous = previous_record(args.history, machine)
+    results = {}
+    regressions = []
+    for bench in BENCHMARKS:
+        if args.select and args.select not in bench['name']:
+            continue
+        if args.quick and bench['slow']:
+            continue
+        timing = measure(bench['setup'](), args.repeat, args.min_time)
+        timing['items_per_second'] = bench['items'] / timing['median']
+        results[bench['name']] = timing
+
+        line = f"{bench['name']:<28} {timing['median'] * 1000:>10.3f} ms"
+        if bench['items'] > 1:
+            line += f"  {timing['items_per_second']:>14,.0f} projects/s"
+        before = (previous or {}).get('results', {}).get(bench['name'])
+        if before:
+            ratio = timing['min'] / before['min']
+            line += f"  x{ratio:.2f} vs {previous.get('commit')}"
+            if ratio > args.threshold:
+                regressions.append(bench['name'])
+                line += '  REGRESSION'
+        print(line)
+
+    if not args.no_save:
+        record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'machine': machine,
+            'numpy': np.__version__,
+            'results': results,
+        }
+        with open(args.history, 'a') as history:
+            history.write(json.dumps(record) + '\n')
+
+    if regressions:
+        print(f"Regressions over x{args.threshold}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,4 +8,7 @@ echo "\
 headless = true\n\
 enableCORS=false\n\
 port = $PORT\n\
+\n\
+[global]\n\
+minCachedMessageSize = 4000\n\
 " > ~/.streamlit/config.toml
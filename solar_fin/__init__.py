@@ -0,0 +1 @@
+"""Calculation modules behind the Solar PV System Financial Calculator app."""
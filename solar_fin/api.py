@@ -0,0 +1,394 @@
+"""HTTP API for the calculator, for CRMs and other services.
+
+    python -m solar_fin.api --port 8000        # or: uvicorn solar_fin.api:app
+
+Endpoints (JSON bodies are scenario records, the same fields as scenario
+files; see solar_fin.scenario_files):
+
+    GET  /health
+    POST /evaluate   one scenario -> metrics and per-year series
+    POST /batch      {"scenarios": [...]} -> metrics per scenario, with row errors
+    POST /report     one scenario (+ optional currency_symbol, pdf_quality) -> PDF
+
+The handlers run on asyncio; the model, charts and PDF run in a process
+pool. Single evaluations that arrive within a few milliseconds of each
+other are coalesced into one batch call (a request that breaks the batch is
+answered alone), identical requests in flight share one computation, and
+finished responses are kept in an LRU cache keyed by the request's hash.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from solar_fin import environment, model, payback, report, scenario_files
+from solar_fin.results import ProjectResult, YEARLY_DTYPE, yearly_array
+from solar_fin.store import proposal_key
+
+WORKERS = int(os.environ.get('SOLAR_FIN_API_WORKERS', 0)) or None
+CACHE_SIZE = int(os.environ.get('SOLAR_FIN_API_CACHE', 4096))
+COALESCE_WINDOW = float(os.environ.get('SOLAR_FIN_API_COALESCE_MS', 5)) / 1000
+MAX_COALESCED = 512
+MAX_BATCH = int(os.environ.get('SOLAR_FIN_API_MAX_BATCH', 100_000))
+BATCH_CHUNK = 20_000
+BATCH_METRICS = ('npv', 'irr', 'lcoe', 'payback_period', 'discounted_payback_period', 'total_revenue', 'annual_average_roi')
+
+
+class BadRequest(ValueError):
+    """The request body cannot be used; answered with 400 and the message."""
+
+
+# Worker functions: run in the process pool and return JSON-ready values
+
+def _number(value):
+    # JSON has no NaN or infinity: no IRR and no payback become null
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _frame(records):
+    try:
+        frame = scenario_files.normalize(pd.DataFrame.from_records(records))
+    except scenario_files.ScenarioFileError as error:
+        raise BadRequest(str(error)) from None
+    return frame, *scenario_files.validate(frame)
+
+
+def _errors(errors, rows):
+    by_row = {row: [] for row in rows}
+    for row, field, message in errors.itertuples(index=False):
+        by_row[row].append({'field': field, 'message': message})
+    return by_row
+
+
+def _emission_factors(frame, years):
+    start_year = datetime.now().year
+    return np.stack([environment.emission_factor_curve(region, start_year, years, bool(decarbonize))
+                     for region, decarbonize in zip(frame['grid_region'], frame['grid_decarbonization'])])
+
+
+def _project(results, row):
+    result = ProjectResult.from_results(results, row)
+    return {
+        'metrics': {name: _number(getattr(result, name)) for name in ProjectResult.__slots__[1:]},
+        'payback': payback.describe(result.payback_period),
+        'discounted_payback': payback.describe(result.discounted_payback_period),
+        'yearly': {name: result.yearly[name].tolist() for name in YEARLY_DTYPE.names},
+    }
+
+
+def evaluate_scenarios(records):
+    """One response per scenario record: {'result': ...}, {'errors': [...]} or {'bad_request': message}."""
+    try:
+        frame, valid, errors = _frame(records)
+    except BadRequest:
+        if len(records) == 1:
+            raise
+        # A record the batch cannot hold is answered alone; the rest still go out together
+        bad = {}
+        for i, record in enumerate(records):
+            try:
+                _frame([record])
+            except BadRequest as error:
+                bad[i] = {'bad_request': str(error)}
+        if not bad:
+            raise
+        rest = [record for i, record in enumerate(records) if i not in bad]
+        responses = iter(evaluate_scenarios(rest) if rest else ())
+        return [bad[i] if i in bad else next(responses) for i in range(len(records))]
+    responses = [{'errors': found} for found in _errors(errors, range(len(frame))).values()]
+    rows = np.flatnonzero(valid)
+    if len(rows):
+        scenarios = frame.iloc[rows]
+        inputs = scenario_files.batch_inputs(scenarios)
+        results = model.evaluate(inputs, emission_factors=_emission_factors(scenarios, int(inputs['project_life'].max())))
+        for position, row in enumerate(rows):
+            responses[row] = {'result': _project(results, position)}
+    return responses
+
+
+def evaluate_batch(records, offset=0):
+    # Headline metrics of many scenarios, column by column
+    frame, valid, errors = _frame(records)
+    metrics = {name: [None] * len(frame) for name in BATCH_METRICS}
+    rows = np.flatnonzero(valid)
+    if len(rows):
+        results = model.evaluate(scenario_files.batch_inputs(frame.iloc[rows]))
+        results['irr'] = results['irr'] * 100
+        for name in BATCH_METRICS:
+            column = metrics[name]
+            for row, value in zip(rows.tolist(), results[name].tolist()):
+                column[row] = value if np.isfinite(value) else None
+    errors = [{'row': int(row) + offset, 'field': field, 'message': message}
+              for row, field, message in errors.itertuples(index=False)]
+    return {'valid': valid.tolist(), 'errors': errors, 'metrics': metrics}
+
+
+def render_report(record, currency_symbol, quality='standard'):
+    """PDF bytes for one scenario record, built like the app's report (`quality` from report.PDF_QUALITIES)."""
+    frame, valid, errors = _frame([record])
+    if not valid[0]:
+        raise BadRequest('; '.join(f"{field}: {message}" for _, field, message in errors.itertuples(index=False)))
+    inputs = scenario_files.batch_inputs(frame)
+    results = model.evaluate(inputs, emission_factors=_emission_factors(frame, int(inputs['project_life'][0])))
+    result = ProjectResult.from_results(results, 0, yearly_array(results, 0))
+    scenario = frame.iloc[0]
+    if currency_symbol is None:
+        from forex_python.converter import CurrencyCodes
+        currency_symbol = CurrencyCodes().get_symbol(scenario['currency_code']) or ''
+    options = report.pdf_options(quality)
+    pdf_buffer = report.generate_pdf_report(
+        None,
+        result,
+        **{name: int(scenario[name]) if name in model.INTEGER_PARAMETERS else float(scenario[name])
+           for name in model.PARAMETERS if name != 'escalation_years'},
+        chart_images=report.report_charts(result, currency_symbol, options),
+        currency_symbol=currency_symbol,
+        **{name: scenario[name] for name in ('client_name', 'client_address', 'project_name', 'company_name',
+                                             'company_prepared_by', 'company_email')},
+        options=options,
+    )
+    return pdf_buffer.getvalue()
+
+
+# Event-loop side
+
+class ResultCache:
+    """LRU cache of finished responses; requests in flight for the same key share one future."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.items = OrderedDict()
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_compute(self, key, compute):
+        if key in self.items:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key]
+        if key not in self.in_flight:
+            self.misses += 1
+            self.in_flight[key] = asyncio.ensure_future(compute())
+        task = self.in_flight[key]
+        try:
+            value = await asyncio.shield(task)
+        finally:
+            if self.in_flight.get(key) is task and task.done():
+                del self.in_flight[key]
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+        return value
+
+
+class Coalescer:
+    """Collects single requests for up to `window` seconds (or `max_batch` of them) and runs them as one batch.
+
+    At most `slots` batches run at once; while they are all busy, new requests
+    keep collecting and go out together when one finishes, so batches grow
+    with the load instead of queueing one small batch after another.
+    """
+
+    def __init__(self, run_batch, window=COALESCE_WINDOW, max_batch=MAX_COALESCED, slots=None):
+        self.run_batch = run_batch  # coroutine function: list of payloads -> list of results
+        self.window = window
+        self.max_batch = max_batch
+        self.slots = slots
+        self.running = 0
+        self.pending = []
+        self.timer = None
+        self.batches = 0
+
+    async def submit(self, payload):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((payload, future))
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.pending and (self.slots is None or self.running < self.slots):
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            self.batches += 1
+            self.running += 1
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        try:
+            await self._settle(batch)
+        finally:
+            self.running -= 1
+            self._flush()
+
+    async def _settle(self, batch):
+        try:
+            results = await self.run_batch([payload for payload, _ in batch])
+        except Exception as error:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(error)
+                return
+            # Run the requests one at a time so only the one that fails gets the error
+            for item in batch:
+                await self._settle([item])
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class Service:
+    # Process pool, cache and coalescer shared by all requests of one server
+    def __init__(self, workers=WORKERS):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.executor = None
+        self.cache = ResultCache()
+        self.coalescer = Coalescer(self._evaluate_many, slots=self.workers)
+
+    def start(self):
+        # "spawn" keeps the workers free of the server's threads and event loop
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def _evaluate_many(self, records):
+        return await self.run(evaluate_scenarios, records)
+
+    async def evaluate(self, record):
+        return await self.cache.get_or_compute(('evaluate', proposal_key(record)), lambda: self.coalescer.submit(record))
+
+    async def batch(self, records):
+        async def compute():
+            chunks = [self.run(evaluate_batch, records[start:start + BATCH_CHUNK], start)
+                      for start in range(0, len(records), BATCH_CHUNK)]
+            parts = await asyncio.gather(*chunks)
+            return {
+                'count': len(records),
+                'valid': [flag for part in parts for flag in part['valid']],
+                'errors': [error for part in parts for error in part['errors']],
+                'metrics': {name: [value for part in parts for value in part['metrics'][name]] for name in BATCH_METRICS},
+            }
+        return await self.cache.get_or_compute(('batch', proposal_key({'scenarios': records})), compute)
+
+    async def report(self, record, currency_symbol, quality):
+        key = ('report', proposal_key(dict(record, currency_symbol=currency_symbol, pdf_quality=quality)))
+        return await self.cache.get_or_compute(key, lambda: self.run(render_report, record, currency_symbol, quality))
+
+
+async def _body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise BadRequest("The body must be JSON") from None
+    if not isinstance(body, dict):
+        raise BadRequest("The body must be a JSON object")
+    return body
+
+
+def _scenario(body):
+    missing = [name for name in model.PARAMETERS if name not in body]
+    if missing:
+        raise BadRequest(f"Missing required fields: {', '.join(missing)}")
+    return {name: body[name] for name in scenario_files.SCENARIO_FIELDS if name in body}
+
+
+def _bad_request(handler):
+    async def wrapper(request):
+        try:
+            return await handler(request)
+        except BadRequest as error:
+            return JSONResponse({'error': str(error)}, status_code=400)
+    return wrapper
+
+
+async def health(request):
+    service = request.app.state.service
+    return JSONResponse({'status': 'ok', 'workers': service.workers, 'cache_hits': service.cache.hits,
+                         'cache_misses': service.cache.misses, 'coalesced_batches': service.coalescer.batches})
+
+
+@_bad_request
+async def evaluate(request):
+    response = await request.app.state.service.evaluate(_scenario(await _body(request)))
+    if 'bad_request' in response:
+        raise BadRequest(response['bad_request'])
+    if 'errors' in response:
+        return JSONResponse({'errors': response['errors']}, status_code=422)
+    return JSONResponse(response['result'])
+
+
+@_bad_request
+async def batch(request):
+    scenarios = (await _body(request)).get('scenarios')
+    if not isinstance(scenarios, list) or not scenarios:
+        raise BadRequest("Expected a non-empty list of scenarios")
+    if len(scenarios) > MAX_BATCH:
+        raise BadRequest(f"At most {MAX_BATCH} scenarios per request")
+    if not all(isinstance(scenario, dict) for scenario in scenarios):
+        raise BadRequest("Every scenario must be a JSON object")
+    return JSONResponse(await request.app.state.service.batch([_scenario(scenario) for scenario in scenarios]))
+
+
+@_bad_request
+async def pdf_report(request):
+    body = await _body(request)
+    quality = body.get('pdf_quality', 'standard')
+    if quality not in report.PDF_QUALITIES:
+        raise BadRequest(f"pdf_quality must be one of {', '.join(report.PDF_QUALITIES)}")
+    pdf = await request.app.state.service.report(_scenario(body), body.get('currency_symbol'), quality)
+    return Response(pdf, media_type='application/pdf',
+                    headers={'Content-Disposition': 'attachment; filename="Solar_Report.pdf"'})
+
+
+def create_app(workers=WORKERS):
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.service.start()
+        yield
+        app.state.service.stop()
+
+    application = Starlette(routes=[
+        Route('/health', health),
+        Route('/evaluate', evaluate, methods=['POST']),
+        Route('/batch', batch, methods=['POST']),
+        Route('/report', pdf_report, methods=['POST']),
+    ], lifespan=lifespan)
+    application.state.service = Service(workers)
+    return application
+
+
+app = create_app()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the solar_fin HTTP API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=WORKERS, help="model processes (default: CPUs - 1)")
+    args = parser.parse_args()
+    import uvicorn
+    uvicorn.run(create_app(args.workers), host=args.host, port=args.port)
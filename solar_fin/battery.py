@@ -0,0 +1,244 @@
+"""Battery storage coupled to PV: time-of-use dispatch over hourly profiles.
+
+The battery charges from PV output in hours priced below the day's average
+tariff and discharges at full power in hours priced above it. The state of
+charge is sequential, so the dispatch runs as one loop over the hours of a
+year for every (project, year) row at once: compiled with numba when it is
+installed, otherwise as NumPy operations over the rows that skip idle hours.
+Capacity fades with equivalent full cycles; a first pass over year 1 gives
+the cycles per year, and a second pass dispatches every year with its faded
+capacity.
+
+The model takes the result as extra energy value: the arbitrage gain in kWh
+at the base tariff, which the revenue stage prices like generation. With a
+load profile, metered_flows() dispatches the battery against the customer's
+net load instead (it stores PV the load does not use and serves load PV
+does not cover), and solar_fin.metering credits what it serves on site.
+"""
+import functools
+
+import numpy as np
+
+from solar_fin import profiles
+
+# Battery settings that may differ per project; the profiles are shared
+PER_PROJECT = ('capacity', 'power', 'efficiency', 'fade_per_cycle', 'cost')
+
+
+def battery(capacity, power, efficiency=90.0, fade_per_cycle=0.004, cost=0.0, pv_profile=None, tariff_profile=None):
+    """Model input for a battery (scalars or one value per project).
+
+    capacity in kWh, power in kW, round-trip efficiency in %, capacity fade
+    in % per equivalent full cycle, cost per kWh of capacity (capex
+    currency). Profiles default to profiles.solar_profile() and a 17:00-22:00
+    time-of-use peak.
+    """
+    return {
+        'capacity': capacity,
+        'power': power,
+        'efficiency': efficiency,
+        'fade_per_cycle': fade_per_cycle,
+        'cost': cost,
+        'pv_profile': profiles.solar_profile() if pv_profile is None else profiles.normalized(pv_profile),
+        'tariff_profile': profiles.tou_profile() if tariff_profile is None else tariff_profile,
+    }
+
+
+def select(battery, start, stop, n):
+    # The battery settings of projects start..stop-1 of an n-project batch
+    return {name: value[start:stop] if name in PER_PROJECT and np.ndim(value) == 1 and len(value) == n else value
+            for name, value in battery.items()}
+
+
+def dispatch_hours(pv_profile, tariff_profile):
+    # Hours to charge from PV and hours to discharge, from each day's average price
+    days = np.asarray(tariff_profile).reshape(-1, 24)
+    average = days.mean(axis=1, keepdims=True)
+    charge = (days < average * (1 - 1e-9)).ravel() & (np.asarray(pv_profile) > 0)
+    discharge = (days > average * (1 + 1e-9)).ravel()
+    return charge, discharge
+
+
+def _dispatch_numpy(pv_energy, pv_profile, tariff_profile, charge, discharge, capacity, power, efficiency):
+    # Vectorized over rows; only hours that charge or discharge are visited
+    rows = len(pv_energy)
+    eta = np.sqrt(efficiency)
+    soc = np.zeros(rows)
+    charged = np.zeros(rows)
+    discharged = np.zeros(rows)
+    value = np.zeros(rows)
+    for hour in np.flatnonzero(charge | discharge):
+        if charge[hour]:
+            energy = np.minimum(np.minimum(power, pv_energy * pv_profile[hour]), (capacity - soc) / eta)
+            soc += energy * eta
+            charged += energy
+            value -= tariff_profile[hour] * energy
+        else:
+            energy = np.minimum(power, soc * eta)
+            soc -= energy / eta
+            discharged += energy
+            value += tariff_profile[hour] * energy
+    return charged, discharged, value
+
+
+def _dispatch_loops(pv_energy, pv_profile, tariff_profile, charge, discharge, capacity, power, efficiency):
+    # Same dispatch as _dispatch_numpy, one row at a time, for numba
+    rows = len(pv_energy)
+    charged = np.zeros(rows)
+    discharged = np.zeros(rows)
+    value = np.zeros(rows)
+    for row in range(rows):
+        eta = np.sqrt(efficiency[row])
+        soc = 0.0
+        for hour in range(len(pv_profile)):
+            if charge[hour]:
+                energy = min(power[row], pv_energy[row] * pv_profile[hour], (capacity[row] - soc) / eta)
+                soc += energy * eta
+                charged[row] += energy
+                value[row] -= tariff_profile[hour] * energy
+            elif discharge[hour]:
+                energy = min(power[row], soc * eta)
+                soc -= energy / eta
+                discharged[row] += energy
+                value[row] += tariff_profile[hour] * energy
+    return charged, discharged, value
+
+
+def _flows_numpy(pv_energy, pv_profile, load, month, charge, discharge, capacity, power, efficiency):
+    # Dispatch against the site's net load: charge hours store the PV the load leaves, discharge hours
+    # cover the load PV leaves. Returns the monthly flows and the yearly energy charged and discharged.
+    rows = len(pv_energy)
+    eta = np.sqrt(efficiency)
+    soc = np.zeros(rows)
+    charged = np.zeros(rows)
+    discharged = np.zeros(rows)
+    self_consumed, exported, imported = (np.zeros((rows, 12)) for _ in range(3))
+    for hour in np.flatnonzero(charge | discharge):
+        pv = pv_energy * pv_profile[hour]
+        used = np.minimum(pv, load[hour])
+        m = month[hour]
+        if charge[hour]:
+            energy = np.minimum(np.minimum(power, pv - used), (capacity - soc) / eta)
+            soc += energy * eta
+            charged += energy
+            self_consumed[:, m] += used
+            exported[:, m] += pv - used - energy
+            imported[:, m] += load[hour] - used
+        else:
+            energy = np.minimum(np.minimum(power, soc * eta), load[hour] - used)
+            soc -= energy / eta
+            discharged += energy
+            self_consumed[:, m] += used + energy
+            exported[:, m] += pv - used
+            imported[:, m] += load[hour] - used - energy
+    return self_consumed, exported, imported, charged, discharged
+
+
+def _flows_loops(pv_energy, pv_profile, load, month, charge, discharge, capacity, power, efficiency):
+    # Same flows as _flows_numpy, one row at a time, for numba
+    rows = len(pv_energy)
+    charged = np.zeros(rows)
+    discharged = np.zeros(rows)
+    self_consumed = np.zeros((rows, 12))
+    exported = np.zeros((rows, 12))
+    imported = np.zeros((rows, 12))
+    for row in range(rows):
+        eta = np.sqrt(efficiency[row])
+        soc = 0.0
+        for hour in range(len(pv_profile)):
+            if not (charge[hour] or discharge[hour]):
+                continue
+            pv = pv_energy[row] * pv_profile[hour]
+            used = min(pv, load[hour])
+            m = month[hour]
+            if charge[hour]:
+                energy = min(power[row], pv - used, (capacity[row] - soc) / eta)
+                soc += energy * eta
+                charged[row] += energy
+                self_consumed[row, m] += used
+                exported[row, m] += pv - used - energy
+                imported[row, m] += load[hour] - used
+            else:
+                energy = min(power[row], soc * eta, load[hour] - used)
+                soc -= energy / eta
+                discharged[row] += energy
+                self_consumed[row, m] += used + energy
+                exported[row, m] += pv - used
+                imported[row, m] += load[hour] - used - energy
+    return self_consumed, exported, imported, charged, discharged
+
+
+@functools.lru_cache(maxsize=1)
+def dispatch_kernel():
+    """The compiled dispatch loop when numba is installed, else the NumPy version."""
+    try:
+        import numba
+    except ImportError:
+        return _dispatch_numpy
+    return numba.njit(cache=True)(_dispatch_loops)
+
+
+@functools.lru_cache(maxsize=1)
+def flows_kernel():
+    """The compiled metered dispatch loop when numba is installed, else the NumPy version."""
+    try:
+        import numba
+    except ImportError:
+        return _flows_numpy
+    return numba.njit(cache=True)(_flows_loops)
+
+
+def dispatch(pv_energy, capacity, power, efficiency, pv_profile, tariff_profile):
+    """Yearly totals for rows of (PV energy in kWh/year, battery): energy charged from PV,
+    energy discharged, and arbitrage value in kWh at the base tariff."""
+    charge, discharge = dispatch_hours(pv_profile, tariff_profile)
+    rows = len(pv_energy)
+    arrays = [np.ascontiguousarray(np.broadcast_to(np.asarray(values, dtype=float), rows))
+              for values in (pv_energy, capacity, power, np.asarray(efficiency, dtype=float) / 100)]
+    return dispatch_kernel()(arrays[0], np.asarray(pv_profile, dtype=float), np.asarray(tariff_profile, dtype=float),
+                             charge, discharge, *arrays[1:])
+
+
+def simulate(generation, battery):
+    """Dispatch every project year: generation (N, years) kWh, `battery` from battery().
+
+    Returns (N, years) arrays: storage_value (kWh at the base tariff),
+    battery_charged, battery_discharged and battery_capacity.
+    """
+    n, years = generation.shape
+    params = {name: np.broadcast_to(np.asarray(battery[name], dtype=float), n)
+              for name in ('capacity', 'power', 'efficiency', 'fade_per_cycle')}
+    profile, tariff = battery['pv_profile'], battery['tariff_profile']
+    # Pass 1: cycles per year at full capacity
+    _, discharged, _ = dispatch(generation[:, 0], params['capacity'], params['power'], params['efficiency'], profile, tariff)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cycles = np.nan_to_num(discharged / np.sqrt(params['efficiency'] / 100) / params['capacity'])
+    fade = params['fade_per_cycle'][:, None] / 100 * cycles[:, None] * np.arange(years)
+    capacity = params['capacity'][:, None] * np.clip(1 - fade, 0, None)
+    # Pass 2: every project year with its faded capacity
+    charged, discharged, value = dispatch(
+        generation.ravel(), capacity.ravel(), np.repeat(params['power'], years), np.repeat(params['efficiency'], years),
+        profile, tariff)
+    return {
+        'storage_value': value.reshape(n, years),
+        'battery_charged': charged.reshape(n, years),
+        'battery_discharged': discharged.reshape(n, years),
+        'battery_capacity': capacity,
+    }
+
+
+def metered_flows(pv_energy, load, pv_profile, month, battery, capacity):
+    """Dispatch against a load: self-consumed, exported and imported kWh per month in the battery's
+    dispatch hours, (rows, 12) each, and the yearly energy charged and discharged (rows,).
+
+    pv_energy is the yearly generation of each row (kWh), load the site's
+    hourly load (8760,), month the month of each hour, `battery` from
+    battery() with one value per row, and capacity the rows' faded capacity.
+    The battery charges from `pv_profile`, the PV shape of the metering.
+    """
+    charge, discharge = dispatch_hours(pv_profile, battery['tariff_profile'])
+    rows = len(pv_energy)
+    arrays = [np.ascontiguousarray(np.broadcast_to(np.asarray(values, dtype=float), rows))
+              for values in (pv_energy, capacity, battery['power'], np.asarray(battery['efficiency'], dtype=float) / 100)]
+    return flows_kernel()(arrays[0], np.asarray(pv_profile, dtype=float), np.ascontiguousarray(load, dtype=float),
+                          month, charge, discharge, *arrays[1:])
@@ -0,0 +1,73 @@
+"""Lumpy capital costs during a project's life: inverter replacements,
+battery augmentation, decommissioning.
+
+Events are a small record array (EVENT_DTYPE): the year the cost falls in,
+its cost in today's money (in the capex currency), a yearly escalation of
+that cost, the probability that it happens, and the project it belongs to
+(-1 for every project of a batch). The model scatters the few events into
+its (N, years) cost matrix in one step; deterministic runs charge the
+expected cost, and Monte Carlo draws whether each uncertain event happens
+per sample.
+"""
+import numpy as np
+
+EVENT_DTYPE = np.dtype([
+    ('project', np.int64),
+    ('year', np.int64),
+    ('cost', np.float64),
+    ('escalation', np.float64),   # % per year from t = 0
+    ('probability', np.float64),
+])
+
+
+def event(year, cost, escalation=0.0, probability=1.0, project=-1):
+    return (project, year, cost, escalation, probability)
+
+
+def event_table(events):
+    """EVENT_DTYPE array from an event table, event() tuples or dicts with year and cost."""
+    if isinstance(events, np.ndarray) and events.dtype == EVENT_DTYPE:
+        return events
+    rows = [event(**item) if isinstance(item, dict) else tuple(item) for item in events]
+    table = np.array(rows, dtype=EVENT_DTYPE) if rows else np.zeros(0, EVENT_DTYPE)
+    if ((table['year'] < 1) | (table['cost'] < 0) | (table['probability'] < 0) | (table['probability'] > 1)).any():
+        raise ValueError("Capex events need a year of at least 1, a cost of at least 0 and a probability between 0 and 1")
+    return table
+
+
+def event_costs(table, n_projects, years):
+    """(n_projects, years) expected event costs for years 1..years; None when there are none."""
+    table = table[table['year'] <= years]
+    if not len(table):
+        return None
+    amounts = table['cost'] * (1 + table['escalation'] / 100) ** table['year'] * table['probability']
+    costs = np.zeros((n_projects, years))
+    shared = table['project'] < 0
+    np.add.at(costs, (slice(None), table['year'][shared] - 1), amounts[shared])
+    np.add.at(costs, (table['project'][~shared], table['year'][~shared] - 1), amounts[~shared])
+    return costs
+
+
+def sample(table, n_samples, rng):
+    # One Monte Carlo draw per sample. The samples are draws of one project, so every event applies to
+    # all of them, whichever project it names; uncertain events become certain events of the samples they hit
+    certain = table[table['probability'] >= 1].copy()
+    certain['project'] = -1
+    drawn = [certain]
+    for row in table[table['probability'] < 1]:
+        hit = np.flatnonzero(rng.random(n_samples) < row['probability'])
+        occurrences = np.zeros(len(hit), EVENT_DTYPE)
+        occurrences['project'] = hit
+        for name in ('year', 'cost', 'escalation'):
+            occurrences[name] = row[name]
+        occurrences['probability'] = 1.0
+        drawn.append(occurrences)
+    return np.concatenate(drawn)
+
+
+def select(table, start, stop):
+    # Events of projects start..stop-1 of a batch, renumbered for that slice
+    mine = (table['project'] < 0) | ((table['project'] >= start) & (table['project'] < stop))
+    table = table[mine].copy()
+    table['project'][table['project'] >= 0] -= start
+    return table
@@ -0,0 +1,81 @@
+"""Module degradation models as generation-multiplier vectors.
+
+A model is a small hashable tuple built by one of the constructors below
+(compound, linear, lid, nonlinear, warranty_capped, custom). multipliers()
+turns it into the share of first-year energy produced in years 1..years;
+vectors are cached by model and length and returned read-only, so a batch
+broadcasts one row (or gathers rows with index_matrix) instead of looping
+over years.
+"""
+import functools
+
+import numpy as np
+
+
+def compound(rate):
+    """Constant `rate` % of the previous year's output lost every year (the form's default)."""
+    return ('compound', float(rate))
+
+
+def linear(rate):
+    """`rate` % of the first-year output lost every year."""
+    return ('linear', float(rate))
+
+
+def lid(first_year_loss, rate):
+    """Light-induced degradation: `first_year_loss` % in year 1, then `rate` % a year."""
+    return ('lid', float(first_year_loss), float(rate))
+
+
+def nonlinear(rate, acceleration):
+    """Ageing that speeds up: the yearly loss starts at `rate` % and grows by `acceleration` points a year."""
+    return ('nonlinear', float(rate), float(acceleration))
+
+
+def warranty_capped(model, first_year=97.5, yearly=0.5, term=25):
+    """Another model limited by a linear power warranty: at least `first_year` % in year 1,
+    falling by `yearly` points a year, for `term` years."""
+    return ('warranty', model, float(first_year), float(yearly), int(term))
+
+
+def custom(values):
+    """User-supplied multipliers for years 1, 2, ... (the last value repeats)."""
+    return ('custom', tuple(float(value) for value in np.atleast_1d(values)))
+
+
+@functools.lru_cache(maxsize=512)
+def multipliers(model, years):
+    """Generation multipliers for years 1..years of a model, as a read-only (years,) vector."""
+    kind = model[0]
+    age = np.arange(years)  # years since year 1
+    if kind == 'compound':
+        index = (1 - model[1] / 100) ** age
+    elif kind == 'linear':
+        index = 1 - model[1] / 100 * age
+    elif kind == 'lid':
+        _, first_year_loss, rate = model
+        index = (1 - first_year_loss / 100) * (1 - rate / 100) ** age
+    elif kind == 'nonlinear':
+        _, rate, acceleration = model
+        losses = np.clip(rate + acceleration * age[:-1], 0, 100) / 100
+        index = np.concatenate([[1.0], np.cumprod(1 - losses)])
+    elif kind == 'warranty':
+        _, base, first_year, yearly, term = model
+        guaranteed = (first_year - yearly * age) / 100
+        index = np.where(age < term, np.maximum(multipliers(base, years), guaranteed), multipliers(base, years))
+    elif kind == 'custom':
+        values = np.asarray(model[1])
+        index = values[np.minimum(age, len(values) - 1)]
+    else:
+        raise ValueError(f"Unknown degradation model {kind!r}")
+    index = np.clip(np.array(index, dtype=float), 0, None)
+    index.setflags(write=False)
+    return index
+
+
+def index_matrix(models, years):
+    """(N, years) multipliers for one model per project; each distinct model is computed once."""
+    distinct = list(dict.fromkeys(models))
+    position = {model: i for i, model in enumerate(distinct)}
+    vectors = np.stack([multipliers(model, years) for model in distinct])
+    return vectors[[position[model] for model in models]]
@@ -0,0 +1,97 @@
+"""Environmental impact of PV generation with grid emission-factor time series.
+
+Impacts are computed per year from the full generation matrix, so lifetime
+totals account for module degradation and for a grid that gets cleaner
+over the life of the project.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+# Constants from EPA
+KWH_PER_HOUSEHOLD = 10800
+CO2_PER_KWH = 0.82  # kg CO2 per kWh
+GALLON_GAS_CO2 = 8.887  # kg CO2 per gallon of gasoline
+CO2_PER_CAR = 4.2  # metric tons of CO2 per car per year
+TREE_SEEDLING_CO2 = 0.039  # metric tons of CO2 per tree seedling over 10 years
+
+DEFAULT_REGION = 'Default (EPA)'
+
+# Grid emission factors in kg CO2/kWh by region.
+# region: ({calendar year: factor}, annual decline after the last year (%), floor)
+# Values between listed years are interpolated; beyond the last year the
+# factor declines at the given rate until it reaches the floor. The figures
+# are approximate national grid averages and should be replaced with the
+# utility's published factor where one is available.
+GRID_EMISSION_FACTORS = {
+    DEFAULT_REGION: ({2024: CO2_PER_KWH}, 0.0, CO2_PER_KWH),
+    'India': ({2019: 0.82, 2021: 0.79, 2023: 0.716}, 2.5, 0.10),
+    'United States': ({2019: 0.42, 2021: 0.39, 2023: 0.37}, 3.0, 0.05),
+    'United Kingdom': ({2019: 0.256, 2021: 0.212, 2023: 0.207}, 5.0, 0.02),
+    'Germany': ({2019: 0.41, 2021: 0.42, 2023: 0.38}, 4.0, 0.03),
+    'Japan': ({2019: 0.47, 2021: 0.46, 2023: 0.45}, 2.0, 0.10),
+    'Australia': ({2019: 0.79, 2021: 0.73, 2023: 0.66}, 4.0, 0.05),
+    'United Arab Emirates': ({2019: 0.42, 2023: 0.40}, 2.0, 0.10),
+    'Oman': ({2019: 0.49, 2023: 0.46}, 1.5, 0.15),
+}
+
+
+@lru_cache(maxsize=256)
+def _emission_factor_curve(region, start_year, years, decarbonize):
+    table, decline, floor = GRID_EMISSION_FACTORS[region]
+    known_years = np.array(sorted(table), dtype=float)
+    known_factors = np.array([table[year] for year in sorted(table)], dtype=float)
+    calendar = np.arange(start_year, start_year + years, dtype=float)
+    if not decarbonize:
+        calendar = np.full(years, float(start_year))
+
+    factors = np.interp(calendar, known_years, known_factors)
+    years_past_table = calendar - known_years[-1]
+    projected = np.maximum(known_factors[-1] * (1 - decline / 100) ** np.maximum(years_past_table, 0), floor)
+    factors = np.where(years_past_table > 0, np.minimum(projected, known_factors[-1]), factors)
+    factors.setflags(write=False)
+    return factors
+
+
+def emission_factor_curve(region, start_year, years, decarbonize=True):
+    """Grid emission factor (kg CO2/kWh) for each project year.
+
+    With `decarbonize=False` the start-year factor is held flat. The
+    returned array is cached and read-only, so it can be shared by every
+    project in a batch.
+    """
+    if region not in GRID_EMISSION_FACTORS:
+        raise ValueError(f"Unknown grid region {region!r}")
+    return _emission_factor_curve(region, int(start_year), int(years), bool(decarbonize))
+
+
+def emission_factor_matrix(regions, start_years, years, decarbonize=True):
+    # (N, years) factors for a batch of projects; one cached curve per distinct region/start year
+    regions, start_years = np.broadcast_arrays(np.asarray(regions, dtype=object), np.asarray(start_years))
+    regions, start_years = regions.ravel(), start_years.ravel()
+    keys = list(zip(regions, start_years.astype(int)))
+    curves = {key: emission_factor_curve(key[0], key[1], years, decarbonize) for key in set(keys)}
+    return np.stack([curves[key] for key in keys])
+
+
+def environmental_impacts(generation, emission_factors=CO2_PER_KWH):
+    """Per-year and lifetime impacts for a (N, years) generation matrix.
+
+    Per-year arrays keep the shape of `generation`; `lifetime_*` values are
+    summed over the year axis.
+    """
+    generation = np.asarray(generation, dtype=float)
+    co2_saved_kg = generation * emission_factors
+    co2_saved_tonnes = co2_saved_kg / 1000
+    impacts = {
+        'emission_factors': np.broadcast_to(emission_factors, generation.shape),
+        'houses_energized': generation / KWH_PER_HOUSEHOLD,
+        'co2_saved_kg': co2_saved_kg,
+        'co2_saved_tonnes': co2_saved_tonnes,
+        'gallons_gas_saved': co2_saved_kg / GALLON_GAS_CO2,
+        'cars_taken_off_road': co2_saved_tonnes / CO2_PER_CAR,
+        'tree_seedlings': co2_saved_tonnes / TREE_SEEDLING_CO2,
+    }
+    for name in ('houses_energized', 'co2_saved_tonnes', 'gallons_gas_saved', 'cars_taken_off_road', 'tree_seedlings'):
+        impacts[f'lifetime_{name}'] = impacts[name].sum(axis=-1)
+    return impacts
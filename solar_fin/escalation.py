@@ -0,0 +1,94 @@
+"""Escalation schedules for tariffs and O&M costs.
+
+A schedule is a small hashable tuple built by one of the constructors below
+(step, compound, cpi, capped, custom). multipliers() turns it into a price
+index for years 1..years (year 1 = 1.0); vectors are cached by schedule and
+length and returned read-only, so every project in a batch that shares a
+schedule multiplies by the same array.
+"""
+import functools
+
+import numpy as np
+
+
+def escalation_steps(years, escalation_years):
+    # Number of escalations applied before each year. Matches the form's
+    # loop: prices step up after every `escalation_years`-th year except year 1.
+    period = np.asarray(escalation_years)[:, None]
+    steps = (years[None, :] - 1) // period - (period == 1)
+    return np.maximum(steps, 0)
+
+
+def step_index(years, rate, escalation_years):
+    # The form's default schedule for a whole batch: (N, years) from per-project rates (%) and periods
+    return (1 + np.asarray(rate)[:, None] / 100) ** escalation_steps(years, escalation_years)
+
+
+def step(rate, period=1):
+    """`rate` % after every `period` years (the original form behaviour)."""
+    return ('step', float(rate), int(period))
+
+
+def compound(rate):
+    """`rate` % every year from year 2."""
+    return ('compound', float(rate))
+
+
+def cpi(inflation, pass_through=100.0, margin=0.0):
+    """Indexed to CPI: `inflation` is % per year (the last value repeats), passed through at
+    `pass_through` % plus `margin` percentage points."""
+    return ('cpi', tuple(float(rate) for rate in np.atleast_1d(inflation)), float(pass_through), float(margin))
+
+
+def capped(schedule, cap=None, floor=None):
+    """Another schedule with each year's escalation limited to [floor, cap] %."""
+    return ('capped', schedule, None if cap is None else float(cap), None if floor is None else float(floor))
+
+
+def custom(values):
+    """User-supplied multipliers for years 1, 2, ... (the last value repeats)."""
+    return ('custom', tuple(float(value) for value in np.atleast_1d(values)))
+
+
+def _extend(values, years):
+    values = np.asarray(values, dtype=float)
+    if len(values) >= years:
+        return values[:years]
+    return np.concatenate([values, np.full(years - len(values), values[-1])])
+
+
+@functools.lru_cache(maxsize=512)
+def multipliers(schedule, years):
+    """Price index for years 1..years of a schedule, as a read-only (years,) vector."""
+    kind = schedule[0]
+    year = np.arange(1, years + 1)
+    if kind == 'step':
+        _, rate, period = schedule
+        index = step_index(year, np.array([rate]), np.array([period]))[0]
+    elif kind == 'compound':
+        index = (1 + schedule[1] / 100) ** (year - 1)
+    elif kind == 'cpi':
+        _, inflation, pass_through, margin = schedule
+        rates = _extend(inflation, years - 1) * pass_through / 100 + margin if years > 1 else np.empty(0)
+        index = np.concatenate([[1.0], np.cumprod(1 + rates / 100)])
+    elif kind == 'capped':
+        _, base, cap, floor = schedule
+        base_index = multipliers(base, years)
+        rates = (base_index[1:] / base_index[:-1] - 1) * 100
+        rates = np.clip(rates, floor, cap) if cap is not None or floor is not None else rates
+        index = np.concatenate([[1.0], np.cumprod(1 + rates / 100)])
+    elif kind == 'custom':
+        index = _extend(schedule[1], years)
+    else:
+        raise ValueError(f"Unknown escalation schedule {kind!r}")
+    index = np.array(index, dtype=float)
+    index.setflags(write=False)
+    return index
+
+
+def index_matrix(schedules, years):
+    """(N, years) indices for one schedule per project; each distinct schedule is computed once."""
+    distinct = list(dict.fromkeys(schedules))
+    position = {schedule: i for i, schedule in enumerate(distinct)}
+    vectors = np.stack([multipliers(schedule, years) for schedule in distinct])
+    return vectors[[position[schedule] for schedule in schedules]]
@@ -0,0 +1,138 @@
+"""Exchange rates and FX curves for multi-currency projects.
+
+Rates come from an offline JSON file of USD-based spot rates (refreshed from
+Yahoo Finance with `python -m solar_fin.fx refresh`) or live from Yahoo
+Finance, the same source as the sidebar converter. An FX curve is the spot
+rate escalated by a forward drift per year; curves are read-only arrays
+that multiply whole cash-flow matrices at once, and curves from the rates
+file are cached until the file changes.
+"""
+import functools
+import json
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+
+RATES_PATH = os.environ.get('SOLAR_FIN_FX_RATES', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fx_rates.json'))
+CURRENCIES = ("USD", "EUR", "GBP", "INR", "JPY", "AUD", "AED", "OMR")
+LIVE_TTL = 3600  # seconds a live quote is reused
+
+_live_quotes = {}  # (from, to): (fetched at, rate)
+
+
+@functools.lru_cache(maxsize=8)
+def _read_rates(path, mtime):
+    with open(path) as rates_file:
+        document = json.load(rates_file)
+    rates = dict(document['rates'], **{document['base']: 1.0})
+    return document['base'], document.get('as_of'), rates
+
+
+def offline_rates(path=None):
+    """(base, as_of, {currency: units per base unit}) from the rates file; re-read when it changes."""
+    path = path or RATES_PATH
+    return _read_rates(path, os.path.getmtime(path))
+
+
+def live_rate(from_currency, to_currency):
+    # Last close of the Yahoo Finance pair, reused for LIVE_TTL seconds
+    key = (from_currency, to_currency)
+    fetched = _live_quotes.get(key)
+    if fetched is None or time.time() - fetched[0] > LIVE_TTL:
+        import yfinance as yf
+        rate = float(yf.Ticker(f"{from_currency}{to_currency}=X").history(period="1d")['Close'].iloc[-1])
+        fetched = (time.time(), rate)
+        _live_quotes[key] = fetched
+    return fetched[1]
+
+
+def spot_rate(from_currency, to_currency, source='offline'):
+    """Units of `to_currency` per unit of `from_currency`.
+
+    `source='live'` asks Yahoo Finance and falls back to the rates file if
+    the quote cannot be fetched.
+    """
+    if from_currency == to_currency:
+        return 1.0
+    if source == 'live':
+        try:
+            return live_rate(from_currency, to_currency)
+        except Exception:
+            pass
+    _, _, rates = offline_rates()
+    try:
+        return rates[to_currency] / rates[from_currency]
+    except KeyError as error:
+        raise ValueError(f"No exchange rate for {error.args[0]}") from None
+
+
+def _escalated(spot, years, drift):
+    curve = spot * (1 + drift / 100) ** np.arange(years + 1)
+    curve.setflags(write=False)
+    return curve
+
+
+@functools.lru_cache(maxsize=256)
+def _offline_curve(from_currency, to_currency, years, drift, mtime):
+    # Keyed by the rates file's mtime, so an edited file gives new curves
+    return _escalated(spot_rate(from_currency, to_currency), years, drift)
+
+
+def fx_curve(from_currency, to_currency, years, drift=0.0, source='offline'):
+    """Rates for t = 0..years: spot at t = 0 escalated by `drift` (% per year), shape (years + 1,)."""
+    if from_currency == to_currency:
+        return _offline_curve(from_currency, to_currency, years, 0.0, None)
+    if source == 'live':
+        # Live quotes expire after LIVE_TTL and a failed fetch falls back to the file, so these are not kept
+        return _escalated(spot_rate(from_currency, to_currency, source), years, drift)
+    return _offline_curve(from_currency, to_currency, years, drift, os.path.getmtime(RATES_PATH))
+
+
+def fx_inputs(currencies, reporting_currency, years, drift=0.0, source='offline'):
+    """Model inputs converting capex, O&M and tariff into the reporting currency.
+
+    `currencies` maps 'capex', 'o_and_m' and 'tariff' to currency codes (one
+    code or one per project). Returns capex_fx (N,) at t = 0 and o_and_m_fx /
+    tariff_fx as (N, years) for operating years 1..years.
+    """
+    inputs = {}
+    for cost, name in (('capex', 'capex_fx'), ('o_and_m', 'o_and_m_fx'), ('tariff', 'tariff_fx')):
+        curves = fx_matrix(np.atleast_1d(currencies[cost]), reporting_currency, years, drift, source)
+        inputs[name] = curves[:, 0] if cost == 'capex' else curves[:, 1:]
+    return inputs
+
+
+def fx_matrix(currencies, to_currency, years, drift=0.0, source='offline'):
+    # (N, years + 1) curves for an array of currency codes; one curve per distinct code
+    codes, index = np.unique(np.asarray(currencies), return_inverse=True)
+    curves = np.stack([fx_curve(str(code), to_currency, years, drift, source) for code in codes])
+    return curves[index.ravel()]
+
+
+def convert_amounts(amounts, currencies, to_currency, source='offline'):
+    """Convert amounts (N,) or (N, years) in per-row currencies into one currency in a single step."""
+    codes, index = np.unique(np.asarray(currencies), return_inverse=True)
+    rates = np.array([spot_rate(str(code), to_currency, source) for code in codes])
+    amounts = np.asarray(amounts, dtype=float)
+    factors = rates[index.ravel()]
+    return amounts * factors.reshape((-1,) + (1,) * (amounts.ndim - 1))
+
+
+def refresh_rates_file(path=None, currencies=CURRENCIES):
+    # Rewrite the offline rates file with live USD-based quotes
+    rates = {code: live_rate('USD', code) for code in currencies if code != 'USD'}
+    document = {'base': 'USD', 'as_of': date.today().isoformat(), 'source': 'Yahoo Finance', 'rates': rates}
+    with open(path or RATES_PATH, 'w') as rates_file:
+        json.dump(document, rates_file, indent=2)
+        rates_file.write('\n')
+    return document
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['refresh']:
+        print(json.dumps(refresh_rates_file(), indent=2))
+    else:
+        print("usage: python -m solar_fin.fx refresh")
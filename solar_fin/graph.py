@@ -0,0 +1,88 @@
+"""Memoizing dependency graph for incremental recalculation.
+
+Nodes declare the input parameters they read and the upstream nodes they
+depend on. A node is recomputed only when one of its own parameters or an
+upstream node changed since the last run, so editing the discount rate
+reruns the discounted metrics without touching generation or its charts.
+"""
+import numpy as np
+
+from solar_fin import environment, model
+
+
+def _freeze(value):
+    # Hashable stand-in for an input value
+    if isinstance(value, np.ndarray):
+        return (value.shape, value.dtype.str, value.tobytes())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+class CalculationGraph:
+    def __init__(self):
+        self.nodes = {}
+        self._cache = {}  # name: (key, version, value)
+        self._versions = 0
+        self._run = {}
+        self.recomputed = []
+
+    def add(self, name, function, params=(), deps=()):
+        # Registering a node again replaces its function but keeps its cached value,
+        # so the graph can be rebuilt on every Streamlit rerun
+        self.nodes[name] = (function, tuple(params), tuple(deps))
+
+    def node(self, name, params=(), deps=()):
+        def register(function):
+            self.add(name, function, params, deps)
+            return function
+        return register
+
+    def begin_run(self):
+        # Start a new rerun: nodes are checked at most once and `recomputed` is reset
+        self._run = {}
+        self.recomputed = []
+
+    def invalidate(self, name=None):
+        if name is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(name, None)
+
+    def _version(self, name, inputs):
+        if name in self._run:
+            return self._run[name]
+        function, params, deps = self.nodes[name]
+        dep_versions = tuple(self._version(dep, inputs) for dep in deps)
+        key = (tuple(_freeze(inputs[param]) for param in params), dep_versions)
+
+        cached = self._cache.get(name)
+        if cached is None or cached[0] != key:
+            value = function(**{dep: self._cache[dep][2] for dep in deps}, **{param: inputs[param] for param in params})
+            self._versions += 1
+            cached = (key, self._versions, value)
+            self._cache[name] = cached
+            self.recomputed.append(name)
+        self._run[name] = cached[1]
+        return cached[1]
+
+    def compute(self, name, inputs):
+        """Return the value of `name`, recomputing it and its upstream nodes only if needed."""
+        self._version(name, inputs)
+        return self._cache[name][2]
+
+
+def environment_stage(timeline, generation, grid_region, grid_decarbonization, start_year):
+    factors = environment.emission_factor_curve(grid_region, start_year, len(timeline['years']), grid_decarbonization)
+    return environment.environmental_impacts(generation['generation'], factors)
+
+
+def model_graph():
+    # Graph with one node per stage of the cash-flow model plus the environmental impacts
+    graph = CalculationGraph()
+    for name, (function, params, deps) in model.STAGES.items():
+        graph.add(name, function, params, deps)
+    graph.add('environment', environment_stage, ('grid_region', 'grid_decarbonization', 'start_year'), ('timeline', 'generation'))
+    return graph
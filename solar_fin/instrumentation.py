@@ -0,0 +1,190 @@
+"""Per-stage timing and optional profiling for the Streamlit app.
+
+Timing is off unless SOLAR_FIN_TIMINGS=1; a disabled timer hands out one
+shared no-op context manager, so the instrumented code pays only a method
+call. When enabled, each finished run is logged as one JSON line on the
+`solar_fin.timings` logger and folded into process-wide totals that can be
+written as Prometheus text (SOLAR_FIN_METRICS_FILE) or served over HTTP
+(SOLAR_FIN_METRICS_PORT).
+
+Profiling is requested with SOLAR_FIN_PROFILE=cprofile|pyinstrument. The
+`?profile=cprofile` query parameter is honoured only where
+SOLAR_FIN_PROFILE_QUERY=1, so visitors of a public app cannot turn it on.
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('solar_fin.timings')
+
+_NULL_STAGE = contextlib.nullcontext()
+_totals = {}  # stage: (count, total seconds, max seconds)
+_totals_lock = threading.Lock()
+_server = None
+
+
+def _ensure_log_handler():
+    # Emit the JSON lines on stderr unless the host application configured the logger
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def timings_enabled():
+    return os.environ.get('SOLAR_FIN_TIMINGS', '').lower() in ('1', 'true', 'yes')
+
+
+class RunTimer:
+    """Collects stage durations for one script run."""
+
+    def __init__(self, enabled=None):
+        self.enabled = timings_enabled() if enabled is None else enabled
+        self.run_id = uuid.uuid4().hex[:12]
+        self.stages = {}
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._timed(name)
+
+    @contextlib.contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def finish(self, **fields):
+        # Log this run and add it to the process totals; no-op when nothing was timed
+        if not self.enabled or not self.stages:
+            return
+        record = dict(fields, event='stage_timings', run_id=self.run_id,
+                      stages={name: round(seconds, 6) for name, seconds in self.stages.items()},
+                      total=round(sum(self.stages.values()), 6))
+        _ensure_log_handler()
+        logger.info(json.dumps(record))
+        with _totals_lock:
+            for name, seconds in self.stages.items():
+                count, total, longest = _totals.get(name, (0, 0.0, 0.0))
+                _totals[name] = (count + 1, total + seconds, max(longest, seconds))
+        metrics_file = os.environ.get('SOLAR_FIN_METRICS_FILE')
+        if metrics_file:
+            write_metrics_file(metrics_file)
+        self.stages = {}
+
+
+def prometheus_text():
+    with _totals_lock:
+        totals = dict(_totals)
+    lines = [
+        '# HELP solar_fin_stage_seconds Time spent in each stage of the app.',
+        '# TYPE solar_fin_stage_seconds summary',
+    ]
+    for name, (count, total, _) in sorted(totals.items()):
+        lines.append(f'solar_fin_stage_seconds_count{{stage="{name}"}} {count}')
+        lines.append(f'solar_fin_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+    lines += [
+        '# HELP solar_fin_stage_seconds_max Longest single run of each stage.',
+        '# TYPE solar_fin_stage_seconds_max gauge',
+    ]
+    for name, (_, _, longest) in sorted(totals.items()):
+        lines.append(f'solar_fin_stage_seconds_max{{stage="{name}"}} {longest:.6f}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics_file(path):
+    # Write atomically so a textfile collector never reads a partial file
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as metrics:
+        metrics.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('', '/metrics'):
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None):
+    # Serve /metrics from a daemon thread, once per process
+    global _server
+    port = port or os.environ.get('SOLAR_FIN_METRICS_PORT')
+    if _server is not None or not port:
+        return _server
+    _server = ThreadingHTTPServer(('127.0.0.1', int(port)), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+class Profile:
+    """cProfile or pyinstrument capture around part of a run."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self._profiler = None
+        self.report = None
+
+    def start(self):
+        if self.mode == 'pyinstrument':
+            from pyinstrument import Profiler
+            self._profiler = Profiler()
+        elif self.mode == 'cprofile':
+            import cProfile
+            self._profiler = cProfile.Profile()
+        else:
+            raise ValueError(f"Unknown profiler {self.mode!r}")
+        if self.mode == 'pyinstrument':
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+        return self
+
+    def stop(self, limit=40):
+        if self.mode == 'pyinstrument':
+            self._profiler.stop()
+            self.report = self._profiler.output_text(unicode=True)
+        else:
+            import pstats
+            self._profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+            self.report = out.getvalue()
+        return self.report
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        # Also on errors, so a failed run does not leave the profiler enabled
+        self.stop()
+
+
+def requested_profile(query_params=None):
+    # Profiler named by the environment, or by the query string where the environment allows it
+    mode = os.environ.get('SOLAR_FIN_PROFILE')
+    if not mode and os.environ.get('SOLAR_FIN_PROFILE_QUERY', '').lower() in ('1', 'true', 'yes'):
+        mode = (query_params or {}).get('profile')
+    if mode in ('1', 'true'):
+        mode = 'cprofile'
+    return mode if mode in ('cprofile', 'pyinstrument') else None
@@ -0,0 +1,215 @@
+"""Background job queue for heavy calculations started from the app.
+
+One process pool is shared by every session of a server process. A job is
+split into chunks (Monte Carlo samples or sweep rows) that are handed to the
+pool a few at a time, round-robin across jobs, so a long job from one
+session cannot fill the pool ahead of everyone else. Chunk results are
+concatenated when the job finishes, or, for kinds with a merge function
+(grid sweeps), folded into one running summary as each chunk arrives. The queue refuses new
+jobs beyond `max_queued` active jobs in total or `max_per_session` per
+session, and a cancelled job simply stops being scheduled.
+"""
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from solar_fin import battery, capex_events, metering, model, sweeps
+from solar_fin.scenarios import METRICS
+
+ACTIVE = ('queued', 'running')
+
+
+class JobRejected(RuntimeError):
+    """Raised when the queue or the session is already at its limit."""
+
+
+# Chunk functions run in the worker processes and return only the headline
+# metrics, so little more than a few arrays crosses the process boundary.
+
+def monte_carlo_chunk(inputs, n_samples, spreads, seed):
+    sampled, results = model.monte_carlo(inputs, n_samples, spreads, seed=seed)
+    return dict({name: results[name] for name in METRICS},
+                **{name: sampled[name] for name in spreads})
+
+
+def sweep_chunk(inputs):
+    results = model.evaluate(inputs)
+    return {name: results[name] for name in METRICS}
+
+
+def monte_carlo_chunks(inputs, n_samples, spreads, seed=None, chunk_size=20_000):
+    # Independent random streams per chunk, reproducible for a given seed
+    sizes = [min(chunk_size, n_samples - start) for start in range(0, n_samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    return [(inputs, size, spreads, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+
+
+def sweep_chunks(inputs, chunk_size=20_000):
+    batch = model.broadcast_inputs(inputs)
+    n = len(batch['project_life'])
+    events = batch.pop('capex_events')
+    storage = batch.pop('battery')
+    metered = batch.pop('metering')
+    chunks = []
+    # Per-project columns are split; inputs shared by all rows (e.g. default FX factors) go to every chunk
+    for start in range(0, n, chunk_size):
+        chunk = {name: values[start:start + chunk_size] if values is not None and len(values) == n else values for name, values in batch.items()}
+        chunk['capex_events'] = None if events is None else capex_events.select(events, start, start + chunk_size)
+        chunk['battery'] = None if storage is None else battery.select(storage, start, start + chunk_size, n)
+        chunk['metering'] = None if metered is None else metering.select(metered, start, start + chunk_size, n)
+        chunks.append((chunk,))
+    return chunks
+
+
+# kind: (chunk function run in a worker, function splitting the job's parameters into chunk arguments,
+#        function merging two chunk results, or None to concatenate them at the end)
+TASKS = {
+    'monte_carlo': (monte_carlo_chunk, monte_carlo_chunks, None),
+    'sweep': (sweep_chunk, sweep_chunks, None),
+    'grid_sweep': (sweeps.evaluate_shard, sweeps.shards, sweeps.merge),
+}
+
+
+def concatenate_chunks(chunks):
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+class Job:
+    def __init__(self, job_id, session_id, kind, chunk_args):
+        self.id = job_id
+        self.session_id = session_id
+        self.kind = kind
+        self.chunk_args = chunk_args
+        self.chunk_results = [None] * len(chunk_args)
+        self.next_chunk = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.status = 'queued'
+        self.error = None
+        self.result = None
+        self.submitted = time.time()
+        self.finished = None
+
+    @property
+    def progress(self):
+        return self.completed / len(self.chunk_args) if self.chunk_args else 1.0
+
+
+class JobQueue:
+    def __init__(self, max_workers=None, max_queued=16, max_per_session=2, keep_finished=50):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_queued = max_queued
+        self.max_per_session = max_per_session
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self._lock = threading.RLock()
+        self._in_flight = 0
+        self._turns = itertools.count()
+        self._last_turn = {}
+        self._executor = None
+
+    def _pool(self):
+        # Created on first use; "spawn" avoids forking a process that runs server threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def submit(self, session_id, kind, **params):
+        """Queue a job and return its id; raises JobRejected when over a limit."""
+        if kind not in TASKS:
+            raise ValueError(f"Unknown job kind {kind!r}")
+        chunk_args = TASKS[kind][1](**params)
+        with self._lock:
+            active = [job for job in self.jobs.values() if job.status in ACTIVE]
+            if len(active) >= self.max_queued:
+                raise JobRejected(f"The job queue is full ({self.max_queued} jobs); try again shortly")
+            if sum(job.session_id == session_id for job in active) >= self.max_per_session:
+                raise JobRejected(f"At most {self.max_per_session} background jobs per session")
+            job = Job(uuid.uuid4().hex[:12], session_id, kind, chunk_args)
+            self.jobs[job.id] = job
+            self._prune()
+            self._dispatch()
+        return job.id
+
+    def _dispatch(self):
+        # Fill free worker slots with the next chunk of the job that waited longest
+        while self._in_flight < self.max_workers:
+            waiting = [job for job in self.jobs.values()
+                       if job.status in ACTIVE and job.next_chunk < len(job.chunk_args)]
+            if not waiting:
+                return
+            job = min(waiting, key=lambda job: self._last_turn.get(job.id, -1))
+            self._last_turn[job.id] = next(self._turns)
+            index = job.next_chunk
+            job.next_chunk += 1
+            job.in_flight += 1
+            job.status = 'running'
+            self._in_flight += 1
+            future = self._pool().submit(TASKS[job.kind][0], *job.chunk_args[index])
+            future.add_done_callback(partial(self._chunk_done, job, index))
+
+    def _chunk_done(self, job, index, future):
+        with self._lock:
+            self._in_flight -= 1
+            job.in_flight -= 1
+            if job.status in ACTIVE:
+                error = future.exception()
+                if error is not None:
+                    job.status, job.error, job.finished = 'failed', repr(error), time.time()
+                else:
+                    merge = TASKS[job.kind][2]
+                    if merge is None:
+                        job.chunk_results[index] = future.result()
+                    else:
+                        # Partial results are readable while the job runs
+                        job.result = merge(job.result, future.result())
+                    job.completed += 1
+                    if job.completed == len(job.chunk_args):
+                        if merge is None:
+                            job.result = concatenate_chunks(job.chunk_results)
+                        job.chunk_results = None
+                        job.status, job.finished = 'done', time.time()
+            self._dispatch()
+
+    def cancel(self, job_id):
+        # Chunks already in a worker run to completion; their results are dropped
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in ACTIVE:
+                return False
+            job.status, job.finished = 'cancelled', time.time()
+            job.chunk_results = None
+            return True
+
+    def session_jobs(self, session_id):
+        with self._lock:
+            return [job for job in self.jobs.values() if job.session_id == session_id]
+
+    def forget(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.status not in ACTIVE:
+                del self.jobs[job_id]
+                self._last_turn.pop(job_id, None)
+
+    def _prune(self):
+        # Drop the oldest finished jobs beyond `keep_finished`
+        finished = sorted((job for job in self.jobs.values() if job.status not in ACTIVE), key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            self.forget(job.id)
+
+    def shutdown(self):
+        with self._lock:
+            for job in self.jobs.values():
+                if job.status in ACTIVE:
+                    job.status = 'cancelled'
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,147 @@
+"""Headline metrics for live recalculation while the form is being edited.
+
+headline() runs the model for one project and keeps LCoE, NPV, IRR and
+payback. A Surrogate answers the same question in microseconds from a grid
+of those metrics precomputed over common input ranges, by multilinear
+interpolation.
+
+The grid axes are ratios that make the metrics independent of the currency
+and of the project size: capex and O&M in kWh of the base tariff, and the
+specific yield (kWh per kWp in year 1). NPV and LCoE scale back with the
+tariff and the capacity; IRR and payback do not change. NPV is linear in
+each of these axes, so only its dependence on the discount rate is
+approximated. Project life, degradation and escalation stay fixed per grid,
+so a grid is built for each combination of them that is used. Building one
+takes about half a second, so grids are built on a background thread and
+estimate() answers None until the grid it needs is ready.
+"""
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from solar_fin import model
+
+HEADLINE = ('lcoe', 'npv', 'irr', 'payback_period')
+
+# Common ranges of the grid axes; inputs outside them go to the model
+SURROGATE_AXES = {
+    'capex_ratio': np.geomspace(1.0, 64.0, 41),        # initial investment per Wp / tariff per kWh
+    'o_and_m_ratio': np.linspace(0.0, 400.0, 5),       # O&M per kWp per year / tariff per kWh
+    'specific_yield': np.geomspace(500.0, 2500.0, 13),  # kWh per kWp in year 1
+    'discount_rate': np.linspace(0.0, 0.2, 21),
+}
+# Inputs the grid holds fixed
+FIXED_PARAMETERS = ('project_life', 'yearly_degradation', 'o_and_m_escalation', 'electricity_tariff_escalation', 'escalation_years')
+
+
+def headline(inputs):
+    """LCoE, NPV, IRR (a fraction, 0.05 for 5%) and payback (years) of one project, from the model."""
+    results = model.evaluate(inputs)
+    return {name: float(results[name][0]) for name in HEADLINE}
+
+
+def surrogate_point(inputs):
+    """(fixed parameters, axis values, tariff, capacity) of one project, or None when
+    the surrogate does not cover its inputs."""
+    if any(inputs.get(name) is not None for name in model.INDEX_PARAMETERS + ('capex_events', 'battery', 'metering')):
+        return None
+    # Exchange rates fold into the costs while they are constant over the years
+    fx = {}
+    for name in model.FX_PARAMETERS:
+        values = np.ravel(inputs.get(name, 1.0))
+        if len(values) == 0 or np.ptp(values) > 0:
+            return None
+        fx[name] = float(values[0])
+    tariff = float(inputs['electricity_cost']) * fx['tariff_fx']
+    capacity = float(inputs['project_capacity'])
+    if tariff <= 0 or capacity <= 0:
+        return None
+    point = (
+        float(inputs['initial_investment']) * fx['capex_fx'] / tariff,
+        float(inputs['o_and_m_cost']) * fx['o_and_m_fx'] / tariff,
+        float(inputs['energy_generation_first_year']) / capacity,
+        float(inputs['discount_rate']),
+    )
+    if not all(axis[0] <= value <= axis[-1] for axis, value in zip(SURROGATE_AXES.values(), point)):
+        return None
+    fixed = tuple(int(inputs[name]) if name in model.INTEGER_PARAMETERS else float(inputs[name]) for name in FIXED_PARAMETERS)
+    return fixed, point, tariff, capacity
+
+
+class Surrogate:
+    """Headline metrics of 1 kWp at a tariff of 1 over SURROGATE_AXES, for fixed parameters."""
+
+    def __init__(self, fixed):
+        self.fixed = fixed
+        self.axes = list(SURROGATE_AXES.values())
+        grids = np.meshgrid(*self.axes, indexing='ij')
+        inputs = dict(zip(FIXED_PARAMETERS, fixed))
+        inputs.update(
+            initial_investment=grids[0].ravel(),
+            o_and_m_cost=grids[1].ravel(),
+            energy_generation_first_year=grids[2].ravel(),
+            discount_rate=grids[3].ravel(),
+            electricity_cost=1.0,
+            project_capacity=1.0,
+        )
+        results = model.evaluate(inputs)
+        shape = grids[0].shape
+        self.tables = {name: results[name].reshape(shape) for name in HEADLINE}
+        self.corners = np.array(list(itertools.product((0, 1), repeat=len(self.axes))))
+
+    def __call__(self, point, tariff=1.0, capacity=1.0):
+        # Cell of the point on every axis and its position within the cell
+        cell, weight = [], []
+        for axis, value in zip(self.axes, point):
+            i = min(max(int(np.searchsorted(axis, value, side='right')) - 1, 0), len(axis) - 2)
+            cell.append(i)
+            weight.append((value - axis[i]) / (axis[i + 1] - axis[i]))
+        cell, weight = np.array(cell), np.array(weight)
+        index = tuple((cell + self.corners).T)
+        corner_weights = np.where(self.corners, weight, 1 - weight).prod(axis=1)
+        metrics = {}
+        for name, table in self.tables.items():
+            values = table[index]
+            # A cell touching IRR without a root or payback never reached is not interpolated
+            metrics[name] = float(corner_weights @ values) if np.isfinite(values).all() else np.nan
+        metrics['npv'] *= tariff * capacity
+        metrics['lcoe'] *= tariff
+        return metrics
+
+
+MAX_SURROGATES = 8
+_builder = ThreadPoolExecutor(1, thread_name_prefix='surrogate')
+_builds = OrderedDict()  # fixed parameters: future of their Surrogate, least recently used first
+_builds_lock = threading.Lock()
+
+
+def prepare(fixed):
+    """Future of the Surrogate for a tuple of FIXED_PARAMETERS values, building it in the background if needed."""
+    with _builds_lock:
+        if fixed not in _builds:
+            _builds[fixed] = _builder.submit(Surrogate, fixed)
+            while len(_builds) > MAX_SURROGATES:
+                _builds.popitem(last=False)
+        _builds.move_to_end(fixed)
+        return _builds[fixed]
+
+
+def surrogate(fixed):
+    """The Surrogate for a tuple of FIXED_PARAMETERS values, waiting for it to be built."""
+    return prepare(fixed).result()
+
+
+def estimate(inputs):
+    """Headline metrics from the surrogate, or None when it does not cover `inputs` or its
+    grid is still being built. Metrics the grid cannot interpolate there are NaN."""
+    covered = surrogate_point(inputs)
+    if covered is None:
+        return None
+    fixed, point, tariff, capacity = covered
+    build = prepare(fixed)
+    if not build.done() or build.exception() is not None:
+        return None
+    return build.result()(point, tariff, capacity)
@@ -0,0 +1,163 @@
+"""Self-consumption and net metering against a customer load profile.
+
+PV output in hour h of a year is the year's generation g times the PV shape
+s_h, so the energy used on site, sum_h min(g * s_h, load_h), is a piecewise
+linear function of g alone. For each month it is built once per (load, PV
+shape) pair from the hours sorted by load_h / s_h, cached, and evaluated for
+every project year with one searchsorted, instead of taking minima over
+(projects, years, 8760) arrays.
+
+Exports are paid at the export tariff; the banking rule decides how much of
+them first offsets imports at the retail tariff: not at all (net billing),
+within each month, or carried forward month to month until the end of the
+year.
+
+With a battery (solar_fin.battery), the hours it charges or discharges in
+are simulated hour by hour with the load, and the curves cover the others.
+"""
+import functools
+
+import numpy as np
+
+from solar_fin import battery as storage, profiles
+
+BANKING = ('none', 'monthly', 'annual')
+DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+MONTH_STARTS = np.concatenate([[0], np.cumsum(DAYS_IN_MONTH) * 24])
+HOUR_MONTH = np.repeat(np.arange(12), np.diff(MONTH_STARTS))
+
+
+def net_metering(load, export_tariff, banking='none', pv_profile=None):
+    """Model input for metering against `load` (kWh per hour, (8760,) for every project or (N, 8760)).
+
+    `export_tariff` is the price of exported energy in the tariff currency
+    (one value or one per project); it escalates like the retail tariff.
+    """
+    if banking not in BANKING:
+        raise ValueError(f"Unknown banking rule {banking!r}; expected one of {', '.join(BANKING)}")
+    load = np.asarray(load, dtype=float)
+    if load.shape[-1] != profiles.HOURS or load.ndim > 2:
+        raise ValueError("A load profile needs 8760 hourly values per project")
+    return {
+        'load': load,
+        'export_tariff': export_tariff,
+        'banking': banking,
+        'pv_profile': profiles.solar_profile() if pv_profile is None else profiles.normalized(pv_profile),
+    }
+
+
+def select(metering, start, stop, n):
+    # The settings of projects start..stop-1 of an n-project batch
+    selected = dict(metering)
+    if metering['load'].ndim == 2:
+        selected['load'] = metering['load'][start:stop]
+    if np.ndim(metering['export_tariff']) == 1 and len(metering['export_tariff']) == n:
+        selected['export_tariff'] = metering['export_tariff'][start:stop]
+    return selected
+
+
+@functools.lru_cache(maxsize=1024)
+def _curves(load_bytes, pv_bytes):
+    # Per month: (sorted load/PV ratios, cumulative load, cumulative PV shape, month load, month PV shape)
+    load = np.frombuffer(load_bytes)
+    shape = np.frombuffer(pv_bytes)
+    curves = []
+    for start, stop in zip(MONTH_STARTS[:-1], MONTH_STARTS[1:]):
+        month_load, month_shape = load[start:stop], shape[start:stop]
+        sunny = month_shape > 0
+        ratio = month_load[sunny] / month_shape[sunny]
+        order = np.argsort(ratio)
+        curves.append((
+            ratio[order],
+            np.concatenate([[0.0], np.cumsum(month_load[sunny][order])]),
+            np.concatenate([[0.0], np.cumsum(month_shape[sunny][order])]),
+            month_load.sum(),
+            month_shape.sum(),
+        ))
+    return curves
+
+
+def curves(load, pv_profile):
+    """Cached monthly self-consumption curves of one load profile and PV shape."""
+    # Keyed by content, so a re-uploaded or re-parsed profile hits the cache
+    return _curves(np.ascontiguousarray(load, dtype=float).tobytes(), np.ascontiguousarray(pv_profile, dtype=float).tobytes())
+
+
+def monthly_flows(generation, load, pv_profile):
+    """Self-consumed, exported and imported kWh per month for yearly generation (rows,): (rows, 12) each."""
+    generation = np.asarray(generation, dtype=float)
+    self_consumed, exported, imported = (np.empty((len(generation), 12)) for _ in range(3))
+    for month, (ratio, cumulative_load, cumulative_shape, month_load, month_shape) in enumerate(curves(load, pv_profile)):
+        # Hours with load/PV ratio <= g are limited by the load, the others by PV
+        k = np.searchsorted(ratio, generation, side='right')
+        used = cumulative_load[k] + generation * (cumulative_shape[-1] - cumulative_shape[k])
+        self_consumed[:, month] = used
+        exported[:, month] = generation * month_shape - used
+        imported[:, month] = month_load - used
+    return self_consumed, exported, imported
+
+
+def settle(exported, imported, banking):
+    # Exported kWh that offset imports, and exported kWh paid at the export tariff, per row
+    if banking == 'none':
+        return np.zeros(len(exported)), exported.sum(axis=1)
+    if banking == 'monthly':
+        offset = np.minimum(exported, imported)
+        return offset.sum(axis=1), (exported - offset).sum(axis=1)
+    bank = np.zeros(len(exported))
+    offset = np.zeros(len(exported))
+    for month in range(exported.shape[1]):
+        available = bank + exported[:, month]
+        used = np.minimum(available, imported[:, month])
+        offset += used
+        bank = available - used
+    return offset, bank
+
+
+def simulate(generation, metering, electricity_cost, battery=None, battery_capacity=None):
+    """Metering of every project year: generation (N, years) kWh, `metering` from net_metering().
+
+    With a battery (`battery` from solar_fin.battery.battery() and its faded
+    capacity (N, years) from solar_fin.battery.simulate()), what it
+    stores PV the load does not use and serves the load PV leaves.
+
+    Returns (N, years) arrays: generation_value (kWh at the retail tariff
+    giving the same revenue), self_consumed, exported and imported, and with
+    a battery battery_charged and battery_discharged of that dispatch.
+    """
+    n, years = generation.shape
+    if battery is not None:
+        charge, discharge = storage.dispatch_hours(metering['pv_profile'], battery['tariff_profile'])
+        idle = ~(charge | discharge)
+    load = metering['load']
+    outputs = {name: np.zeros((n, years)) for name in ('self_consumed', 'exported', 'imported', 'offset', 'paid')}
+    if battery is not None:
+        outputs.update(battery_charged=np.zeros((n, years)), battery_discharged=np.zeros((n, years)))
+    # Projects sharing a load profile are evaluated together
+    if load.ndim == 1:
+        groups = {None: (list(range(n)), load)}
+    else:
+        groups = {}
+        for row, profile in enumerate(load):
+            groups.setdefault(profile.tobytes(), ([], profile))[0].append(row)
+    for rows, profile in groups.values():
+        if battery is None:
+            self_consumed, exported, imported = monthly_flows(generation[rows].ravel(), profile, metering['pv_profile'])
+        else:
+            # Curves for the hours the battery is idle, the dispatch loop for the others
+            self_consumed, exported, imported = monthly_flows(generation[rows].ravel(), profile * idle, metering['pv_profile'] * idle)
+            settings = {name: np.repeat(np.broadcast_to(np.asarray(battery[name], dtype=float), n)[rows], years)
+                        for name in ('power', 'efficiency')}
+            flows = storage.metered_flows(generation[rows].ravel(), profile, metering['pv_profile'], HOUR_MONTH,
+                                          dict(battery, **settings), battery_capacity[rows].ravel())
+            self_consumed, exported, imported = self_consumed + flows[0], exported + flows[1], imported + flows[2]
+            for name, values in (('battery_charged', flows[3]), ('battery_discharged', flows[4])):
+                outputs[name][rows] = values.reshape(len(rows), years)
+        offset, paid = settle(exported, imported, metering['banking'])
+        for name, values in (('self_consumed', self_consumed.sum(axis=1)), ('exported', exported.sum(axis=1)),
+                             ('imported', imported.sum(axis=1)), ('offset', offset), ('paid', paid)):
+            outputs[name][rows] = values.reshape(len(rows), years)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        export_ratio = np.nan_to_num(np.asarray(metering['export_tariff'], dtype=float) / electricity_cost)
+    value = outputs['self_consumed'] + outputs.pop('offset') + outputs.pop('paid') * np.reshape(export_ratio, (-1, 1))
+    return dict(outputs, generation_value=value)
@@ -0,0 +1,321 @@
+"""Vectorized cash-flow model for one or many solar PV projects.
+
+Every input broadcasts to a batch of N projects. Per-year outputs are
+(N, years) arrays where `years` is the longest project life in the batch;
+years beyond a project's own life are zero. A single form submission is
+simply a batch of one.
+"""
+import numpy as np
+
+from solar_fin import environment, escalation, payback
+from solar_fin.battery import simulate as simulate_battery
+from solar_fin.capex_events import event_costs, event_table, sample as sample_events
+from solar_fin.metering import simulate as simulate_metering
+
+# Inputs in the same units as the Streamlit form
+PARAMETERS = (
+    'initial_investment',             # per Wp
+    'project_capacity',               # kWp
+    'o_and_m_cost',                   # per kWp per year
+    'electricity_cost',               # per kWh
+    'project_life',                   # years
+    'energy_generation_first_year',   # kWh
+    'yearly_degradation',             # %
+    'o_and_m_escalation',             # %
+    'electricity_tariff_escalation',  # %
+    'escalation_years',               # years between escalation steps
+    'discount_rate',                  # fraction, e.g. 0.05
+)
+
+INTEGER_PARAMETERS = ('project_life', 'escalation_years')
+
+# Optional conversion into the reporting currency (see solar_fin.fx): capex_fx is
+# per project at t = 0; o_and_m_fx and tariff_fx are per project (N,) or per
+# project and year (N, years). All default to 1 (everything in one currency).
+FX_PARAMETERS = ('capex_fx', 'o_and_m_fx', 'tariff_fx')
+
+# Optional per-year indices, (1, years) or (N, years): tariff and O&M prices
+# from solar_fin.escalation, generation multipliers from solar_fin.degradation.
+# When left out, the escalation rate and period give the step schedule and
+# yearly_degradation a constant compounding loss.
+INDEX_PARAMETERS = ('tariff_index', 'o_and_m_index', 'generation_index')
+
+
+def broadcast_inputs(inputs):
+    # Broadcast scalars and 1-D arrays to a common (N,) batch
+    arrays = {name: np.atleast_1d(np.asarray(inputs[name], dtype=float)) for name in PARAMETERS}
+    shape = np.broadcast_shapes(*(a.shape for a in arrays.values()))
+    if len(shape) != 1:
+        raise ValueError(f"Inputs must be scalars or 1-D arrays, got batch shape {shape}")
+    batch = {name: np.broadcast_to(a, shape) for name, a in arrays.items()}
+    for name in INTEGER_PARAMETERS:
+        batch[name] = batch[name].astype(int)
+    if (batch['project_life'] < 1).any() or (batch['escalation_years'] < 1).any():
+        raise ValueError("project_life and escalation_years must be at least 1")
+    for name in FX_PARAMETERS:
+        batch[name] = np.atleast_1d(np.asarray(inputs.get(name, 1.0), dtype=float))
+    for name in INDEX_PARAMETERS:
+        batch[name] = None if inputs.get(name) is None else np.atleast_2d(np.asarray(inputs[name], dtype=float))
+    # Optional lumpy capex (solar_fin.capex_events); None keeps the cash flow free of event work
+    batch['capex_events'] = None if inputs.get('capex_events') is None else event_table(inputs['capex_events'])
+    # Optional battery (solar_fin.battery.battery()) and load-profile metering (solar_fin.metering.net_metering())
+    batch['battery'] = inputs.get('battery')
+    batch['metering'] = inputs.get('metering')
+    return batch
+
+
+def per_year(values):
+    # (N,) per-project values or (N, years) matrices, as something that broadcasts against (N, years)
+    return values[:, None] if values.ndim == 1 else values
+
+
+def npv(rate, cash_flows):
+    # Same convention as npf.npv: the first column is undiscounted (t = 0)
+    cash_flows = np.atleast_2d(cash_flows)
+    t = np.arange(cash_flows.shape[1])
+    discount = (1 + np.asarray(rate, dtype=float).reshape(-1, 1)) ** -t
+    return (cash_flows * discount).sum(axis=1)
+
+
+# Rates scanned for a sign change of the NPV when Newton's method does not converge
+IRR_BRACKETS = np.concatenate([np.linspace(-0.999, -0.01, 100), np.linspace(0.0, 1.0, 101)[:-1], np.geomspace(1.0, 1e4, 50)])
+
+
+def _bisect_irr(cash_flows, tol):
+    # Roots of rows Newton missed: the sign change of the NPV over IRR_BRACKETS nearest to zero,
+    # then bisection. NaN where the NPV never changes sign.
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        values = np.stack([npv(np.full(len(cash_flows), rate), cash_flows) for rate in IRR_BRACKETS], axis=1)
+    change = np.sign(values[:, :-1]) * np.sign(values[:, 1:]) < 0
+    midpoints = (IRR_BRACKETS[:-1] + IRR_BRACKETS[1:]) / 2
+    nearest = np.where(change, np.abs(midpoints), np.inf).argmin(axis=1)
+    found = change.any(axis=1)
+    low, high = IRR_BRACKETS[nearest], IRR_BRACKETS[nearest + 1]
+    low_sign = np.sign(values[np.arange(len(values)), nearest])
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        for _ in range(200):
+            middle = (low + high) / 2
+            same = np.sign(npv(middle, cash_flows)) == low_sign
+            low, high = np.where(same, middle, low), np.where(same, high, middle)
+            if np.all(high - low < tol):
+                break
+    return np.where(found, (low + high) / 2, np.nan)
+
+
+def irr(cash_flows, guess=0.1, tol=1e-10, max_iter=100):
+    # Row-wise Newton iteration on the NPV polynomial in v = 1 / (1 + rate),
+    # evaluated with Horner's rule. Rows drop out as soon as they converge.
+    # Rows that do not converge (IRRs far from the guess, such as deep
+    # losses) fall back to a bracketed bisection; NaN only where there is no
+    # sign change.
+    cash_flows = np.atleast_2d(np.asarray(cash_flows, dtype=float))
+    # Leading zero years (a group starting late on a shared calendar axis) do not change the IRR but
+    # give a false root at huge rates, where they discount everything to zero: start every row at
+    # its first cash flow
+    first = (cash_flows != 0).argmax(axis=1)
+    if first.any():
+        t = first[:, None] + np.arange(cash_flows.shape[1])
+        inside = t < cash_flows.shape[1]
+        cash_flows = np.where(inside, np.take_along_axis(cash_flows, np.minimum(t, cash_flows.shape[1] - 1), axis=1), 0.0)
+    columns = np.ascontiguousarray(cash_flows.T[::-1])  # highest power first
+    rate = np.full(cash_flows.shape[0], guess)
+    pending = np.arange(cash_flows.shape[0])
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        for _ in range(max_iter):
+            if pending.size == 0:
+                break
+            v = 1 / (1 + rate[pending])
+            value = np.zeros_like(v)
+            derivative = np.zeros_like(v)
+            for column in columns[:, pending]:
+                derivative = derivative * v + value
+                value = value * v + column
+            slope = -derivative * v ** 2
+            step = np.where(slope != 0, value / slope, 0.0)
+            rate[pending] = np.maximum(rate[pending] - step, -0.999)
+            pending = pending[np.abs(step) >= tol]
+        residual = np.abs(npv(rate, cash_flows))
+        # Relative to the discounted cash flows, so a rate where discounting alone makes the NPV small is not a root
+        scale = npv(rate, np.abs(cash_flows))
+    has_root = (cash_flows.min(axis=1) < 0) & (cash_flows.max(axis=1) > 0)
+    converged = (residual <= 1e-6 * scale) & np.isfinite(rate)
+    missed = has_root & ~converged
+    if missed.any():
+        rate[missed] = _bisect_irr(cash_flows[missed], tol)
+        converged = converged | missed
+    return np.where(has_root & converged, rate, np.nan)
+
+
+# Model stages, in dependency order. Each takes the outputs of its upstream
+# stages by name plus the input parameters it uses, so evaluate() and the
+# memoizing calculation graph share one implementation.
+
+def timeline_stage(project_life):
+    years = np.arange(1, project_life.max() + 1)
+    return {'years': years, 'active': years[None, :] <= project_life[:, None]}
+
+
+def generation_stage(timeline, energy_generation_first_year, yearly_degradation, generation_index):
+    if generation_index is None:
+        degradation = yearly_degradation[:, None] / 100
+        generation = energy_generation_first_year[:, None] * (1 - degradation) ** (timeline['years'] - 1) * timeline['active']
+        return {'generation': generation, 'degradation': generation * degradation}
+    index = per_year(generation_index)
+    # Share of each year's output lost by the next year; the last year repeats the one before
+    ratio = np.divide(index[:, 1:], index[:, :-1], out=np.ones_like(index[:, 1:]), where=index[:, :-1] > 0)
+    loss = 1 - np.concatenate([ratio, ratio[:, -1:] if ratio.shape[1] else np.ones_like(index)], axis=1)
+    generation = energy_generation_first_year[:, None] * index * timeline['active']
+    return {'generation': generation, 'degradation': generation * loss}
+
+
+def storage_stage(timeline, generation, battery, project_capacity):
+    if battery is None:
+        return {'storage_value': None, 'battery_capex': None}
+    storage = simulate_battery(generation['generation'], battery)
+    storage['storage_value'] = storage['storage_value'] * timeline['active']
+    battery_size = np.broadcast_to(np.asarray(battery['capacity'], dtype=float), project_capacity.shape)
+    storage['battery_capex'] = battery_size * np.asarray(battery['cost'], dtype=float)
+    return storage
+
+
+def metering_stage(generation, storage, metering, electricity_cost, battery):
+    if metering is None:
+        return {'generation_value': None}
+    # A battery is dispatched against the load, so its value is in the metered flows
+    return simulate_metering(generation['generation'], metering, electricity_cost, battery,
+                             None if battery is None else storage['battery_capacity'])
+
+
+def revenue_stage(timeline, generation, storage, metering, electricity_cost, electricity_tariff_escalation, escalation_years, tariff_fx, tariff_index):
+    if tariff_index is None:
+        tariff_index = escalation.step_index(timeline['years'], electricity_tariff_escalation, escalation_years)
+    tariff = electricity_cost[:, None] * tariff_index * per_year(tariff_fx)
+    # Energy valued at the retail tariff: what metering credits PV and battery at, else all generation
+    # plus the battery's arbitrage gain
+    if metering['generation_value'] is not None:
+        energy = metering['generation_value']
+    else:
+        energy = generation['generation']
+        if storage['storage_value'] is not None:
+            energy = energy + storage['storage_value']
+    gross_revenue = energy * tariff
+    return {'gross_revenue': gross_revenue, 'total_revenue': gross_revenue.sum(axis=1)}
+
+
+def o_and_m_stage(timeline, o_and_m_cost, o_and_m_escalation, escalation_years, project_capacity, o_and_m_fx, o_and_m_index):
+    if o_and_m_index is None:
+        o_and_m_index = escalation.step_index(timeline['years'], o_and_m_escalation, escalation_years)
+    o_and_m_rate = o_and_m_cost[:, None] * o_and_m_index * per_year(o_and_m_fx)
+    o_and_m = o_and_m_rate * project_capacity[:, None] * timeline['active']
+    return {'o_and_m': o_and_m, 'total_o_and_m_cost': o_and_m.sum(axis=1)}
+
+
+def events_stage(timeline, capex_events, capex_fx):
+    # Expected event costs in the reporting currency, within each project's life
+    active = timeline['active']
+    costs = None if capex_events is None else event_costs(capex_events, active.shape[0], active.shape[1])
+    if costs is None:
+        return {'event_costs': None, 'total_event_cost': np.zeros(active.shape[0])}
+    costs = costs * per_year(capex_fx) * active
+    return {'event_costs': costs, 'total_event_cost': costs.sum(axis=1)}
+
+
+def cash_flow_stage(timeline, revenue, o_and_m, events, storage, initial_investment, project_capacity, capex_fx):
+    active = timeline['active']
+    net_cash_flow = revenue['gross_revenue'] - o_and_m['o_and_m']
+    if events['event_costs'] is not None:
+        net_cash_flow = net_cash_flow - events['event_costs']
+    initial_investment_total = initial_investment * project_capacity * 1000 * capex_fx  # kWp to Wp
+    if storage['battery_capex'] is not None:
+        initial_investment_total = initial_investment_total + storage['battery_capex'] * capex_fx
+    cash_flows = np.concatenate([-initial_investment_total[:, None], net_cash_flow], axis=1)
+    cumulative_cash_flow = np.cumsum(cash_flows, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annual_roi = net_cash_flow / initial_investment_total[:, None] * 100 * active
+    return {
+        'initial_investment_total': initial_investment_total,
+        'cash_flows': cash_flows,
+        'cumulative_cash_flow': cumulative_cash_flow,
+        'cumulative_net_revenue': cumulative_cash_flow[:, -1],
+        'payback_period': payback.payback_from_cumulative(cumulative_cash_flow),
+        'annual_roi': annual_roi,
+        'annual_average_roi': annual_roi.sum(axis=1) / active.sum(axis=1),
+    }
+
+
+def discounted_stage(timeline, generation, o_and_m, events, cash_flow, discount_rate):
+    discount = (1 + discount_rate[:, None]) ** -timeline['years']
+    lifetime_cost = cash_flow['initial_investment_total'] + (o_and_m['o_and_m'] * discount).sum(axis=1)
+    if events['event_costs'] is not None:
+        lifetime_cost = lifetime_cost + (events['event_costs'] * discount).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lcoe = lifetime_cost / (generation['generation'] * discount).sum(axis=1)
+    return {
+        'npv': npv(discount_rate, cash_flow['cash_flows']),
+        'lcoe': lcoe,
+        'discounted_payback_period': payback.discounted_payback(cash_flow['cash_flows'], discount_rate),
+    }
+
+
+def returns_stage(cash_flow):
+    return {'irr': irr(cash_flow['cash_flows'])}
+
+
+# name: (function, input parameters, upstream stages)
+STAGES = {
+    'timeline': (timeline_stage, ('project_life',), ()),
+    'generation': (generation_stage, ('energy_generation_first_year', 'yearly_degradation', 'generation_index'), ('timeline',)),
+    'storage': (storage_stage, ('battery', 'project_capacity'), ('timeline', 'generation')),
+    'metering': (metering_stage, ('metering', 'electricity_cost', 'battery'), ('generation', 'storage')),
+    'revenue': (revenue_stage, ('electricity_cost', 'electricity_tariff_escalation', 'escalation_years', 'tariff_fx', 'tariff_index'), ('timeline', 'generation', 'storage', 'metering')),
+    'o_and_m': (o_and_m_stage, ('o_and_m_cost', 'o_and_m_escalation', 'escalation_years', 'project_capacity', 'o_and_m_fx', 'o_and_m_index'), ('timeline',)),
+    'events': (events_stage, ('capex_events', 'capex_fx'), ('timeline',)),
+    'cash_flow': (cash_flow_stage, ('initial_investment', 'project_capacity', 'capex_fx'), ('timeline', 'revenue', 'o_and_m', 'events', 'storage')),
+    'discounted': (discounted_stage, ('discount_rate',), ('timeline', 'generation', 'o_and_m', 'events', 'cash_flow')),
+    'returns': (returns_stage, (), ('cash_flow',)),
+}
+
+
+def evaluate(inputs, emission_factors=None):
+    """Run the cash-flow model for a batch of projects.
+
+    `inputs` maps every name in PARAMETERS to a scalar or (N,) array, plus
+    optionally the FX_PARAMETERS from solar_fin.fx.fx_inputs() and the
+    INDEX_PARAMETERS from solar_fin.escalation and solar_fin.degradation and
+    'capex_events' from solar_fin.capex_events, 'battery' from
+    solar_fin.battery and 'metering' from solar_fin.metering. When
+    `emission_factors` (kg CO2/kWh, broadcastable to (N, years)) is given,
+    the environmental impacts are added to the result from the same
+    generation matrix.
+    """
+    batch = broadcast_inputs(inputs)
+    stages = {}
+    for name, (function, params, upstream) in STAGES.items():
+        stages[name] = function(**{dep: stages[dep] for dep in upstream}, **{param: batch[param] for param in params})
+
+    results = {'inputs': batch}
+    for outputs in stages.values():
+        results.update(outputs)
+    if emission_factors is not None:
+        results.update(environment.environmental_impacts(results['generation'], emission_factors))
+    return results
+
+
+def monte_carlo(inputs, n_samples, spreads, seed=None, emission_factors=None):
+    """Sample inputs around a base case and evaluate them as one batch.
+
+    `spreads` maps parameter names to a relative standard deviation, e.g.
+    {'electricity_cost': 0.1}. Uncertain capex events are drawn per sample.
+    Returns (sampled_inputs, results).
+    """
+    rng = np.random.default_rng(seed)
+    sampled = {name: np.full(n_samples, float(np.asarray(inputs[name]))) for name in PARAMETERS}
+    for name, spread in spreads.items():
+        if name not in PARAMETERS or name in INTEGER_PARAMETERS:
+            raise ValueError(f"Cannot sample parameter {name!r}")
+        sampled[name] = np.maximum(sampled[name] * (1 + spread * rng.standard_normal(n_samples)), 0.0)
+    # FX curves and per-year indices are shared by every sample
+    shared = {name: inputs[name] for name in FX_PARAMETERS + INDEX_PARAMETERS + ('battery', 'metering') if inputs.get(name) is not None}
+    if inputs.get('capex_events') is not None:
+        shared['capex_events'] = sample_events(event_table(inputs['capex_events']), n_samples, rng)
+    return sampled, evaluate(dict(sampled, **shared), emission_factors=emission_factors)
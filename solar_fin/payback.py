@@ -0,0 +1,56 @@
+"""Simple and discounted payback for whole cash-flow matrices.
+
+Cash flows are (N, T + 1) with the investment at t = 0 in the first column.
+Payback is the fractional time at which the cumulative (optionally
+discounted) cash flow first reaches zero, interpolated linearly within the
+year. Rows that never get there return NEVER (infinity), which sorts after
+every real payback and survives percentiles, so batch and Monte Carlo
+results need no per-row handling.
+"""
+import numpy as np
+
+NEVER = np.inf
+
+
+def payback_from_cumulative(cumulative_cash_flow):
+    """Fractional payback in years from cumulative cash flows (N, T + 1) starting at t = 0."""
+    cumulative = np.atleast_2d(np.asarray(cumulative_cash_flow, dtype=float))
+    reached = cumulative >= 0
+    idx = reached.argmax(axis=1)
+    rows = np.arange(cumulative.shape[0])
+    previous = cumulative[rows, np.maximum(idx - 1, 0)]
+    current = cumulative[rows, idx]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = -previous / (current - previous)
+    years = np.where(idx > 0, idx - 1 + fraction, 0.0)
+    return np.where(reached.any(axis=1), years, NEVER)
+
+
+def simple_payback(cash_flows):
+    return payback_from_cumulative(np.cumsum(np.atleast_2d(cash_flows), axis=1))
+
+
+def discounted_payback(cash_flows, rate):
+    # Same convention as model.npv: the t = 0 column is not discounted
+    cash_flows = np.atleast_2d(np.asarray(cash_flows, dtype=float))
+    t = np.arange(cash_flows.shape[1])
+    discounted = cash_flows * (1 + np.asarray(rate, dtype=float).reshape(-1, 1)) ** -t
+    return payback_from_cumulative(np.cumsum(discounted, axis=1))
+
+
+def years_and_months(payback_years):
+    """Whole years and months of a payback array; -1 for both where it is NEVER."""
+    payback_years = np.asarray(payback_years, dtype=float)
+    never = ~np.isfinite(payback_years)
+    known = np.where(never, 0.0, payback_years)
+    years = np.floor(known)
+    months = np.floor((known - years) * 12 + 1e-9)
+    return np.where(never, -1, years).astype(int), np.where(never, -1, months).astype(int)
+
+
+def describe(payback_years):
+    # Text for one project's payback, as shown on the page and in the PDF
+    years, months = years_and_months(payback_years)
+    if years < 0:
+        return "Never within the project life"
+    return f"{years} years and {months} months"
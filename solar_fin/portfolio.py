@@ -0,0 +1,227 @@
+"""Portfolio roll-up of projects on a shared calendar-year axis.
+
+Each project's per-year arrays go on one axis of calendar years by offset
+indexing. Column t of a project's cash flows (t = 0 is the investment) lands
+at calendar year start_year - 1 + t. Here start_year is the calendar year of
+the first operating year, as in environment.emission_factor_curve(). So
+projects with any start year and project life add up column by column. A
+project on its own keeps its own NPV and IRR.
+
+A Portfolio keeps running calendar-year sums for every group of every
+grouping: the whole portfolio, grid region, client and commissioning year.
+Adding a project adds its rows to the sums of its groups. Replacing or
+removing a project subtracts its old rows. Nothing is recomputed from the
+other projects. The IRRs of the combined cash flows are solved for all
+groups at once with model.irr().
+"""
+import numpy as np
+import pandas as pd
+
+from solar_fin import environment, model
+
+# Per-year series, each with a t = 0 column (zero except for cash flows)
+SERIES = ('cash_flow', 'generation', 'gross_revenue', 'o_and_m', 'co2_saved_tonnes')
+GROUPINGS = ('portfolio', 'region', 'client', 'commissioning_year')
+PORTFOLIO = 'Portfolio'  # the one group of the 'portfolio' grouping
+
+
+class _Groups:
+    """Running calendar-year sums of one grouping, one row per group label."""
+
+    def __init__(self, years, capacity=4):
+        self.labels = []
+        self.index = {}
+        self.sums = {name: np.zeros((capacity, years)) for name in SERIES}
+        self.projects = np.zeros(capacity, dtype=int)
+        self.capacity = np.zeros(capacity)
+        self.npv = np.zeros(capacity)
+
+    def rows(self, labels):
+        # Row of every label, adding rows (doubling the arrays) for new ones
+        for label in labels:
+            if label not in self.index:
+                self.index[label] = len(self.labels)
+                self.labels.append(label)
+        size = len(self.npv)
+        if len(self.labels) > size:
+            size = max(len(self.labels), size * 2)
+            for name, sums in self.sums.items():
+                grown = np.zeros((size, sums.shape[1]))
+                grown[:len(sums)] = sums
+                self.sums[name] = grown
+            for name in ('projects', 'capacity', 'npv'):
+                column = getattr(self, name)
+                grown = np.zeros(size, dtype=column.dtype)
+                grown[:len(column)] = column
+                setattr(self, name, grown)
+        return np.array([self.index[label] for label in labels], dtype=int)
+
+    def widen(self, before, after):
+        # Add `before` calendar years at the start of the axis and `after` at the end
+        for name, sums in self.sums.items():
+            self.sums[name] = np.pad(sums, ((0, 0), (before, after)))
+
+
+class Portfolio:
+    def __init__(self, groupings=GROUPINGS):
+        self.first_year = None  # calendar year of the first column
+        self.years = 0
+        self.projects = {}  # key: (investment year, project life, (series, years + 1) values, labels, capacity, npv)
+        self.groups = {grouping: _Groups(0) for grouping in groupings}
+
+    def __len__(self):
+        return len(self.projects)
+
+    def calendar_years(self):
+        if self.first_year is None:
+            return np.arange(0)
+        return np.arange(self.first_year, self.first_year + self.years)
+
+    def _cover(self, first, last):
+        # Widen the calendar axis to include the years first..last
+        if self.first_year is None:
+            self.first_year = first
+        before = max(self.first_year - first, 0)
+        after = max(last - (self.first_year + self.years - 1), 0)
+        if before or after:
+            for groups in self.groups.values():
+                groups.widen(before, after)
+            self.first_year -= before
+            self.years += before + after
+
+    def _apply(self, records, sign):
+        # Add (sign 1) or subtract (sign -1) the projects' rows from the sums of their groups
+        if not records:
+            return
+        invest_years = np.array([record[0] for record in records])
+        lives = np.array([record[1] for record in records])
+        width = int(lives.max()) + 1
+        values = np.zeros((len(SERIES), len(records), width))
+        for i, record in enumerate(records):
+            values[:, i, :record[2].shape[1]] = record[2]
+        capacity = np.array([record[4] for record in records])
+        npv = np.array([record[5] for record in records])
+        # Offset indexing: column t of project i goes to calendar column invest_year - first_year + t
+        t = np.arange(width)
+        columns = (invest_years - self.first_year)[:, None] + t
+        within = t <= lives[:, None]
+        for position, (grouping, groups) in enumerate(self.groups.items()):
+            rows = groups.rows([record[3][position] for record in records])
+            cells = (np.broadcast_to(rows[:, None], columns.shape)[within], columns[within])
+            for name, series in zip(SERIES, values):
+                np.add.at(groups.sums[name], cells, sign * series[within])
+            np.add.at(groups.projects, rows, sign)
+            np.add.at(groups.capacity, rows, sign * capacity)
+            np.add.at(groups.npv, rows, sign * npv)
+
+    def add(self, keys, start_years, values, lives, capacity, npv, regions, clients):
+        """Add or replace projects.
+
+        `values` maps every name in SERIES to an (N, years + 1) array with t = 0
+        in the first column. Values past a project's life are ignored. Projects
+        whose key is already in the portfolio are replaced.
+        """
+        keys = list(keys)
+        start_years = np.asarray(start_years, dtype=int).reshape(-1)
+        lives = np.asarray(lives, dtype=int).reshape(-1)
+        self.remove([key for key in keys if key in self.projects])
+        self._cover(int(start_years.min()) - 1, int((start_years + lives).max()) - 1)
+        stacked = np.stack([np.atleast_2d(np.asarray(values[name], dtype=float)) for name in SERIES], axis=1)
+        records = []
+        for i, key in enumerate(keys):
+            labels = tuple(
+                {'portfolio': PORTFOLIO, 'region': regions[i], 'client': clients[i] or 'No client',
+                 'commissioning_year': int(start_years[i])}[grouping]
+                for grouping in self.groups)
+            record = (int(start_years[i]) - 1, int(lives[i]), stacked[i, :, :lives[i] + 1].copy(), labels,
+                      float(np.ravel(capacity)[i]), float(np.ravel(npv)[i]))
+            self.projects[key] = record
+            records.append(record)
+        self._apply(records, 1)
+
+    def remove(self, keys):
+        self._apply([self.projects.pop(key) for key in keys if key in self.projects], -1)
+
+    def add_evaluated(self, keys, results, start_years, regions, clients, decarbonize=True):
+        """Add the projects of a model.evaluate() batch; CO2 savings follow each region's grid."""
+        generation = results['generation']
+        factors = environment.emission_factor_matrix(regions, start_years, generation.shape[1], decarbonize)
+        co2 = environment.environmental_impacts(generation, factors)['co2_saved_tonnes']
+        zero = np.zeros((len(generation), 1))
+        values = {
+            'cash_flow': results['cash_flows'],
+            'generation': np.hstack([zero, generation]),
+            'gross_revenue': np.hstack([zero, results['gross_revenue']]),
+            'o_and_m': np.hstack([zero, results['o_and_m']]),
+            'co2_saved_tonnes': np.hstack([zero, co2]),
+        }
+        inputs = results['inputs']
+        n = len(generation)
+        self.add(keys, np.broadcast_to(start_years, n), values, np.broadcast_to(inputs['project_life'], n),
+                 np.broadcast_to(inputs['project_capacity'], n), results['npv'], np.broadcast_to(regions, n), clients)
+
+    def add_proposal(self, proposal):
+        """Add a StoredProposal from store.ResultStore."""
+        inputs, result = proposal.inputs, proposal.result
+        yearly = result.yearly
+        factors = environment.emission_factor_curve(inputs['grid_region'], inputs['start_year'], len(yearly),
+                                                    inputs.get('grid_decarbonization', True))
+        co2 = environment.environmental_impacts(yearly['generation'][None, :], factors[None, :])['co2_saved_tonnes'][0]
+        values = {
+            'cash_flow': np.concatenate([[-result.initial_investment_total], yearly['cash_flow']]),
+            'generation': np.concatenate([[0.0], yearly['generation']]),
+            'gross_revenue': np.concatenate([[0.0], yearly['gross_revenue']]),
+            'o_and_m': np.concatenate([[0.0], yearly['o_and_m']]),
+            'co2_saved_tonnes': np.concatenate([[0.0], co2]),
+        }
+        self.add([proposal.key], [inputs['start_year']], values, [len(yearly)],
+                 [inputs['form']['project_capacity']], [result.npv], [inputs['grid_region']],
+                 [proposal.client_name or inputs['form'].get('client_name')])
+
+    def _active(self, grouping):
+        groups = self.groups[grouping]
+        rows = np.flatnonzero(groups.projects[:len(groups.labels)] > 0)
+        return groups, rows, [groups.labels[row] for row in rows]
+
+    def series(self, grouping='portfolio', name='cash_flow'):
+        """Calendar-year sums of one series, one row per group (groups x calendar years)."""
+        groups, rows, labels = self._active(grouping)
+        return pd.DataFrame(groups.sums[name][rows], index=pd.Index(labels, name=grouping), columns=self.calendar_years())
+
+    def irr(self, grouping='portfolio'):
+        """IRR (%) of each group's combined calendar-year cash flows, solved for all groups at once."""
+        groups, rows, labels = self._active(grouping)
+        return pd.Series(model.irr(groups.sums['cash_flow'][rows]) * 100, index=pd.Index(labels, name=grouping))
+
+    def summary(self, grouping='portfolio'):
+        """Totals of each group.
+
+        NPV is the sum of the projects' own NPVs, each at its own discount rate
+        and start. IRR is the IRR of the group's combined cash flows.
+        """
+        groups, rows, labels = self._active(grouping)
+        cash_flow = groups.sums['cash_flow'][rows]
+        # Calendar years from the first investment to the last operating year of the group
+        years = self.calendar_years()
+        active = cash_flow != 0
+        return pd.DataFrame({
+            'projects': groups.projects[rows],
+            'capacity': groups.capacity[rows],
+            'npv': groups.npv[rows],
+            'irr': model.irr(cash_flow) * 100,
+            'net_cash_flow': cash_flow.sum(axis=1),
+            'generation': groups.sums['generation'][rows].sum(axis=1),
+            'co2_saved_tonnes': groups.sums['co2_saved_tonnes'][rows].sum(axis=1),
+            'first_year': years[active.argmax(axis=1)],
+            'last_year': years[years.size - 1 - active[:, ::-1].argmax(axis=1)],
+        }, index=pd.Index(labels, name=grouping))
+
+
+def from_store(store, keys):
+    """Portfolio of the saved proposals under `keys` in a store.ResultStore."""
+    portfolio = Portfolio()
+    for key in keys:
+        proposal = store.get(key, artifacts=False)
+        if proposal is not None:
+            portfolio.add_proposal(proposal)
+    return portfolio
@@ -0,0 +1,68 @@
+"""Hourly profiles for one year (8760 hours): PV shape, time-of-use tariffs
+and uploaded CSV series.
+
+Profiles are read-only arrays cached by their parameters (uploaded files by
+content), so every project of a batch and every rerun shares the same
+arrays.
+"""
+import functools
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+HOURS = 8760
+
+
+def _read_only(values):
+    values = np.ascontiguousarray(values, dtype=float)
+    values.setflags(write=False)
+    return values
+
+
+@functools.lru_cache(maxsize=4)
+def solar_profile():
+    """Typical PV output shape for a mid-latitude site, normalized to sum to 1 over the year."""
+    day = np.arange(365)[:, None]
+    hour = np.arange(24)[None, :] + 0.5
+    season = np.sin(2 * np.pi * (day - 80) / 365)
+    day_length = 12 + 3 * season
+    sun = np.sin(np.pi * (hour - (12 - day_length / 2)) / day_length).clip(0) * (1 + 0.3 * season)
+    return _read_only((sun / sun.sum()).ravel())
+
+
+@functools.lru_cache(maxsize=32)
+def tou_profile(peak_start=17, peak_end=22, peak=1.5, off_peak=1.0):
+    """Tariff multipliers: `peak` from `peak_start` to `peak_end` (hours), `off_peak` otherwise."""
+    day = np.full(24, float(off_peak))
+    day[int(peak_start):int(peak_end)] = peak
+    return _read_only(np.tile(day, 365))
+
+
+@functools.lru_cache(maxsize=64)
+def read_profile(data):
+    """Hourly values from CSV bytes: the last numeric column, hourly (8760/8784 rows) or 15-minute
+    (35040/35136 rows, summed into hours, so energies stay energies)."""
+    try:
+        frame = pd.read_csv(BytesIO(data))
+    except (ValueError, pd.errors.ParserError) as error:
+        raise ValueError(f"Not a CSV profile: {error}") from None
+    numeric = frame.select_dtypes('number')
+    if numeric.empty:
+        raise ValueError("The profile has no numeric column")
+    values = numeric.iloc[:, -1].to_numpy(dtype=float)
+    if len(values) in (4 * HOURS, 4 * (HOURS + 24)):
+        values = values.reshape(-1, 4).sum(axis=1)
+    if len(values) not in (HOURS, HOURS + 24):
+        raise ValueError(f"Expected 8760 hourly or 35040 quarter-hourly values, got {len(values)}")
+    if not np.isfinite(values).all():
+        raise ValueError("The profile has missing values")
+    return _read_only(values[:HOURS])
+
+
+def normalized(profile):
+    # Shape of a profile, summing to 1 (e.g. measured PV output scaled to the model's yearly generation)
+    total = profile.sum()
+    if total <= 0:
+        raise ValueError("The profile must have a positive total")
+    return _read_only(profile / total)
@@ -0,0 +1,707 @@
+"""Charts, tables and the PDF report for a single project.
+
+Kept free of Streamlit so the same rendering code can be timed by the
+benchmarks and reused outside the app.
+"""
+import html
+import os
+import re
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from fpdf import FPDF, image_parsing, syntax
+from PIL import Image
+
+from solar_fin import payback
+
+# The environmental icons live next to the app script
+ASSET_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def asset_path(name):
+    return os.path.join(ASSET_DIR, name)
+
+
+def figure_to_png(fig, dpi=None):
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def figure_to_svg(fig):
+    # Text is drawn as paths, so the PDF needs no extra fonts for vector charts
+    buffer = BytesIO()
+    fig.savefig(buffer, format='svg', metadata={'Date': None})
+    plt.close(fig)
+    # fpdf2 skips <metadata> but logs a warning for it
+    return re.sub(rb'<metadata>.*?</metadata>', b'', buffer.getvalue(), flags=re.S)
+
+
+def figure_bytes(fig, image_format='png', dpi=None):
+    return figure_to_svg(fig) if image_format == 'svg' else figure_to_png(fig, dpi)
+
+
+def cash_flow_columns(currency_symbol):
+    # Cash-flow table columns as (label, ProjectResult.yearly field, printf-style format)
+    return [
+        ('Year', 'year', '%.0f'),
+        ('Energy Yield (kWh)', 'generation', '%.3f'),
+        ('Yearly Degradation (kWh)', 'degradation', '%.3f'),
+        ('% Yearly Degradation', 'degradation_pct', '%.3f'),
+        (f'Gross Revenue ({currency_symbol})', 'gross_revenue', '%.3f'),
+        (f'O&M Expense ({currency_symbol})', 'o_and_m', '%.3f'),
+        (f'Cash Flow ({currency_symbol})', 'cash_flow', '%.3f'),
+        (f'Cumulative Net Revenue ({currency_symbol})', 'cumulative_cash_flow', '%.3f'),
+    ]
+
+
+def cash_flow_formats(currency_symbol):
+    return {label: number_format for label, _, number_format in cash_flow_columns(currency_symbol)}
+
+
+TABLE_STYLE = '<style>.cash-flow-table td, .cash-flow-table th {text-align: center;}</style>'
+
+
+def table_html(yearly, columns, css_class='cash-flow-table'):
+    # Whole columns are formatted at once and joined through one row template,
+    # so the cost grows with the number of cells and not with per-cell styling
+    formatted = [np.char.mod(number_format, yearly[field]) for _, field, number_format in columns]
+    header = ''.join(f'<th>{html.escape(label)}</th>' for label, _, _ in columns)
+    row_template = '<tr>' + '<td>{}</td>' * len(columns) + '</tr>'
+    rows = '\n'.join(row_template.format(*row) for row in zip(*formatted))
+    return (f'{TABLE_STYLE}<table class="{css_class}">\n<thead><tr>{header}</tr></thead>\n'
+            f'<tbody>\n{rows}\n</tbody>\n</table>')
+
+
+def cash_flow_table_html(yearly, currency_symbol):
+    return table_html(yearly, cash_flow_columns(currency_symbol))
+
+
+def generation_chart(yearly, image_format='png', dpi=None):
+    years = yearly['year']
+    yearly_generations = yearly['generation']
+    percentage_yearly_degradation = yearly['degradation_pct']
+
+    # Create a figure and axis with a specified figure size
+    fig1, ax1 = plt.subplots()  # Set a reasonable size for the figure
+    
+    # Bar chart for Yearly Generation (Energy Yield)
+    bars = ax1.bar(years, yearly_generations, color='#1E90FF', label='Energy Yield (kWh)')
+    
+    # Create a second y-axis for the line chart of Yearly Degradation (%)
+    ax2 = ax1.twinx()
+    
+    # Line chart for Yearly Degradation (%)
+    ax2.plot(years, percentage_yearly_degradation, color='orange', linewidth=2.5, marker='o', label='% Yearly Degradation')
+    
+    # Set axis labels and title
+    ax1.set_xlabel('Year')
+    ax1.set_ylabel('Energy Yield (kWh)', color='#1E90FF')
+    ax2.set_ylabel('% Yearly Degradation', color='orange')
+    ax2.set_title('Year-On-Year Degradation Analysis – For 25 Years', fontsize=14)
+    
+    # Set the limits for the y-axes
+    ax1.set_ylim(yearly_generations.min() * 0.5, yearly_generations.max() * 1.05)  # Dynamic limits based on data
+    ax2.set_ylim(0, percentage_yearly_degradation.max() * 1.1)  # Adjust the limits for Yearly Degradation (%)
+    
+    # Set the ticks for the x-axis to show all the years
+    ax1.set_xticks(years)
+    
+    # Add integer data labels inside the bars at the top edge
+    for bar in bars:
+        yval = int(bar.get_height())  # Convert to integer
+        ax1.text(bar.get_x() + bar.get_width() / 2, yval - 5, f'{yval}', ha='center', va='top', fontsize=9, color='white', rotation=90, fontweight='bold')
+    
+    # Legends for both the bar chart and the line chart
+    ax1.legend(loc='upper left')
+    ax2.legend(loc='upper right')
+    return figure_bytes(fig1, image_format, dpi)
+
+
+def cash_flow_chart(yearly, payback_period, currency_symbol, image_format='png', dpi=None):
+    # Cumulative Cash Flow and Break-even
+    cumulative_cash_flow = yearly['cumulative_cash_flow']
+    payback_period_years, additional_months = payback.years_and_months(payback_period)
+    fig33, ax3 = plt.subplots()
+    ax3.plot(yearly['year'], cumulative_cash_flow, marker='o', label='Cumulative Cash Flow')
+    ax3.axhline(0, color='red', linestyle='--')
+    if payback_period_years >= 0:
+        ax3.annotate(f'Simple Payback in: {payback_period_years} years and {additional_months} months',
+                     xy=(payback_period_years, 0), xytext=(payback_period_years, -0.1 * max(cumulative_cash_flow)),
+                     arrowprops=dict(facecolor='black', arrowstyle='->'))
+    else:
+        ax3.annotate('No payback within the project life', xy=(0.5, 0.9), xycoords='axes fraction', ha='center')
+    ax3.set_xlabel('Year')
+    ax3.set_ylabel(f'Cumulative Cash Flow ({currency_symbol})')
+    ax3.set_title('Cumulative Cash Flow and Break-even')
+    ax3.legend()
+    return figure_bytes(fig33, image_format, dpi)
+
+
+def revenue_chart(yearly, currency_symbol, image_format='png', dpi=None):
+    # Yearly Gross Revenue and O&M Expense
+    years = yearly['year']
+    fig44, ax4 = plt.subplots()
+    width = 0.35  # Width of the bars
+    ax4.bar(years - width/2, yearly['gross_revenue'], width, label='Yearly Gross Revenue')
+    ax4.bar(years + width/2, yearly['o_and_m'], width, label='Yearly O&M Expense', color='red')
+    ax4.set_xlabel('Year')
+    ax4.set_ylabel(f'Amount ({currency_symbol})')
+    ax4.set_title('Yearly Gross Revenue and O&M Expense')
+    ax4.legend()
+    return figure_bytes(fig44, image_format, dpi)
+
+
+# PDF output presets (see pdf_options()). DPIs are pixels per inch at the printed size; images are
+# only ever scaled down. image_colors reduces images to a palette of that many colours.
+PDF_QUALITIES = {
+    'standard': {'chart_dpi': 150, 'icon_dpi': 300, 'image_colors': None, 'vector_charts': False, 'compression_level': 6},
+    'compact': {'chart_dpi': 110, 'icon_dpi': 150, 'image_colors': 128, 'vector_charts': False, 'compression_level': 9},
+    'vector': {'chart_dpi': 150, 'icon_dpi': 300, 'image_colors': None, 'vector_charts': True, 'compression_level': 6},
+    'draft': {'chart_dpi': 72, 'icon_dpi': 72, 'image_colors': 32, 'vector_charts': False, 'compression_level': 1},
+}
+# Printed size of the charts in the report (mm)
+CHART_WIDTH = 120
+CHART_HEIGHT = 90
+
+
+def pdf_options(quality='standard', **overrides):
+    """Output settings of the PDF report: a PDF_QUALITIES preset with optional overrides."""
+    if quality not in PDF_QUALITIES:
+        raise ValueError(f"Unknown PDF quality {quality!r}; expected one of {', '.join(PDF_QUALITIES)}")
+    unknown = set(overrides) - set(PDF_QUALITIES[quality])
+    if unknown:
+        raise ValueError(f"Unknown PDF options: {', '.join(sorted(unknown))}")
+    options = dict(PDF_QUALITIES[quality], **overrides)
+    if not 0 <= options['compression_level'] <= 9:
+        raise ValueError("compression_level must be between 0 and 9")
+    return options
+
+
+def report_charts(result, currency_symbol, options=None):
+    """The three report charts rendered for the PDF: SVG for vector charts, else PNG at the chart DPI."""
+    options = pdf_options() if options is None else options
+    image_format = 'svg' if options['vector_charts'] else 'png'
+    # savefig's dpi is per inch of the figure, which is printed at CHART_WIDTH
+    dpi = options['chart_dpi'] * CHART_WIDTH / 25.4 / plt.rcParams['figure.figsize'][0]
+    return {
+        'generation_chart': generation_chart(result.yearly, image_format, dpi),
+        'cash_flow_chart': cash_flow_chart(result.yearly, result.payback_period, currency_symbol, image_format, dpi),
+        'revenue_chart': revenue_chart(result.yearly, currency_symbol, image_format, dpi),
+    }
+
+
+_COMPRESSION_LOCK = threading.RLock()
+# fpdf2 has no public setting for the zlib level, only FPDF.set_compression() on/off. The fpdf2
+# versions in requirements.txt keep the level in these module-wide settings; on other versions
+# the level is left at fpdf2's default.
+_ZLIB_LEVELS = (hasattr(getattr(image_parsing, 'SETTINGS', None), 'compression_level')
+                and hasattr(getattr(syntax, 'PDFContentStream', None), '_COMPRESSION_LEVEL'))
+
+
+@contextmanager
+def compression_level(level):
+    # Reports written in parallel threads set the module-wide levels under a lock around each
+    # compressing call (re-entrant: an image can break the page, and the new page's header draws the logo)
+    if not _ZLIB_LEVELS:
+        yield
+        return
+    with _COMPRESSION_LOCK:
+        previous = image_parsing.SETTINGS.compression_level, syntax.PDFContentStream._COMPRESSION_LEVEL
+        image_parsing.SETTINGS.compression_level = syntax.PDFContentStream._COMPRESSION_LEVEL = level
+        try:
+            yield
+        finally:
+            image_parsing.SETTINGS.compression_level, syntax.PDFContentStream._COMPRESSION_LEVEL = previous
+
+
+# Enhanced PDF Class with Improved Table Format and Centered Table
+# Letters used in the PDF for currency symbols the core fonts cannot draw
+PDF_CURRENCY_FALLBACKS = {'₹': 'Rs.', 'د.إ;': 'AED '}
+
+
+def pdf_currency_symbol(currency_symbol):
+    # The core PDF fonts cover Windows-1252 (which has € but not ₹)
+    try:
+        currency_symbol.encode('windows-1252')
+    except UnicodeEncodeError:
+        return PDF_CURRENCY_FALLBACKS.get(currency_symbol, '')
+    return currency_symbol
+
+
+class PDF(FPDF):
+    def __init__(self, logo_path=None, options=None):
+        super().__init__()
+        self.logo_path = logo_path  # a file path or an open PIL image
+        self.options = pdf_options() if options is None else options
+        self.core_fonts_encoding = 'windows-1252'
+        self.set_compression(self.options['compression_level'] > 0)
+        # Images resampled for this report, by (source, pixel size): each is embedded once however often it is drawn
+        self._prepared_images = {}
+
+    def _prepared_image(self, source, w, h, dpi):
+        image = source if isinstance(source, Image.Image) else Image.open(BytesIO(source) if isinstance(source, bytes) else source)
+        if not h:
+            h = w * image.height / image.width
+        size = (max(1, round(w / 25.4 * dpi)), max(1, round(h / 25.4 * dpi)))
+        key = (id(source) if isinstance(source, Image.Image) else hash(source), size)
+        if key not in self._prepared_images:
+            if image.width > size[0] and image.height > size[1]:
+                image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            if self.options['image_colors']:
+                image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+                image = image.quantize(self.options['image_colors'], method=Image.Quantize.FASTOCTREE)
+            self._prepared_images[key] = image
+        return self._prepared_images[key]
+
+    def embed_image(self, source, x=None, y=None, w=0, h=0, dpi=None):
+        """Draw an image (path, bytes or PIL image) w x h mm, resampled to `dpi` for its printed size.
+        SVG bytes are drawn as vector graphics."""
+        if isinstance(source, bytes) and source.lstrip()[:5] in (b'<?xml', b'<svg '):
+            return self.image(BytesIO(source), x=x, y=y, w=w, h=h)
+        return self.image(self._prepared_image(source, w, h, dpi or self.options['icon_dpi']), x=x, y=y, w=w, h=h)
+
+    # Images are compressed when first drawn, page streams on output
+    def image(self, *args, **kwargs):
+        with compression_level(self.options['compression_level']):
+            return super().image(*args, **kwargs)
+
+    def output(self, *args, **kwargs):
+        with compression_level(self.options['compression_level']):
+            return super().output(*args, **kwargs)
+
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 5, f'Page {self.page_no()}', 0, 1, 'C')
+        self.set_y(-10)  # Adjust position for the link
+        self.cell(0, 5, 'App link: https://solarfinc-v01.streamlit.app/', 0, 0, 'C', link='https://energy-eda-v01.streamlit.app/')
+
+    def cover_page(self, client_name, client_address, project_name, company_name, prepared_by, company_email):
+        self.add_page()
+
+        # Background color (optional - this will be a colored rectangle)
+        self.set_fill_color(230, 240, 255)  # Light blue color
+        self.rect(0, 0, 210, 297, 'F')  # Cover the entire page (A4 dimensions)
+
+        # Add the logo centered on the cover page
+        if self.logo_path:
+            self.embed_image(self.logo_path, x=75, y=20, w=60)
+
+        self.ln(45)  # Move below the logo
+        # Title
+        self.set_font('Arial', 'B', 24)
+        self.set_text_color(0, 51, 102)  # Dark blue color
+        self.cell(0, 10, 'Solar PV System Financial Report', 0, 1, 'C')
+        self.ln(10)
+        # Decorative Line below title
+        self.set_line_width(0.5)
+        self.set_draw_color(0, 51, 102)  # Dark blue color
+        self.line(60, self.get_y(), 150, self.get_y())
+        self.ln(5)
+        self.set_font('Arial', 'I', 16)
+        self.cell(0, 10, 'Generated by Energy Data Updater and Analytics App', 0, 1, 'C')
+        self.ln(10)
+
+
+        # Client Details Table
+        self.set_font('Arial', 'B', 16)
+        self.cell(0, 10, 'Client Details', 0, 1, 'C')
+
+        # Calculate x position for centering the table
+        table_width = 150  # Define the width of the table
+        x_position = (self.w - table_width) / 2
+
+        # Draw the Client Details table
+        self.set_x(x_position)
+        self.set_font('Arial', '', 12)
+        self.cell(45, 10, 'Client Name:', 1, 0, 'C')
+        self.cell(105, 10, client_name, 1, 1, 'C')
+
+        self.set_x(x_position)
+        self.cell(45, 10, 'Client Address:', 1, 0, 'C')
+        self.cell(105, 10, client_address, 1, 1, 'C')
+
+        self.set_x(x_position)
+        self.cell(45, 10, 'Project Details:', 1, 0, 'C')
+        self.cell(105, 10, project_name, 1, 1, 'C')
+
+        self.ln(10)
+
+        # Company Details Table
+        self.set_font('Arial', 'B', 16)
+        self.cell(0, 10, 'Company Details', 0, 1, 'C')
+
+        # Draw the Company Details table
+        self.set_x(x_position)
+        self.set_font('Arial', '', 12)
+        self.cell(45, 10, 'Company Name:', 1, 0, 'C')
+        self.cell(105, 10, company_name, 1, 1, 'C')
+
+        self.set_x(x_position)
+        self.cell(45, 10, 'Prepared By:', 1, 0, 'C')
+        self.cell(105, 10, prepared_by, 1, 1, 'C')
+
+        self.set_x(x_position)
+        self.cell(45, 10, 'Company Email:', 1, 0, 'C')
+        self.cell(105, 10, company_email, 1, 1, 'C')
+
+        self.ln(30)
+
+        # Report Generated Date
+        self.set_font('Arial', 'I', 12)
+        self.cell(0, 10, f'Report Generated: {pd.Timestamp.now().strftime("%Y-%m-%d")}', 0, 1, 'C')
+        self.ln(10)
+
+
+    def header(self):
+        if self.logo_path:
+            self.embed_image(self.logo_path, 10, 6, 33)  # Adjust y-position to 6
+        self.set_font('Arial', 'B', 12)
+        self.cell(0, 10, 'Solar PV System Financial Report', 0, 1, 'C')
+        self.set_font('Arial', 'I', 10)
+        self.cell(0, 10, 'Generated by Energy Data Updater and Analytics App', 0, 1, 'C')
+        self.ln(5)
+        self.set_line_width(0.5)
+        self.line(10, self.get_y(), 200, self.get_y())
+        self.ln(5)
+
+
+    def chapter_title(self, title):
+        self.set_font('Arial', 'B', 18)
+        self.set_fill_color(216, 248, 171)
+        self.set_text_color(0, 102, 204)
+        self.cell(0, 10, title, 0, 1, 'C', fill=True)
+        self.ln(5)
+
+    def chapter_subtitle(self, subtitle):
+        self.set_font('Arial', 'B', 14)
+        self.set_fill_color(230, 230, 250)
+        self.set_text_color(0, 0, 0)
+        self.cell(0, 10, subtitle, 0, 1, 'C', fill=True)
+        self.ln(5)
+
+    def add_form_inputs(self, form_data):
+        # Title for Inputs
+        self.set_font('Arial', 'B', 16)
+        self.set_fill_color(230, 230, 250)
+        self.cell(0, 10, 'Project and Financial Inputs', 0, 1, 'C', fill=True)
+        self.ln(7)
+
+        # Styling for Form Data Display in colorful tabular format
+        self.set_font('Arial', 'B', 12)
+        self.set_fill_color(255, 228, 225)
+        self.cell(90, 7, 'Input Parameter', 1, 0, 'C', fill=True)
+        self.cell(0, 7, 'Value', 1, 1, 'C', fill=True)
+
+        for title, value in form_data.items():
+            self.set_font('Arial', 'B', 12)
+            self.set_fill_color(255, 255, 240)
+            self.cell(90, 8, f'{title}:', 1, 0, 'L', fill=True)
+            self.set_font('Arial', '', 12)
+            self.set_fill_color(240, 248, 255)
+            self.cell(0, 8, f'{value}', 1, 1, 'R', fill=True)
+        self.ln(7)
+
+
+    def card(self, title, value, fill_color):
+        self.set_font('Arial', 'B', 12)
+        self.set_fill_color(*fill_color)
+        self.set_text_color(0, 0, 255)
+        self.cell(90, 10, f"{title}", 0, 0, 'L', fill=True)
+        self.cell(0, 10, f"{value}", 0, 1, 'R', fill=True)
+        self.ln(5)
+
+    def metric_table(self, metrics, bg_color):
+        icon_size = 10
+        col_widths = [20, 25, 105]  # Adjusted column widths for better alignment
+        row_height = 15  # Adjusted row height
+
+        # Calculate total table width
+        table_width = sum(col_widths)
+
+        # Calculate the center position for the table
+        page_width = self.w - 2 * self.l_margin
+        x_offset = (page_width - table_width) / 2 + self.l_margin  # Center the table on the page
+
+        for metric in metrics:
+            self.set_x(x_offset)
+
+            # Icon column
+            self.set_fill_color(*bg_color)
+            self.cell(col_widths[0], row_height, "", border=0, align='C', fill=True)
+            self.embed_image(metric['image'], x=self.get_x() - col_widths[0] + icon_size / 2, y=self.get_y() + 2.5, w=icon_size, h=icon_size)
+
+            # Value column
+            self.cell(col_widths[1], row_height, metric['value'], border=0, align='R', fill=True)
+
+            # Description column
+            self.cell(col_widths[2], row_height, metric['description'], border=0, align='L', fill=True)
+
+            # Move to the next line for the next metric
+            self.ln(row_height)
+
+        # Space after the table
+        self.ln(5)
+
+
+    def add_metric_table(self, title, value, bg_color, x_offset, y_start, width=60):
+        self.set_fill_color(*bg_color)
+        self.set_text_color(255, 255, 255)
+
+        self.set_xy(x_offset, y_start)
+        self.cell(width, 10, title, border=1, align='C', fill=True)
+        self.ln(10)
+
+        self.set_x(x_offset)
+        self.set_fill_color(255, 255, 255)
+        self.set_text_color(0, 0, 0)
+        self.cell(width, 10, value, border=1, align='C', fill=True)
+
+    def add_two_column_metrics(self, metrics, column_spacing=10, row_spacing=10):
+        page_width = self.w - 2 * self.l_margin
+        column_width = (page_width - column_spacing) / 2
+        x_offset1 = self.l_margin
+        x_offset2 = x_offset1 + column_width + column_spacing
+
+        max_rows = len(metrics) // 2 + len(metrics) % 2
+        y_start = self.get_y()
+
+        for row in range(max_rows):
+            y_position = y_start + row * (15 + row_spacing)
+            title1, value1, bg_color1 = metrics[row * 2]
+            self.add_metric_table(title1, value1, bg_color1, x_offset1, y_position, column_width)
+            if row * 2 + 1 < len(metrics):
+                title2, value2, bg_color2 = metrics[row * 2 + 1]
+                self.add_metric_table(title2, value2, bg_color2, x_offset2, y_position, column_width)
+
+    def add_cash_flow_table(self, yearly, currency_symbol):
+        self.add_page()
+        self.chapter_title('Cash Flow Analysis')
+
+        # Setting up the table headers with a line break in the 'Cumulative Net Revenue' header
+        self.set_font('Arial', 'B', 12)
+        self.set_fill_color(240, 240, 240)
+        col_widths = [15, 40, 40, 40, 40]  # Adjust column widths as needed
+        table_width = sum(col_widths)  # Total width of the table
+        # Calculate the starting x position to center the table
+        page_width = self.w - 2 * self.l_margin  # Page width minus margins
+        x_start_T = (page_width - table_width) / 2 + self.l_margin
+
+        # Set the position for the table
+        self.set_x(x_start_T)
+
+
+        # Regular header for 'Year'
+        self.cell(col_widths[0], 20, 'Year', border=1, align='C', fill=True)
+        x_start = self.get_x()
+
+        # Multi-cell headers for the other columns with a line break before the currency symbol
+        self.multi_cell(col_widths[1], 10, f'Gross Revenue\n({currency_symbol})', border=1, align='C', fill=True)
+        self.set_xy(x_start + col_widths[1], self.get_y() - 20)  # Reset the position for the next cell in the same row
+        self.multi_cell(col_widths[2], 10, f'O&M Expense\n({currency_symbol})', border=1, align='C', fill=True)
+        self.set_xy(x_start + col_widths[1] + col_widths[2], self.get_y() - 20)  # Reset the position for the next cell in the same row
+        self.multi_cell(col_widths[3], 10, f'Cash Flow\n({currency_symbol})', border=1, align='C', fill=True)
+        self.set_xy(x_start + col_widths[1] + col_widths[2] + col_widths[3], self.get_y() - 20)  # Reset the position for the next cell in the same row
+        self.multi_cell(col_widths[4], 6.667, f'Cumulative\nNet Revenue\n({currency_symbol})', border=1, align='C', fill=True)
+
+        self.ln(1)
+
+        # Filling in the table rows with reduced row height and currency symbols in the values
+        self.set_font('Arial', '', 10)
+        for row in yearly:
+            self.set_x(x_start_T)
+            self.cell(col_widths[0], 7, str(int(row['year'])), border=1, align='C')
+            self.cell(col_widths[1], 7, f"{row['gross_revenue']:.0f}", border=1, align='C')
+            self.cell(col_widths[2], 7, f"{row['o_and_m']:.0f}", border=1, align='C')
+            self.cell(col_widths[3], 7, f"{row['cash_flow']:.0f}", border=1, align='C')
+            self.cell(col_widths[4], 7, f"{row['cumulative_cash_flow']:.0f}", border=1, align='C')
+            self.ln()
+
+
+
+    def add_energy_table(self, yearly):
+        self.add_page()
+        self.chapter_title('25 Years Energy Yield Data Analysis')
+
+        # Set the table column widths
+        col_widths = [15, 60, 60]  # Adjust column widths as needed
+        table_width = sum(col_widths)  # Total width of the table
+
+        # Calculate the starting x position to center the table
+        page_width = self.w - 2 * self.l_margin  # Page width minus margins
+        x_start = (page_width - table_width) / 2 + self.l_margin
+
+        # Set the position for the table
+        self.set_x(x_start)
+
+        # Set the font for the table headers
+        self.set_font('Arial', 'B', 12)
+        self.set_fill_color(240, 240, 240)
+
+        # Regular headers (single-line headers)
+        self.cell(col_widths[0], 10, 'Year', border=1, align='C', fill=True)
+        self.cell(col_widths[1], 10, f'Energy Yield (kWh)', border=1, align='C', fill=True)
+        self.cell(col_widths[2], 10, f'% Yearly Degradation', border=1, align='C', fill=True)
+        self.ln()  # Move to the next line after the headers
+
+        # Filling in the table rows with reduced row height
+        self.set_font('Arial', '', 10)
+        for row in yearly:
+            self.set_x(x_start)  # Set x position to center the rows
+            self.cell(col_widths[0], 7, str(int(row['year'])), border=1, align='C')
+            self.cell(col_widths[1], 7, f"{row['generation']:.0f}", border=1, align='C')
+            self.cell(col_widths[2], 7, f"{row['degradation_pct']:.3f}", border=1, align='C')
+            self.ln()  # Move to the next line after each row
+
+
+
+
+def generate_pdf_report(
+    logo_file,
+    result,
+    initial_investment,
+    project_capacity,
+    o_and_m_cost,
+    electricity_cost,
+    project_life,
+    energy_generation_first_year,
+    yearly_degradation,
+    o_and_m_escalation,
+    electricity_tariff_escalation,
+    discount_rate,
+    chart_images,
+    currency_symbol='',
+    client_name='',
+    client_address='',
+    project_name='',
+    company_name='',
+    company_prepared_by='',
+    company_email='',
+    extra_inputs=None,
+    options=None
+):
+
+    # Summary metrics and per-year series come from one ProjectResult
+    currency_symbol = pdf_currency_symbol(currency_symbol)
+
+    # Output settings (image resolution, vector charts, compression) from pdf_options()
+    options = pdf_options() if options is None else options
+    # The logo is opened once and drawn on every page from the same embedded image
+    logo = Image.open(logo_file) if logo_file is not None else None
+
+    pdf = PDF(logo_path=logo, options=options)
+    pdf.cover_page(client_name, client_address, company_name, company_prepared_by, company_email, project_name)
+    pdf.add_page()
+
+    # Title and Subtitle
+    pdf.set_font('Arial', 'BI', 16)
+    pdf.set_text_color(0, 0, 0)
+    pdf.cell(0, 10, 'Comprehensive analysis of financial and environmental benefits', 0, 1, 'C')
+    #pdf.set_font('Arial', 'I', 16)
+    #pdf.set_text_color(105, 105, 105)
+    #pdf.cell(0, 10, 'Comprehensive analysis of financial and environmental benefits', 0, 1, 'C')
+    pdf.ln(10)
+
+    # Connect Form Data to Input Data
+    form_data = {
+        f"Total Initial Investment ({currency_symbol})": f"{currency_symbol}{result.initial_investment_total:.3f}",
+        "Project Capacity (kWp)": f"{project_capacity} kWp",
+        f"O&M Cost ({currency_symbol}/kWp per year)": f"{currency_symbol}{o_and_m_cost:.3f}",
+        f"Cost of Electricity ({currency_symbol}/kWh)": f"{currency_symbol}{electricity_cost:.3f}",
+        "Project Life (years)": f"{project_life} years",
+        "Energy Generation for First Year (kWh)": f"{energy_generation_first_year:.3f} kWh",
+        "Yearly Degradation (%)": f"{yearly_degradation:.3f}%",
+        "O&M Cost Escalation (%)": f"{o_and_m_escalation:.3f}%",
+        "Electricity Tariff Escalation (%)": f"{electricity_tariff_escalation:.3f}%",
+        "Discount Rate (%)": f"{discount_rate:.3f}%",
+    }
+    # Optional systems (e.g. a battery) add their own rows, already formatted
+    form_data.update(extra_inputs or {})
+
+
+
+    # Add Form Inputs to the Report
+    pdf.add_form_inputs(form_data)
+
+    # Center the image in the PDF
+    pdf_width = pdf.w - 2 * pdf.l_margin  # The effective width of the PDF (excluding margins)
+    image_width = CHART_WIDTH  # Set the desired image width
+
+    # Calculate the x position to center the image
+    x_position = (pdf_width - image_width) / 2 + pdf.l_margin
+
+    # Yearly Generation and Degradation
+    pdf.chapter_subtitle('Yearly Generation and Degradation')
+    pdf.embed_image(chart_images['generation_chart'], x=x_position, y=None, w=image_width, h=CHART_HEIGHT, dpi=options['chart_dpi'])
+
+    pdf.add_page()
+
+    # Financial Metrics Section
+    pdf.chapter_subtitle('Financial Metrics')
+    financial_metrics = [
+        ("Total Gross Revenue", f"{currency_symbol}{result.total_revenue:,.3f}", (0, 102, 204)),
+        ("Total O&M Cost", f"{currency_symbol}{result.total_o_and_m_cost:,.3f}", (255, 165, 0)),
+        ("Total Net Revenue", f"{currency_symbol}{result.cumulative_net_revenue:,.3f}", (34, 139, 34)),
+        ("NPV", f"{currency_symbol}{result.npv:,.3f}", (255, 69, 0)),
+        ("IRR", f"{result.irr:.3f}%", (75, 0, 130)),
+        ("Simple Payback Period", payback.describe(result.payback_period), (255, 215, 0)),
+        ("Discounted Payback Period", payback.describe(result.discounted_payback_period), (184, 134, 11)),
+        ("Annual Average ROI", f"{result.annual_average_roi:.3f}%", (30, 144, 255)),
+        ("LCoE", f"{currency_symbol}{result.lcoe:.4f}/kWh", (220, 20, 60)),
+    ]
+    pdf.add_two_column_metrics(financial_metrics)
+
+    pdf.ln(20)
+
+    # Environmental Benefits Section
+    pdf.chapter_subtitle('Environmental Benefits')
+
+    bg_color = (230, 240, 255)  # Light blue background color
+    metrics = [
+        {"image": asset_path("house.png"), "value": f"{result.houses_energized:.3f}", "description": "Houses\nEnergized per Year"},
+        {"image": asset_path("petrol-pump.png"), "value": f"{result.gallons_gas_saved:.3f}", "description": "Gallons of Gas\nSaved per Year"},
+        {"image": asset_path("car-wash.png"), "value": f"{result.cars_taken_off_road:.3f}", "description": "Cars Taken Off\nRoad per Year"},
+        {"image": asset_path("forest.png"), "value": f"{result.tree_seedlings:.3f}", "description": "Tree Seedlings\nGrown for 10 Years"},
+        {"image": asset_path("co2.png"), "value": f"{result.co2_saved_tonnes:.3f}", "description": "Tonnes of CO2\nEmissions Saved per Year"},
+        {"image": asset_path("co2.png"), "value": f"{result.lifetime_co2_saved_tonnes:.3f}", "description": "Tonnes of CO2\nSaved over Project Life"},
+    ]
+
+    pdf.metric_table(metrics, bg_color)
+
+    pdf.ln(20)
+
+    # Charts Section
+    pdf.chapter_title('Charts')
+
+
+
+    # Yearly Gross Revenue and O&M Expense
+    pdf.chapter_subtitle('Yearly Gross Revenue and O&M Expense')
+    pdf.embed_image(chart_images['revenue_chart'], x=x_position, y=None, w=image_width, h=CHART_HEIGHT, dpi=options['chart_dpi'])
+
+    # Cumulative Cash Flow and Break-even
+    pdf.chapter_subtitle('Cumulative Cash Flow and Break-even')
+    pdf.embed_image(chart_images['cash_flow_chart'], x=x_position, y=None, w=image_width, h=CHART_HEIGHT, dpi=options['chart_dpi'])
+    #pdf.add_page()
+
+
+
+    # Adding the Energy Flow & Cash Flow table on the last page
+    pdf.add_energy_table(result.yearly)
+    pdf.add_cash_flow_table(result.yearly, currency_symbol)
+
+
+    # Create a BytesIO buffer to store the PDF content
+    pdf_output = pdf.output(dest='S')  # Get PDF as string
+    pdf_buffer = BytesIO(pdf_output)
+    pdf_buffer.seek(0)
+
+
+    return pdf_buffer
@@ -0,0 +1,116 @@
+"""Compact per-project result: one structured array plus scalar metrics.
+
+The per-year series live side by side in a single contiguous record array,
+so charts, tables and the PDF read column views of it instead of copying
+the numbers into DataFrames.
+"""
+import numpy as np
+import pandas as pd
+
+from solar_fin import payback
+
+YEARLY_DTYPE = np.dtype([
+    ('year', np.int32),
+    ('generation', np.float64),
+    ('degradation', np.float64),
+    ('degradation_pct', np.float64),
+    ('gross_revenue', np.float64),
+    ('o_and_m', np.float64),
+    ('cash_flow', np.float64),
+    ('cumulative_cash_flow', np.float64),
+])
+
+
+def yearly_array(results, row=0):
+    """Pack one project's per-year series into a read-only record array.
+
+    `results` is the flat dict returned by model.evaluate() (or the merged
+    stage outputs); only the years within the project's life are kept.
+    """
+    life = int(results['active'][row].sum())
+    generation = results['generation'][row, :life]
+    yearly = np.empty(life, dtype=YEARLY_DTYPE)
+    yearly['year'] = results['years'][:life]
+    yearly['generation'] = generation
+    yearly['degradation'] = results['degradation'][row, :life]
+    yearly['degradation_pct'] = (generation[0] - generation) / generation[0] * 100 if life and generation[0] else 0.0
+    yearly['gross_revenue'] = results['gross_revenue'][row, :life]
+    yearly['o_and_m'] = results['o_and_m'][row, :life]
+    yearly['cash_flow'] = results['cash_flows'][row, 1:life + 1]
+    yearly['cumulative_cash_flow'] = results['cumulative_cash_flow'][row, 1:life + 1]
+    yearly.setflags(write=False)
+    return yearly
+
+
+class ProjectResult:
+    __slots__ = (
+        'yearly',
+        'initial_investment_total',
+        'total_revenue',
+        'total_o_and_m_cost',
+        'cumulative_net_revenue',
+        'npv',
+        'irr',
+        'payback_period',
+        'discounted_payback_period',
+        'annual_average_roi',
+        'lcoe',
+        'houses_energized',
+        'gallons_gas_saved',
+        'cars_taken_off_road',
+        'tree_seedlings',
+        'co2_saved_tonnes',
+        'lifetime_co2_saved_tonnes',
+    )
+
+    def __init__(self, yearly, **metrics):
+        self.yearly = yearly
+        for name in self.__slots__[1:]:
+            setattr(self, name, metrics.get(name))
+
+    @classmethod
+    def from_results(cls, results, row=0, yearly=None):
+        """Build from model.evaluate() output; IRR is stored as a percentage."""
+        if yearly is None:
+            yearly = yearly_array(results, row)
+        metrics = {
+            'initial_investment_total': float(results['initial_investment_total'][row]),
+            'total_revenue': float(results['total_revenue'][row]),
+            'total_o_and_m_cost': float(results['total_o_and_m_cost'][row]),
+            'cumulative_net_revenue': float(results['cumulative_net_revenue'][row]),
+            'npv': float(results['npv'][row]),
+            'irr': float(results['irr'][row]) * 100,
+            'payback_period': float(results['payback_period'][row]),
+            'discounted_payback_period': float(results['discounted_payback_period'][row]),
+            'annual_average_roi': float(results['annual_average_roi'][row]),
+            'lcoe': float(results['lcoe'][row]),
+        }
+        if 'lifetime_co2_saved_tonnes' in results:
+            # Environmental Benefits over the project life, averaged per year
+            life = len(yearly)
+            metrics.update(
+                houses_energized=float(results['lifetime_houses_energized'][row]) / life,
+                gallons_gas_saved=float(results['lifetime_gallons_gas_saved'][row]) / life,
+                cars_taken_off_road=float(results['lifetime_cars_taken_off_road'][row]) / life,
+                tree_seedlings=float(results['lifetime_tree_seedlings'][row]) / life,
+                co2_saved_tonnes=float(results['lifetime_co2_saved_tonnes'][row]) / life,
+                lifetime_co2_saved_tonnes=float(results['lifetime_co2_saved_tonnes'][row]),
+            )
+        return cls(yearly, **metrics)
+
+    @property
+    def project_life(self):
+        return len(self.yearly)
+
+    @property
+    def nbytes(self):
+        return self.yearly.nbytes
+
+    def payback(self):
+        # (years, months) of the simple payback; (-1, -1) when it never pays back
+        years, months = payback.years_and_months(self.payback_period)
+        return int(years), int(months)
+
+    def frame(self, columns):
+        """DataFrame copy of selected fields, given as {label: field}, for widgets that need one."""
+        return pd.DataFrame({label: self.yearly[field] for label, field in columns.items()})
@@ -0,0 +1,201 @@
+"""Versioned scenario files: JSON for a few scenarios, Parquet for thousands.
+
+A scenario is one row of SCENARIO_FIELDS: the client and company details,
+the model inputs (in model units, so the discount rate is a fraction) and
+the grid settings. Files carry the schema version; older versions are
+upgraded through MIGRATIONS on load. Validation runs column by column over
+all rows at once and reports every problem with its row number.
+"""
+import json
+import os
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from solar_fin import environment, model
+
+SCHEMA = 'solar_fin.scenario'
+SCHEMA_VERSION = 1
+
+TEXT_FIELDS = (
+    'scenario_name',
+    'client_name',
+    'client_address',
+    'client_email',
+    'company_name',
+    'company_prepared_by',
+    'company_email',
+    'project_name',
+    'currency_code',
+    'grid_region',
+)
+SCENARIO_FIELDS = TEXT_FIELDS + model.PARAMETERS + ('grid_decarbonization',)
+
+# Optional fields and their values when a file leaves them out
+DEFAULTS = dict({name: '' for name in TEXT_FIELDS}, currency_code='USD', grid_region=environment.DEFAULT_REGION,
+                grid_decarbonization=True)
+
+# Inclusive bounds of the model inputs (None = unbounded)
+LIMITS = {
+    'initial_investment': (0, None),
+    'project_capacity': (0, None),
+    'o_and_m_cost': (0, None),
+    'electricity_cost': (0, None),
+    'project_life': (1, 100),
+    'energy_generation_first_year': (0, None),
+    'yearly_degradation': (0, 100),
+    'o_and_m_escalation': (0, None),
+    'electricity_tariff_escalation': (0, None),
+    'escalation_years': (1, 100),
+    'discount_rate': (0, 1),
+}
+
+PARQUET_MISSING = "Parquet scenario files need pyarrow (pip install pyarrow)"
+
+# version: function upgrading a frame of that version to the next one
+MIGRATIONS = {}
+
+
+class ScenarioFileError(ValueError):
+    """The file cannot be read as scenarios at all (as opposed to rows failing validation)."""
+
+
+def normalize(frame, version=SCHEMA_VERSION):
+    # Upgrade to the current schema, fill optional fields and fix the column order
+    if version > SCHEMA_VERSION:
+        raise ScenarioFileError(f"Scenario schema version {version} is newer than this app supports ({SCHEMA_VERSION})")
+    while version < SCHEMA_VERSION:
+        if version not in MIGRATIONS:
+            raise ScenarioFileError(f"Unsupported scenario schema version {version}")
+        frame = MIGRATIONS[version](frame)
+        version += 1
+    missing = [name for name in model.PARAMETERS if name not in frame.columns]
+    if missing:
+        raise ScenarioFileError(f"Missing required fields: {', '.join(missing)}")
+    frame = frame.copy()
+    # Per row as well: in mixed records, rows that leave an optional field out get its default
+    for name, default in DEFAULTS.items():
+        if name not in frame.columns:
+            frame[name] = default
+        frame[name] = frame[name].fillna(default)
+    for name in TEXT_FIELDS:
+        frame[name] = frame[name].astype(str)
+    return frame[list(SCENARIO_FIELDS)].reset_index(drop=True)
+
+
+def validate(frame):
+    """Check all rows at once; returns (valid row mask, DataFrame of row/field/message)."""
+    n = len(frame)
+    valid = np.ones(n, dtype=bool)
+    problems = []
+
+    def flag(mask, name, message):
+        rows = np.flatnonzero(mask)
+        valid[rows] = False
+        problems.append(pd.DataFrame({'row': rows, 'field': name, 'message': message}))
+
+    for name in model.PARAMETERS:
+        values = pd.to_numeric(frame[name], errors='coerce').to_numpy(dtype=float)
+        missing = ~np.isfinite(values)
+        flag(missing, name, 'not a number')
+        low, high = LIMITS[name]
+        with np.errstate(invalid='ignore'):
+            if low is not None:
+                flag(~missing & (values < low), name, f'below {low}')
+            if high is not None:
+                flag(~missing & (values > high), name, f'above {high}')
+            if name in model.INTEGER_PARAMETERS:
+                flag(~missing & (values % 1 != 0), name, 'not a whole number')
+    flag(~frame['grid_region'].isin(list(environment.GRID_EMISSION_FACTORS)).to_numpy(), 'grid_region', 'unknown grid region')
+    flag(~frame['currency_code'].str.fullmatch('[A-Z]{3}').fillna(False).to_numpy(dtype=bool),
+         'currency_code', 'not a 3-letter currency code')
+    flag(~frame['grid_decarbonization'].isin([True, False, 0, 1]).to_numpy(), 'grid_decarbonization', 'not true/false')
+
+    errors = pd.concat(problems, ignore_index=True).sort_values(['row', 'field'], kind='stable')
+    return valid, errors.reset_index(drop=True)
+
+
+def unsupported_inputs(inputs):
+    """Names of model inputs in `inputs` that scenario files cannot hold: exchange rates
+    other than 1, price and generation indices, capex events, the battery and metering."""
+    names = []
+    for name, value in inputs.items():
+        if name in SCENARIO_FIELDS or value is None:
+            continue
+        if name in model.FX_PARAMETERS and np.all(np.asarray(value) == 1):
+            continue
+        names.append(name)
+    return names
+
+
+def to_json(scenarios):
+    """Compact JSON for a scenario dict or a list of them.
+
+    Raises ScenarioFileError for scenarios with unsupported_inputs(), which
+    the file would silently drop, so that loading it back would give other results.
+    """
+    if isinstance(scenarios, dict):
+        scenarios = [scenarios]
+    for scenario in scenarios:
+        unsupported = unsupported_inputs(scenario)
+        if unsupported:
+            raise ScenarioFileError(f"Scenario files cannot hold {', '.join(unsupported)}")
+    records = [{name: _plain(scenario.get(name, DEFAULTS.get(name))) for name in SCENARIO_FIELDS} for scenario in scenarios]
+    return json.dumps({'schema': SCHEMA, 'version': SCHEMA_VERSION, 'scenarios': records}, separators=(',', ':'))
+
+
+def from_json(text):
+    try:
+        document = json.loads(text)
+    except json.JSONDecodeError as error:
+        raise ScenarioFileError(f"Not a JSON file: {error}") from None
+    if not isinstance(document, dict) or document.get('schema') != SCHEMA:
+        raise ScenarioFileError("Not a solar_fin scenario file")
+    scenarios = document.get('scenarios')
+    if not isinstance(scenarios, list):
+        raise ScenarioFileError("Scenario file has no list of scenarios")
+    return normalize(pd.DataFrame.from_records(scenarios), int(document.get('version', 0)))
+
+
+def to_parquet(frame, target=None):
+    # The schema version travels as a column so it survives any Parquet reader
+    frame = normalize(frame).assign(schema_version=SCHEMA_VERSION)
+    buffer = BytesIO() if target is None else target
+    try:
+        frame.to_parquet(buffer, index=False)
+    except ImportError:
+        raise ScenarioFileError(PARQUET_MISSING) from None
+    return buffer.getvalue() if target is None else None
+
+
+def from_parquet(source):
+    try:
+        frame = pd.read_parquet(BytesIO(source) if isinstance(source, bytes) else source)
+    except ImportError:
+        raise ScenarioFileError(PARQUET_MISSING) from None
+    if 'schema_version' not in frame.columns:
+        raise ScenarioFileError("Parquet file has no schema_version column")
+    versions = frame.pop('schema_version').unique()
+    if len(versions) != 1:
+        raise ScenarioFileError("Parquet file mixes schema versions")
+    return normalize(frame, int(versions[0]))
+
+
+def load(file_name, data):
+    """Scenarios from an uploaded .json or .parquet file, as a normalized DataFrame."""
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == '.json':
+        return from_json(data.decode('utf-8') if isinstance(data, bytes) else data)
+    if extension in ('.parquet', '.pq'):
+        return from_parquet(data)
+    raise ScenarioFileError(f"Unsupported scenario file type {extension!r}")
+
+
+def batch_inputs(frame):
+    # Model inputs of all rows as (N,) arrays for model.evaluate() or a background sweep
+    return {name: pd.to_numeric(frame[name]).to_numpy(dtype=float) for name in model.PARAMETERS}
+
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
@@ -0,0 +1,160 @@
+"""Columnar store for comparing many evaluated scenarios side by side.
+
+Each scenario is one row: its inputs and headline metrics live in 1-D
+columns and its per-year series in 2-D arrays padded to the longest project
+life. Only new or changed scenarios are evaluated: those with just the basic
+model.PARAMETERS in a single batch, those with exchange rates, price or
+generation indices, capex events, a battery or metering one by one, so
+they compare on the same results as the main calculation.
+"""
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from solar_fin import model
+
+METRICS = ('npv', 'irr', 'lcoe', 'payback_period', 'total_revenue', 'annual_average_roi')
+SERIES = ('generation', 'cumulative_cash_flow')
+
+
+def _extended(inputs):
+    # Inputs beyond model.PARAMETERS that change the results (exchange rates of 1 do not)
+    return any(value is not None and not (name in model.FX_PARAMETERS and np.all(np.asarray(value) == 1))
+               for name, value in inputs.items() if name not in model.PARAMETERS)
+
+
+def _digest(digest, value):
+    # Feed an input value (arrays, dicts of them, sequences, scalars) into a hash
+    if isinstance(value, np.ndarray):
+        digest.update(f"{value.shape}{value.dtype.str}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value):
+            digest.update(str(key).encode())
+            _digest(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _digest(digest, item)
+    else:
+        digest.update(repr(value).encode())
+
+
+def inputs_key(inputs):
+    # Stable hash of a scenario's model inputs, extended inputs included
+    payload = json.dumps({name: float(inputs[name]) for name in model.PARAMETERS}, sort_keys=True)
+    digest = hashlib.sha1(payload.encode())
+    if _extended(inputs):
+        _digest(digest, {name: value for name, value in inputs.items() if name not in model.PARAMETERS})
+    return digest.hexdigest()
+
+
+class ScenarioStore:
+    def __init__(self, capacity=16):
+        self.names = []
+        self.keys = []
+        self.inputs = {name: np.empty(capacity) for name in model.PARAMETERS}
+        self.metrics = {name: np.empty(capacity) for name in METRICS}
+        self.series = {name: np.zeros((capacity, 0), dtype=np.float32) for name in SERIES}
+        self.last_recomputed = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def _reserve(self, rows, years):
+        capacity = len(next(iter(self.inputs.values())))
+        if rows > capacity:
+            capacity = max(rows, capacity * 2)
+            for columns in (self.inputs, self.metrics):
+                for name, column in columns.items():
+                    columns[name] = np.resize(column, capacity)
+        for name, column in self.series.items():
+            width = years + 1 if name == 'cumulative_cash_flow' else years
+            if column.shape[0] < capacity or column.shape[1] < width:
+                grown = np.zeros((capacity, max(width, column.shape[1])), dtype=np.float32)
+                grown[:column.shape[0], :column.shape[1]] = column
+                self.series[name] = grown
+
+    def update(self, scenarios):
+        """Add or replace scenarios given as {name: inputs}.
+
+        Scenarios whose inputs are unchanged are skipped; the rest are
+        evaluated together. Returns the names that were recomputed.
+        """
+        changed = {}
+        for name, inputs in scenarios.items():
+            key = inputs_key(inputs)
+            if name in self.names and self.keys[self.names.index(name)] == key:
+                continue
+            changed[name] = (key, inputs)
+        self.last_recomputed = list(changed)
+        if not changed:
+            return self.last_recomputed
+
+        basic = [name for name, (_, inputs) in changed.items() if not _extended(inputs)]
+        evaluated = {}  # name: (results, row in the results)
+        if basic:
+            results = model.evaluate({param: [float(changed[name][1][param]) for name in basic] for param in model.PARAMETERS})
+            evaluated.update((name, (results, i)) for i, name in enumerate(basic))
+        for name, (_, inputs) in changed.items():
+            if name not in evaluated:
+                evaluated[name] = (model.evaluate(inputs), 0)
+        new_rows = sum(name not in self.names for name in changed)
+        self._reserve(len(self.names) + new_rows, max(len(results['years']) for results, _ in evaluated.values()))
+
+        for name, (key, inputs) in changed.items():
+            results, i = evaluated[name]
+            if name in self.names:
+                row = self.names.index(name)
+                self.keys[row] = key
+            else:
+                row = len(self.names)
+                self.names.append(name)
+                self.keys.append(key)
+            for param in model.PARAMETERS:
+                self.inputs[param][row] = float(inputs[param])
+            for metric in METRICS:
+                self.metrics[metric][row] = results[metric][i]
+            for series in SERIES:
+                values = results[series][i]
+                self.series[series][row] = 0
+                self.series[series][row, :len(values)] = values
+                if series == 'cumulative_cash_flow':
+                    # Hold the final cumulative value flat past the project life
+                    self.series[series][row, len(values):] = values[-1]
+        return self.last_recomputed
+
+    def remove(self, names):
+        names = set(names)
+        keep = [row for row, name in enumerate(self.names) if name not in names]
+        self.names = [self.names[row] for row in keep]
+        self.keys = [self.keys[row] for row in keep]
+        for columns in (self.inputs, self.metrics, self.series):
+            for name, column in columns.items():
+                columns[name] = column[keep]
+
+    def rows(self, names=None):
+        if names is None:
+            return np.arange(len(self.names))
+        return np.array([self.names.index(name) for name in names], dtype=int)
+
+    def series_for(self, series, names=None):
+        # (rows, years) view limited to the longest life among the stored scenarios
+        rows = self.rows(names)
+        life = int(self.inputs['project_life'][:len(self.names)].max()) if self.names else 0
+        width = life + 1 if series == 'cumulative_cash_flow' else life
+        return self.series[series][rows, :width]
+
+    def comparison_frame(self, names=None, currency_symbol=''):
+        rows = self.rows(names)
+        return pd.DataFrame({
+            'Scenario': [self.names[row] for row in rows],
+            f'Initial Investment ({currency_symbol}/Wp)': self.inputs['initial_investment'][rows],
+            'Project Capacity (kWp)': self.inputs['project_capacity'][rows],
+            f'Cost of Electricity ({currency_symbol}/kWh)': self.inputs['electricity_cost'][rows],
+            f'NPV ({currency_symbol})': self.metrics['npv'][rows],
+            'IRR (%)': self.metrics['irr'][rows] * 100,
+            f'LCoE ({currency_symbol}/kWh)': self.metrics['lcoe'][rows],
+            'Payback (years)': self.metrics['payback_period'][rows],
+        })
@@ -0,0 +1,183 @@
+"""Persistent result store for proposals (SQLite).
+
+Each proposal is stored once under a hash of everything that shapes it: the
+model inputs, the grid settings, the currency, the client and company
+fields and the logo. A row holds the inputs, the headline metrics and the
+per-year record array; rendered artifacts (charts, the PDF report) go in a
+side table. Opening the same proposal again is a read, not a recompute.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+
+from solar_fin import payback
+from solar_fin.results import YEARLY_DTYPE, ProjectResult
+
+DEFAULT_PATH = 'solar_fin_results.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS proposals (
+    key TEXT PRIMARY KEY,
+    client_name TEXT,
+    project_name TEXT,
+    created TEXT,
+    inputs TEXT,
+    metrics TEXT,
+    yearly BLOB
+);
+DROP INDEX IF EXISTS proposals_client;
+DROP INDEX IF EXISTS proposals_project;
+CREATE INDEX IF NOT EXISTS proposals_client_nocase ON proposals (client_name COLLATE NOCASE, created);
+CREATE INDEX IF NOT EXISTS proposals_project_nocase ON proposals (project_name COLLATE NOCASE, created);
+CREATE INDEX IF NOT EXISTS proposals_created ON proposals (created);
+CREATE TABLE IF NOT EXISTS artifacts (
+    key TEXT,
+    name TEXT,
+    data BLOB,
+    PRIMARY KEY (key, name)
+);
+"""
+
+
+def _plain(value):
+    # JSON-friendly copy of an input value (NumPy scalars and bytes included)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        return hashlib.sha1(value).hexdigest()
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    return value
+
+
+def proposal_key(inputs):
+    """Stable hash of a proposal's inputs; bytes (the logo) are hashed by content."""
+    payload = json.dumps(_plain(inputs), sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class StoredProposal:
+    __slots__ = ('key', 'client_name', 'project_name', 'created', 'inputs', 'result', 'artifacts')
+
+    def __init__(self, key, client_name, project_name, created, inputs, result, artifacts):
+        self.key = key
+        self.client_name = client_name
+        self.project_name = project_name
+        self.created = created
+        self.inputs = inputs
+        self.result = result
+        self.artifacts = artifacts
+
+
+class ResultStore:
+    def __init__(self, path=None, batch_size=100):
+        self.path = path or os.environ.get('SOLAR_FIN_STORE', DEFAULT_PATH)
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        with closing(self._connect()) as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        # One short-lived connection per call, so the store can be shared across sessions/threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def put(self, key, inputs, result, artifacts=None, client_name='', project_name='', created=None):
+        """Queue one proposal; it is written with the next batch or on flush()."""
+        record = (key, inputs, result, artifacts or {}, client_name, project_name,
+                  created or datetime.now().isoformat(sep=' ', timespec='seconds'))
+        with self._lock:
+            self._pending.append(record)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def put_many(self, records):
+        # records: dicts of put() arguments, written in one transaction
+        for record in records:
+            self.put(**record)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        proposals = []
+        artifacts = []
+        for key, inputs, result, files, client_name, project_name, created in pending:
+            # NaN (no IRR) and infinity (no payback) are stored as null, which SQLite's JSON functions accept
+            metrics = {name: getattr(result, name) for name in ProjectResult.__slots__[1:]}
+            metrics = {name: None if value is None or not np.isfinite(value) else value for name, value in metrics.items()}
+            proposals.append((key, client_name, project_name, created, json.dumps(_plain(inputs), default=str),
+                              json.dumps(metrics), np.ascontiguousarray(result.yearly).tobytes()))
+            artifacts.extend((key, name, data) for name, data in files.items())
+        with closing(self._connect()) as db, db:
+            db.executemany('INSERT OR REPLACE INTO proposals VALUES (?, ?, ?, ?, ?, ?, ?)', proposals)
+            db.executemany('INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?)', artifacts)
+        return len(pending)
+
+    def get(self, key, artifacts=True):
+        """Stored proposal for `key` (flushing queued writes first), or None."""
+        self.flush()
+        with closing(self._connect()) as db:
+            row = db.execute('SELECT key, client_name, project_name, created, inputs, metrics, yearly '
+                             'FROM proposals WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            files = {}
+            if artifacts:
+                files = dict(db.execute('SELECT name, data FROM artifacts WHERE key = ?', (key,)).fetchall())
+        key, client_name, project_name, created, inputs, metrics, yearly = row
+        # null is NaN, except for payback periods, where it means the project never pays back
+        metrics = {name: value if value is not None else payback.NEVER if name.endswith('payback_period') else float('nan')
+                   for name, value in json.loads(metrics).items()}
+        result = ProjectResult(np.frombuffer(yearly, dtype=YEARLY_DTYPE), **metrics)
+        return StoredProposal(key, client_name, project_name, created, json.loads(inputs), result, files)
+
+    def find(self, client=None, project=None, since=None, until=None, limit=100):
+        """Proposals matching a client/project name prefix and a date range, newest first.
+
+        Returns (key, client_name, project_name, created, npv, irr, lcoe) rows without loading
+        the per-year arrays or artifacts.
+        """
+        where, params = [], []
+        source = 'proposals'
+        # Case-insensitive prefixes as ranges on the NOCASE indexes (the prefix is taken literally, so
+        # % and _ are not wildcards). Left to itself SQLite walks proposals_created for the ORDER BY.
+        for column, prefix, index in (('client_name', client, 'proposals_client_nocase'),
+                                      ('project_name', project, 'proposals_project_nocase')):
+            if prefix:
+                where.append(f'{column} >= ? COLLATE NOCASE AND {column} < ? COLLATE NOCASE')
+                params += [prefix, prefix + '\U0010ffff']
+                if source == 'proposals':
+                    source = f'proposals INDEXED BY {index}'
+        if since:
+            where.append('created >= ?')
+            params.append(str(since))
+        if until:
+            where.append('created < ?')
+            params.append(str(until))
+        query = ("SELECT key, client_name, project_name, created, json_extract(metrics, '$.npv'), "
+                 f"json_extract(metrics, '$.irr'), json_extract(metrics, '$.lcoe') FROM {source}")
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY created DESC LIMIT ?'
+        self.flush()
+        with closing(self._connect()) as db:
+            return db.execute(query, params + [limit]).fetchall()
+
+    def delete(self, key):
+        self.flush()
+        with closing(self._connect()) as db, db:
+            db.execute('DELETE FROM proposals WHERE key = ?', (key,))
+            db.execute('DELETE FROM artifacts WHERE key = ?', (key,))
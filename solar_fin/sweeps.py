@@ -0,0 +1,356 @@
+"""Grid sweeps over every combination of a few inputs, run in shards on a
+process pool, or on a Dask or Ray cluster.
+
+    python -m solar_fin.sweeps --sites portfolio.json --axis electricity_cost=0.05:0.3:26 \
+        --axis initial_investment=0.4:1.2:9 --axis discount_rate=0.03,0.05,0.08
+
+A grid is the base model inputs plus ordered axes; row i of the grid is the
+combination np.unravel_index(i, shape). Shards are flat row ranges, so
+workers build their own rows and the driver never holds the grid. Each shard
+is evaluated with model.evaluate() and reduced in the worker to a summary
+(count, sums, min/max, best rows, quantile sketch per metric). Summaries
+merge associatively, so the driver folds them in as shards finish, and its
+memory does not grow with the size of the grid.
+
+Percentiles come from quantile sketches of QUANTILE_POINTS values per
+metric, merged and re-compressed; their rank error is about
+1 / QUANTILE_POINTS. Count, mean, min, max and the best rows are exact.
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from solar_fin import model
+from solar_fin.scenarios import METRICS
+
+BACKENDS_MISSING = {
+    'dask': "The dask backend needs dask.distributed (pip install 'dask[distributed]')",
+    'ray': "The ray backend needs ray (pip install ray)",
+}
+CHUNK_SIZE = 50_000
+QUANTILE_POINTS = 1001
+# Direction of each metric for the best rows
+MAXIMIZE = {'npv': True, 'irr': True, 'total_revenue': True, 'annual_average_roi': True,
+            'lcoe': False, 'payback_period': False}
+
+
+def grid(base, axes, labels=None):
+    """Grid spec: every combination of `axes` applied to the `base` model inputs.
+
+    `axes` maps a model parameter to its values, or an axis name to a dict of
+    equal-length parameter columns that vary together (e.g. the sites of a
+    portfolio from scenario_files.batch_inputs()). Later axes override
+    earlier ones. `labels` optionally names the points of an axis.
+    """
+    columns = []
+    for name, values in axes.items():
+        group = values if isinstance(values, dict) else {name: values}
+        group = {param: np.asarray(column, dtype=float).ravel() for param, column in group.items()}
+        unknown = [param for param in group if param not in model.PARAMETERS]
+        if unknown:
+            raise ValueError(f"Unknown model inputs on axis {name!r}: {', '.join(unknown)}")
+        lengths = {len(column) for column in group.values()}
+        if len(lengths) != 1 or 0 in lengths:
+            raise ValueError(f"Axis {name!r} needs columns of one non-zero length")
+        columns.append((name, group))
+    return {
+        'base': base,
+        'axes': tuple(columns),
+        'shape': tuple(len(next(iter(group.values()))) for _, group in columns),
+        'labels': dict(labels or {}),
+    }
+
+
+def size(spec):
+    return int(np.prod(spec['shape'], dtype=np.int64))
+
+
+def rows(spec, start, stop):
+    """Model inputs of grid rows start..stop-1, and the index along each axis."""
+    index = np.unravel_index(np.arange(start, stop), spec['shape'])
+    inputs = dict(spec['base'])
+    for (_, group), positions in zip(spec['axes'], index):
+        for param, column in group.items():
+            inputs[param] = column[positions]
+    return inputs, index
+
+
+# Summaries: plain dicts of arrays, cheap to pickle and merge
+
+def _midpoints(points):
+    # Each sketch value stands for an equal share of the mass, centered on it
+    return (np.arange(points) + 0.5) / points
+
+
+def _sketch(values, points):
+    # (sorted values, weights) standing for the distribution of `values`
+    values = np.sort(values)
+    if len(values) <= points:
+        return values, np.ones(len(values))
+    return np.quantile(values, _midpoints(points)), np.full(points, len(values) / points)
+
+
+def _compress(values, weights, points):
+    order = np.argsort(values, kind='stable')
+    values, weights = values[order], weights[order]
+    if len(values) <= points:
+        return values, weights
+    positions = (np.cumsum(weights) - weights / 2) / weights.sum()
+    return np.interp(_midpoints(points), positions, values), np.full(points, weights.sum() / points)
+
+
+def _best(index, metrics, objective, top):
+    # The `top` rows with the best objective; NaN (e.g. an IRR that does not exist) ranks last
+    score = metrics[objective] if MAXIMIZE.get(objective, True) else -metrics[objective]
+    score = np.where(np.isnan(score), -np.inf, score)
+    keep = np.argsort(-score, kind='stable')[:top]
+    return {'index': index[keep], 'metrics': {name: values[keep] for name, values in metrics.items()}}
+
+
+def summarize(index, metrics, objective='npv', top=10, points=QUANTILE_POINTS):
+    """Summary of evaluated rows: `index` (rows,) grid rows, `metrics` {name: (rows,)}."""
+    summary = {'count': len(index), 'objective': objective, 'best': _best(index, metrics, objective, top), 'metrics': {}}
+    for name, values in metrics.items():
+        finite = values[np.isfinite(values)]
+        sketch, weights = _sketch(finite, points)
+        summary['metrics'][name] = {
+            'count': len(finite),
+            'sum': finite.sum(),
+            'min': finite.min() if len(finite) else np.inf,
+            'max': finite.max() if len(finite) else -np.inf,
+            'sketch': sketch,
+            'weights': weights,
+        }
+    return summary
+
+
+def merge(first, second, top=None, points=QUANTILE_POINTS):
+    """Combine two summaries (in any order or grouping) into one."""
+    if first is None:
+        return second
+    top = top or max(len(first['best']['index']), len(second['best']['index']))
+    best_metrics = {name: np.concatenate([first['best']['metrics'][name], second['best']['metrics'][name]])
+                    for name in first['best']['metrics']}
+    best_index = np.concatenate([first['best']['index'], second['best']['index']])
+    merged = {'count': first['count'] + second['count'], 'objective': first['objective'],
+              'best': _best(best_index, best_metrics, first['objective'], top), 'metrics': {}}
+    for name, a in first['metrics'].items():
+        b = second['metrics'][name]
+        sketch, weights = _compress(np.concatenate([a['sketch'], b['sketch']]),
+                                    np.concatenate([a['weights'], b['weights']]), points)
+        merged['metrics'][name] = {
+            'count': a['count'] + b['count'],
+            'sum': a['sum'] + b['sum'],
+            'min': min(a['min'], b['min']),
+            'max': max(a['max'], b['max']),
+            'sketch': sketch,
+            'weights': weights,
+        }
+    return merged
+
+
+def evaluate_shard(spec, start, stop, objective='npv', top=10):
+    """Evaluate grid rows start..stop-1 and return their summary (runs in a worker)."""
+    inputs, _ = rows(spec, start, stop)
+    results = model.evaluate(inputs)
+    return summarize(np.arange(start, stop), {name: results[name] for name in METRICS}, objective, top)
+
+
+def shards(spec, chunk_size=CHUNK_SIZE, objective='npv', top=10):
+    # Arguments of evaluate_shard() for every shard of the grid
+    n = size(spec)
+    return [(spec, start, min(start + chunk_size, n), objective, top) for start in range(0, n, chunk_size)]
+
+
+def percentiles(summary, quantiles=(0.1, 0.5, 0.9)):
+    """Metric x (P10, P50, P90, mean, min, max) frame of a summary."""
+    table = {}
+    for name, stats in summary['metrics'].items():
+        row = {}
+        if stats['count']:
+            positions = (np.cumsum(stats['weights']) - stats['weights'] / 2) / stats['weights'].sum()
+            row = {f'P{round(q * 100)}': np.interp(q, positions, stats['sketch']) for q in quantiles}
+            row.update(mean=stats['sum'] / stats['count'], min=stats['min'], max=stats['max'])
+        table[name] = row
+    return pd.DataFrame.from_dict(table, orient='index')
+
+
+def best_rows(spec, summary):
+    """The best rows of a summary with their axis values and metrics."""
+    best = summary['best']
+    index = np.unravel_index(best['index'], spec['shape'])
+    frame = {}
+    for (name, group), positions in zip(spec['axes'], index):
+        # A labelled axis (e.g. sites) shows its labels rather than all of its columns
+        if name in spec['labels']:
+            frame[name] = np.asarray(spec['labels'][name])[positions]
+            continue
+        for param, column in group.items():
+            frame[param] = column[positions]
+    frame.update(best['metrics'])
+    return pd.DataFrame(frame)
+
+
+# Backends: run function(shared, *shard) for every shard and yield the results
+# as they finish, with at most a few shards per worker in flight.
+
+def _local(function, shared, shard_args, workers, address):
+    for args in shard_args:
+        yield function(shared, *args)
+
+
+def _process(function, shared, shard_args, workers, address):
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    shard_args = iter(shard_args)
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = {pool.submit(function, shared, *args) for args in itertools.islice(shard_args, 2 * workers)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for args in itertools.islice(shard_args, 1):
+                    pending.add(pool.submit(function, shared, *args))
+                yield future.result()
+
+
+def _dask(function, shared, shard_args, workers, address):
+    try:
+        from dask.distributed import Client, LocalCluster, as_completed
+    except ImportError:
+        raise RuntimeError(BACKENDS_MISSING['dask']) from None
+    cluster = None if address else LocalCluster(n_workers=workers, threads_per_worker=1, processes=True)
+    client = Client(address or cluster)
+    try:
+        workers = workers or len(client.scheduler_info()['workers'])
+        shard_args = iter(shard_args)
+        # The grid (with its profiles) goes to each worker once, not with every shard
+        shared_future = client.scatter(shared, broadcast=True)
+        pending = as_completed([client.submit(function, shared_future, *args, pure=False)
+                                for args in itertools.islice(shard_args, 2 * workers)])
+        for future in pending:
+            for args in itertools.islice(shard_args, 1):
+                pending.add(client.submit(function, shared_future, *args, pure=False))
+            result = future.result()
+            future.release()
+            yield result
+    finally:
+        client.close()
+        if cluster is not None:
+            cluster.close()
+
+
+def _ray(function, shared, shard_args, workers, address):
+    try:
+        import ray
+    except ImportError:
+        raise RuntimeError(BACKENDS_MISSING['ray']) from None
+    started = not ray.is_initialized()
+    if started:
+        ray.init(address=address, num_cpus=None if address else workers)
+    try:
+        remote = ray.remote(function)
+        workers = workers or int(ray.available_resources().get('CPU', 1))
+        shard_args = iter(shard_args)
+        shared_ref = ray.put(shared)
+        pending = [remote.remote(shared_ref, *args) for args in itertools.islice(shard_args, 2 * workers)]
+        while pending:
+            done, pending = ray.wait(pending, num_returns=1)
+            for args in itertools.islice(shard_args, 1):
+                pending.append(remote.remote(shared_ref, *args))
+            yield ray.get(done[0])
+    finally:
+        if started:
+            ray.shutdown()
+
+
+BACKENDS = {'process': _process, 'dask': _dask, 'ray': _ray, 'local': _local}
+
+
+def run(spec, backend='process', workers=None, address=None, chunk_size=CHUNK_SIZE, objective='npv', top=10,
+        progress=None):
+    """Sweep the whole grid and return its merged summary.
+
+    `backend` is 'process' (a local process pool), 'dask' or 'ray' (a local
+    cluster, or the one at `address`), or 'local' (this process).
+    `progress(done_rows, total_rows)` is called after every shard.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    if objective not in METRICS:
+        raise ValueError(f"Unknown objective {objective!r}; expected one of {', '.join(METRICS)}")
+    total = size(spec)
+    shard_args = [args[1:] for args in shards(spec, chunk_size, objective, top)]
+    summary = None
+    for partial in BACKENDS[backend](evaluate_shard, spec, shard_args, workers, address):
+        summary = merge(summary, partial, top)
+        if progress is not None:
+            progress(summary['count'], total)
+    return summary
+
+
+def _axis(text):
+    # "name=low:high:steps" or "name=v1,v2,..."
+    name, _, values = text.partition('=')
+    if name not in model.PARAMETERS or not values:
+        raise argparse.ArgumentTypeError(f"Expected <model input>=<low>:<high>:<steps> or =<v1>,<v2>,..., got {text!r}")
+    try:
+        if ':' in values:
+            low, high, steps = values.split(':')
+            return name, np.linspace(float(low), float(high), int(steps))
+        return name, np.array([float(value) for value in values.split(',')])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Cannot read the values of {text!r}") from None
+
+
+def main(argv=None):
+    from solar_fin import scenario_files
+
+    parser = argparse.ArgumentParser(description="Sweep a grid of model inputs and summarize the results.")
+    parser.add_argument('--sites', help="scenario file whose valid rows form the first (site) axis")
+    parser.add_argument('--base', help="scenario file whose first valid row gives the inputs that are not swept")
+    parser.add_argument('--axis', type=_axis, action='append', default=[], help="swept input, e.g. discount_rate=0.03:0.1:8")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='process')
+    parser.add_argument('--address', help="scheduler address of a running Dask or Ray cluster")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--objective', choices=METRICS, default='npv')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+    if not (args.sites or args.base):
+        parser.error("give --sites or --base for the inputs that are not swept")
+
+    def scenarios(path):
+        with open(path, 'rb') as handle:
+            frame = scenario_files.load(path, handle.read())
+        valid, errors = scenario_files.validate(frame)
+        if not valid.any():
+            parser.error(f"{path} has no valid scenarios:\n{errors.head(5).to_string(index=False)}")
+        return frame[valid]
+
+    axes, labels = {}, {}
+    if args.sites:
+        sites = scenarios(args.sites)
+        axes['site'] = scenario_files.batch_inputs(sites)
+        labels['site'] = sites['scenario_name'].astype(str).to_numpy()
+    base = scenario_files.batch_inputs(scenarios(args.base or args.sites).iloc[:1])
+    axes.update(args.axis)
+    spec = grid({name: values[0] for name, values in base.items()}, axes, labels)
+
+    start = time.perf_counter()
+    summary = run(spec, args.backend, args.workers, args.address, args.chunk_size, args.objective, args.top,
+                  progress=lambda done, total: print(f"\r{done:,} / {total:,} rows", end='', file=sys.stderr))
+    print(f"\n{summary['count']:,} rows in {time.perf_counter() - start:.1f} s ({args.backend})", file=sys.stderr)
+    with pd.option_context('display.width', 200, 'display.max_columns', 30):
+        print(percentiles(summary).to_string(float_format='{:,.4g}'.format))
+        print(f"\nBest {args.objective}:")
+        print(best_rows(spec, summary).to_string(index=False, float_format='{:,.4g}'.format))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Excel workbooks of per-year cash flows with live NPV and IRR formulas.
+
+    python -m solar_fin.workbook portfolio.json portfolio.xlsx
+
+Workbooks are written by xlsxwriter in constant-memory mode: each row goes to
+a temporary file as soon as the next one starts, so memory stays flat however
+many projects are written. Rows are written straight from the model's
+per-year arrays (ProjectResult.yearly for one project, model.evaluate()
+output chunk by chunk for a portfolio), never through DataFrames. NPV and
+IRR are Excel formulas over the cash-flow cells, stored with the model's
+values so viewers that do not recalculate still show them.
+"""
+import argparse
+import importlib.util
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+
+from solar_fin import model
+from solar_fin.report import cash_flow_columns
+
+XLSX_MISSING = "Excel export needs xlsxwriter (pip install xlsxwriter)"
+CHUNK_SIZE = 5_000
+# Portfolio sheets: (sheet name, model output, per-year columns start at t = 0)
+PORTFOLIO_SERIES = (
+    ('Cash flows', 'cash_flows', True),
+    ('Generation', 'generation', False),
+    ('Gross revenue', 'gross_revenue', False),
+    ('O&M', 'o_and_m', False),
+)
+
+
+class WorkbookError(ValueError):
+    """The workbook cannot be written (xlsxwriter is not installed)."""
+
+
+def available():
+    return importlib.util.find_spec('xlsxwriter') is not None
+
+
+def _workbook(target):
+    try:
+        import xlsxwriter
+    except ImportError:
+        raise WorkbookError(XLSX_MISSING) from None
+    return xlsxwriter.Workbook(target, {'constant_memory': True, 'nan_inf_to_errors': True})
+
+
+def _cell(row, col, sheet=None, absolute=False):
+    from xlsxwriter.utility import xl_rowcol_to_cell
+    cell = xl_rowcol_to_cell(row, col, row_abs=absolute, col_abs=absolute)
+    return f"'{sheet}'!{cell}" if sheet else cell
+
+
+def _range(row, first_col, last_row, last_col, sheet=None):
+    return f"{_cell(row, first_col, sheet)}:{_cell(last_row, last_col)}"
+
+
+def _cached(value):
+    # Value stored with a formula; Excel recalculates NaN and infinity to its own errors
+    return value if np.isfinite(value) else None
+
+
+def _finish(workbook, buffer):
+    workbook.close()
+    return buffer.getvalue() if buffer is not None else None
+
+
+def project_workbook(result, discount_rate, currency_symbol='', target=None):
+    """Workbook of one ProjectResult: the cash-flow table from year 0 and its metrics.
+
+    Returns the .xlsx bytes, or writes to `target` (a path or binary file).
+    """
+    buffer = BytesIO() if target is None else None
+    workbook = _workbook(buffer if target is None else target)
+    money = workbook.add_format({'num_format': '#,##0.000'})
+    percent = workbook.add_format({'num_format': '0.000%'})
+    bold = workbook.add_format({'bold': True})
+
+    columns = cash_flow_columns(currency_symbol)
+    fields = [field for _, field, _ in columns]
+    cash_col, cumulative_col = fields.index('cash_flow'), fields.index('cumulative_cash_flow')
+    sheet = workbook.add_worksheet('Cash flows')
+    sheet.set_column(0, 0, 6)
+    sheet.set_column(1, len(columns) - 1, 18, money)
+    sheet.write_row(0, 0, [label for label, _, _ in columns], bold)
+    # Year 0 holds the investment; the cumulative column adds up the cash flow column
+    sheet.write_number(1, 0, 0)
+    sheet.write_number(1, cash_col, -result.initial_investment_total)
+    sheet.write_formula(1, cumulative_col, f"={_cell(1, cash_col)}", None, -result.initial_investment_total)
+    yearly = result.yearly
+    series = [yearly[field].tolist() for field in fields]
+    for i, values in enumerate(zip(*series)):
+        row = i + 2
+        for col, value in enumerate(values):
+            if col == cumulative_col:
+                sheet.write_formula(row, col, f"={_cell(row - 1, col)}+{_cell(row, cash_col)}", None, value)
+            else:
+                sheet.write_number(row, col, value)
+    last_row = len(yearly) + 1
+
+    cash_flows = _range(1, cash_col, last_row, cash_col, 'Cash flows')
+    first_flow = _cell(1, cash_col, 'Cash flows')
+    later_flows = _range(2, cash_col, last_row, cash_col, 'Cash flows')
+    metrics = workbook.add_worksheet('Metrics')
+    metrics.set_column(0, 0, 34)
+    metrics.set_column(1, 1, 18)
+    metrics.write_row(0, 0, ["Metric", "Value"], bold)
+    metrics.write(1, 0, "Discount rate")
+    metrics.write_number(1, 1, discount_rate, percent)
+    metrics.write(2, 0, f"NPV ({currency_symbol})")
+    metrics.write_formula(2, 1, f"={first_flow}+NPV({_cell(1, 1, absolute=True)},{later_flows})", money, result.npv)
+    metrics.write(3, 0, "IRR")
+    metrics.write_formula(3, 1, f"=IRR({cash_flows})", percent, _cached(result.irr / 100))
+    for row, (label, value) in enumerate((
+            (f"LCoE ({currency_symbol}/kWh)", result.lcoe),
+            ("Simple payback (years)", result.payback_period),
+            ("Discounted payback (years)", result.discounted_payback_period),
+            (f"Total gross revenue ({currency_symbol})", result.total_revenue),
+            (f"Total O&M cost ({currency_symbol})", result.total_o_and_m_cost),
+            ("Annual average ROI (%)", result.annual_average_roi)), start=4):
+        metrics.write(row, 0, label)
+        metrics.write_number(row, 1, value, money)
+    return _finish(workbook, buffer)
+
+
+def portfolio_workbook(inputs, names=None, currency_symbol='', target=None, chunk_size=CHUNK_SIZE):
+    """Workbook of a batch of projects (model inputs as for model.evaluate()), one row per project.
+
+    The projects are evaluated `chunk_size` at a time and each chunk is
+    written before the next one is evaluated. 'Projects' has live NPV and
+    IRR formulas over each project's row in 'Cash flows', whose last row
+    sums the portfolio; 'Summary' has the portfolio totals and IRR.
+    Returns the .xlsx bytes, or writes to `target` (a path or binary file).
+    """
+    from solar_fin.jobs import sweep_chunks
+
+    chunks = [chunk for chunk, in sweep_chunks(inputs, chunk_size)]
+    n = sum(len(chunk['project_life']) for chunk in chunks)
+    years = int(max(chunk['project_life'].max() for chunk in chunks))
+    if names is None:
+        names = [f"Project {i + 1}" for i in range(n)]
+    buffer = BytesIO() if target is None else None
+    workbook = _workbook(buffer if target is None else target)
+    money = workbook.add_format({'num_format': '#,##0.00'})
+    percent = workbook.add_format({'num_format': '0.00%'})
+    bold = workbook.add_format({'bold': True})
+
+    summary = workbook.add_worksheet('Summary')
+    projects = workbook.add_worksheet('Projects')
+    project_columns = ["Project", "Capacity (kWp)", "Project life (years)", "Discount rate", f"NPV ({currency_symbol})", "IRR",
+                       f"LCoE ({currency_symbol}/kWh)", "Simple payback (years)", f"Total gross revenue ({currency_symbol})"]
+    projects.write_row(0, 0, project_columns, bold)
+    projects.set_column(0, 0, 24)
+    projects.set_column(1, len(project_columns) - 1, 16)
+    sheets = {}
+    for sheet_name, output, from_zero in PORTFOLIO_SERIES:
+        sheet = workbook.add_worksheet(sheet_name)
+        sheet.write_row(0, 0, ["Project"] + [f"Year {year}" for year in range(0 if from_zero else 1, years + 1)], bold)
+        sheet.set_column(0, 0, 24)
+        sheet.set_column(1, years + 1, 12, money)
+        sheets[output] = sheet
+
+    totals = {output: np.zeros(years + 1 if from_zero else years) for _, output, from_zero in PORTFOLIO_SERIES}
+    total_npv = total_capacity = 0.0
+    row = 1
+    for chunk in chunks:
+        results = model.evaluate(chunk)
+        count = len(results['npv'])
+        width = results['cash_flows'].shape[1]
+        for output, sheet in sheets.items():
+            # A chunk is as wide as its longest project life; the cells after it stay empty
+            values = results[output]
+            totals[output][:values.shape[1]] += values.sum(axis=0)
+            for i, line in enumerate(values.tolist()):
+                sheet.write_string(row + i, 0, names[row - 1 + i])
+                sheet.write_row(row + i, 1, line)
+        for i in range(count):
+            r = row + i
+            flows = _range(r, 1, r, width, 'Cash flows')
+            later_flows = _range(r, 2, r, width, 'Cash flows')
+            npv, irr = float(results['npv'][i]), float(results['irr'][i])
+            projects.write_string(r, 0, names[r - 1])
+            projects.write_number(r, 1, float(results['inputs']['project_capacity'][i]))
+            projects.write_number(r, 2, int(results['inputs']['project_life'][i]))
+            projects.write_number(r, 3, float(results['inputs']['discount_rate'][i]), percent)
+            projects.write_formula(r, 4, f"={_cell(r, 1, 'Cash flows')}+NPV({_cell(r, 3)},{later_flows})", money, _cached(npv))
+            projects.write_formula(r, 5, f"=IRR({flows})", percent, _cached(irr))
+            projects.write_number(r, 6, float(results['lcoe'][i]))
+            projects.write_number(r, 7, float(results['payback_period'][i]))
+            projects.write_number(r, 8, float(results['total_revenue'][i]), money)
+        total_npv += float(results['npv'].sum())
+        total_capacity += float(results['inputs']['project_capacity'].sum())
+        row += count
+
+    # Portfolio rows under each series
+    total_row = n + 1
+    for _, output, from_zero in PORTFOLIO_SERIES:
+        sheet = sheets[output]
+        sheet.write_string(total_row, 0, "Portfolio", bold)
+        for col, value in enumerate(totals[output], start=1):
+            sheet.write_formula(total_row, col, f"=SUM({_range(1, col, n, col)})", money, float(value))
+    portfolio_irr = float(model.irr(totals['cash_flows'][None, :])[0])
+    summary.set_column(0, 0, 34)
+    summary.set_column(1, 1, 18)
+    summary.write_row(0, 0, ["Portfolio", "Value"], bold)
+    for r, (label, formula, value, cell_format) in enumerate((
+            ("Projects", f"=COUNTA({_range(1, 0, n, 0, 'Projects')})", n, None),
+            ("Capacity (kWp)", f"=SUM({_range(1, 1, n, 1, 'Projects')})", total_capacity, None),
+            (f"NPV ({currency_symbol})", f"=SUM({_range(1, 4, n, 4, 'Projects')})", total_npv, money),
+            ("IRR of the combined cash flows", f"=IRR({_range(total_row, 1, total_row, years + 1, 'Cash flows')})",
+             portfolio_irr, percent),
+            (f"Initial investment ({currency_symbol})", f"=-{_cell(total_row, 1, 'Cash flows')}", -float(totals['cash_flows'][0]), money),
+            ("Generation (kWh)", f"=SUM({_range(total_row, 1, total_row, years, 'Generation')})", float(totals['generation'].sum()), money),
+            ), start=1):
+        summary.write(r, 0, label)
+        summary.write_formula(r, 1, formula, cell_format, _cached(value))
+    return _finish(workbook, buffer)
+
+
+def main(argv=None):
+    from solar_fin import scenario_files
+
+    parser = argparse.ArgumentParser(description="Write a portfolio of scenarios to an Excel workbook.")
+    parser.add_argument('scenarios', help="scenario file (JSON or Parquet); every valid row is a project")
+    parser.add_argument('output', help=".xlsx file to write")
+    parser.add_argument('--currency-symbol', default='')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    with open(args.scenarios, 'rb') as handle:
+        frame = scenario_files.load(args.scenarios, handle.read())
+    valid, errors = scenario_files.validate(frame)
+    if not valid.any():
+        parser.error(f"{args.scenarios} has no valid scenarios:\n{errors.head(5).to_string(index=False)}")
+    frame = frame[valid]
+    start = time.perf_counter()
+    try:
+        portfolio_workbook(scenario_files.batch_inputs(frame), frame['scenario_name'].astype(str).tolist(),
+                           args.currency_symbol, target=args.output, chunk_size=args.chunk_size)
+    except WorkbookError as error:
+        parser.error(str(error))
+    print(f"{len(frame):,} projects written to {args.output} in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
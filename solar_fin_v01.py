@@ -18,7 +18,36 @@ from datetime import datetime
 import yfinance as yf
 from fpdf.enums import XPos, YPos
 import io
+import contextlib
+import os
+import time
+import uuid
+from functools import partial
 from io import BytesIO
+from solar_fin import environment
+from solar_fin.scenarios import METRICS, ScenarioStore
+from solar_fin import model
+from solar_fin import instrumentation
+from solar_fin import scenario_files
+from solar_fin import fx
+from solar_fin import payback
+from solar_fin import escalation
+from solar_fin import degradation
+from solar_fin import capex_events
+from solar_fin import battery
+from solar_fin import profiles
+from solar_fin import metering
+from solar_fin import sweeps
+from solar_fin import live
+from solar_fin import workbook
+from solar_fin import portfolio
+from solar_fin.jobs import JobQueue, JobRejected
+from solar_fin.store import ResultStore, proposal_key
+from solar_fin.graph import model_graph
+from solar_fin.report import (cash_flow_columns, cash_flow_formats, cash_flow_table_html,
+                              generation_chart, cash_flow_chart, revenue_chart, generate_pdf_report, pdf_options,
+                              report_charts)
+from solar_fin.results import ProjectResult, yearly_array
 
 # Meta description for SEO optimization
 meta_description = """
@@ -49,37 +78,58 @@ st.markdown(meta_tag, unsafe_allow_html=True)
 
 st.write(f"FPDF version: {fpdf.__version__}")
 
+# Stage timings for this run (no-op unless SOLAR_FIN_TIMINGS=1)
+run_timer = instrumentation.RunTimer()
+instrumentation.start_metrics_server()
+
+# Pause before the exact live recalculation, so bursts of edits run the model once
+LIVE_DEBOUNCE = float(os.environ.get('SOLAR_FIN_LIVE_DEBOUNCE_MS', 300)) / 1000
+
+# Download type of the Excel workbooks
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
 
 
 
 #-------Currency Converter Mini-App------#
 
 
-# Sidebar section for real-time currency converter
-st.sidebar.header("Real-Time Currency Converter")
+# Sidebar section for real-time currency converter. It runs as a fragment: Convert and its inputs
+# rerun only this function, never the page or the financial model
+@st.fragment
+def currency_converter():
+    st.header("Real-Time Currency Converter")
 
-# Currency selection
-from_currency = st.sidebar.selectbox("From Currency", ["USD", "EUR", "GBP", "INR", "JPY", "AUD", "AED", "OMR"])
-to_currency = st.sidebar.selectbox("To Currency", ["USD", "EUR", "GBP", "INR", "JPY", "AUD", "AED", "OMR"])
+    # Currency selection
+    from_currency = st.selectbox("From Currency", ["USD", "EUR", "GBP", "INR", "JPY", "AUD", "AED", "OMR"])
+    to_currency = st.selectbox("To Currency", ["USD", "EUR", "GBP", "INR", "JPY", "AUD", "AED", "OMR"])
 
-# Amount input
-amount = st.sidebar.number_input("Amount to Convert", min_value=0.0, value=1.0, step=0.01)
+    # Amount input
+    amount = st.number_input("Amount to Convert", min_value=0.0, value=1.0, step=0.01)
 
-# Conversion logic
-if st.sidebar.button("Convert"):
-    try:
-        # Get the conversion rate using Yahoo Finance
-        pair_symbol = f"{from_currency}{to_currency}=X"
-        conversion_rate = yf.Ticker(pair_symbol).history(period="1d")['Close'].iloc[-1]
-        
-        # Perform the conversion
-        converted_amount = amount * conversion_rate
-        
-        # Display the result
-        st.sidebar.success(f"{amount:.3f} {from_currency} = {converted_amount:.3f} {to_currency}")
-    
-    except Exception as e:
-        st.sidebar.error(f"Error in conversion: {str(e)}")
+    # Conversion logic
+    if st.button("Convert"):
+        # Timed on its own: a fragment rerun has no page run to report to
+        fragment_timer = instrumentation.RunTimer()
+        try:
+            # Get the conversion rate using Yahoo Finance
+            pair_symbol = f"{from_currency}{to_currency}=X"
+            with fragment_timer.stage('fx'):
+                conversion_rate = yf.Ticker(pair_symbol).history(period="1d")['Close'].iloc[-1]
+
+            # Perform the conversion
+            converted_amount = amount * conversion_rate
+
+            # Display the result
+            st.success(f"{amount:.3f} {from_currency} = {converted_amount:.3f} {to_currency}")
+
+        except Exception as e:
+            st.error(f"Error in conversion: {str(e)}")
+        fragment_timer.finish(fragment='currency_converter')
+
+
+with st.sidebar:
+    currency_converter()
 
 
 #--------------------------#
@@ -256,116 +306,8 @@ hero_section = """
 </div>
 """
 
-st.markdown(page_style, unsafe_allow_html=True)
-st.markdown(hero_section, unsafe_allow_html=True)
-#--------------Main Code----------#
-st.write('\n')
-st.write('\n')
-st.write('\n')
-
-
-# Initialize the CurrencyCodes class
-c = CurrencyCodes()
-
-# Example usage: get the symbol for a currency code
-col1,col2,col3=st.columns(3)
-currency_code = col2.selectbox("Select Currency", ["USD", "EUR", "GBP", "INR", "JPY", "AUD", "OMR"])
-currency_symbol = c.get_symbol(currency_code)
-
-col1,col2,col3=st.columns(3)
-col2.write(f"Selected Currency: {currency_code} ({currency_symbol})")
-
-# Constants from EPA
-KWH_PER_HOUSEHOLD = 10800
-CO2_PER_KWH = 0.82  # kg CO2 per kWh
-GALLON_GAS_CO2 = 8.887  # kg CO2 per gallon of gasoline
-CO2_PER_CAR = 4.2  # metric tons of CO2 per car per year
-TREE_SEEDLING_CO2 = 0.039  # metric tons of CO2 per tree seedling over 10 years
-
-# CSS & HTML
-def styled_text_block(text, font_size='24px', color='#000000', background_color='#DBEAFE'):
-    html_code = f"""
-    <style>
-    .styled-text {{
-        font-size: {font_size};
-        font-weight: bold;
-        color: {color};
-        background-color: {background_color};
-        padding: 10px;
-        border-radius: 8px;
-        text-align: center;
-        box-shadow: 2px 2px 8px rgba(0, 0, 0, 0.1);
-        margin: 20px 0;
-    }}
-    </style>
-    <div class="styled-text">
-        {text}
-    </div>
-    """
-    st.markdown(html_code, unsafe_allow_html=True)
-    
-def render_centered_text_block(title, main_text, title_tag='h3', main_text_tag='h2', width='400px', background_color='#ffffff', fa_icon=None, icon_color=None):
-    # Enhanced CSS for the centered text block with reduced width and hover effect
-    centered_text_style = f"""
-        <style>
-        .centered-text-container {{
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            flex-direction: column;
-            text-align: center;
-            background-color: {background_color} !important;
-            border-radius: 10px;
-            padding: 30px;
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-            margin: 20px auto;
-            max-width: {width}; /* Adjust the width as needed */
-            transition: transform 0.3s ease, box-shadow 0.3s ease;
-        }}
-        .centered-text-container:hover {{
-            transform: translateY(-5px);
-            box-shadow: 0 8px 16px rgba(0, 0, 0, 0.2);
-        }}
-        .centered-text-container {title_tag} {{
-            margin: 0;
-            font-size: 24px;
-            color: #555;
-        }}
-        .centered-text-container {main_text_tag} {{
-            margin: 10px 0 0;
-            font-size: 32px;
-            font-weight: bold;
-            color: #000;
-        }}
-        .fa-icon {{
-            color: {icon_color};
-            margin-bottom: 10px;
-            font-size: 48px;
-        }}
-        </style>
-    """
-    
-    # HTML for centered text block with optional Font Awesome icon
-    icon_html = f'<i class="{fa_icon} fa-icon"></i>' if fa_icon else ''
-    centered_text_html = f"""
-        <div class="centered-text-container">
-            {icon_html}
-            <{title_tag}>{title}</{title_tag}>
-            <{main_text_tag}>{main_text}</{main_text_tag}>
-        </div>
-    """
-    
-    # Render CSS and HTML in Streamlit
-    st.markdown(centered_text_style, unsafe_allow_html=True)
-    st.markdown(centered_text_html, unsafe_allow_html=True)
-
-# Font Awesome CSS link
-st.markdown('<link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css" rel="stylesheet">', unsafe_allow_html=True)
-
-# Input form
-# Form Sections for User Inputs
-# Inject custom CSS to style input fields and background
-st.markdown("""
+# Custom CSS to style input fields and background
+form_css = """
     <style>
     /* Styling for the form background and elements */
     .form-container {
@@ -409,862 +351,1054 @@ st.markdown("""
         align: center;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+# Section titles and metric cards; the colours and sizes of each block are set on the block itself
+text_block_css = """
+    <style>
+    .styled-text {
+        font-weight: bold;
+        padding: 10px;
+        border-radius: 8px;
+        text-align: center;
+        box-shadow: 2px 2px 8px rgba(0, 0, 0, 0.1);
+        margin: 20px 0;
+    }
+    .centered-text-container {
+        display: flex;
+        justify-content: center;
+        align-items: center;
+        flex-direction: column;
+        text-align: center;
+        border-radius: 10px;
+        padding: 30px;
+        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
+        margin: 20px auto;
+        transition: transform 0.3s ease, box-shadow 0.3s ease;
+    }
+    .centered-text-container:hover {
+        transform: translateY(-5px);
+        box-shadow: 0 8px 16px rgba(0, 0, 0, 0.2);
+    }
+    .centered-text-container .centered-title {
+        margin: 0;
+        font-size: 24px;
+        color: #555;
+    }
+    .centered-text-container .centered-main {
+        margin: 10px 0 0;
+        font-size: 32px;
+        font-weight: bold;
+        color: #000;
+    }
+    .fa-icon {
+        margin-bottom: 10px;
+        font-size: 48px;
+    }
+    </style>
+    <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css" rel="stylesheet">
+"""
+
+
+# All static CSS as one element, joined once per process. The element is the same on every run,
+# so with global.minCachedMessageSize below its size (see setup.sh) the browser receives it once
+# per session and later runs send only its hash; fragment reruns do not send it at all
+@st.cache_resource
+def static_styles():
+    return '\n'.join((page_style, form_css, text_block_css, sidebar_css, contact_css))
+
+
+# The live-mode surrogate grid for the form's default project life, degradation and escalation,
+# started in the background when the server handles its first run
+@st.cache_resource
+def default_surrogate():
+    return live.prepare((25, 0.5, 2.0, 2.0, 1))
+
+
+default_surrogate()
+st.markdown(static_styles(), unsafe_allow_html=True)
+st.markdown(hero_section, unsafe_allow_html=True)
+#--------------Main Code----------#
+st.write('\n')
+st.write('\n')
+st.write('\n')
+
+
+# Initialize the CurrencyCodes class
+c = CurrencyCodes()
+
+# Scenario files: one scenario fills in the form, many are kept for a batch run
+CURRENCY_CODES = ["USD", "EUR", "GBP", "INR", "JPY", "AUD", "OMR"]
+with st.expander("Load scenarios from a file (JSON or Parquet)"):
+    scenario_file = st.file_uploader("Scenario file", type=["json", "parquet"])
+    if scenario_file is not None and st.session_state.get('scenario_file_id') != scenario_file.file_id:
+        st.session_state['scenario_file_id'] = scenario_file.file_id
+        try:
+            loaded_scenarios = scenario_files.load(scenario_file.name, scenario_file.getvalue())
+        except scenario_files.ScenarioFileError as error:
+            st.error(str(error))
+        else:
+            valid_rows, scenario_errors = scenario_files.validate(loaded_scenarios)
+            st.session_state['scenario_batch'] = (scenario_file.name, loaded_scenarios, valid_rows, scenario_errors)
+            if len(loaded_scenarios) == 1 and valid_rows[0]:
+                # Widget keys match the scenario fields, so setting them fills in the form
+                row = loaded_scenarios.iloc[0]
+                for name in scenario_files.TEXT_FIELDS:
+                    st.session_state[name] = row[name]
+                for name in model.PARAMETERS:
+                    st.session_state[name] = int(row[name]) if name in model.INTEGER_PARAMETERS else float(row[name])
+                st.session_state['discount_rate_percent'] = float(row['discount_rate']) * 100
+                st.session_state['grid_decarbonization'] = bool(row['grid_decarbonization'])
+                if row['currency_code'] not in CURRENCY_CODES:
+                    st.session_state['currency_code'] = 'USD'
+    if 'scenario_batch' in st.session_state:
+        batch_file_name, loaded_scenarios, valid_rows, scenario_errors = st.session_state['scenario_batch']
+        st.write(f"{batch_file_name}: {valid_rows.sum()} of {len(valid_rows)} scenarios valid")
+        if len(scenario_errors):
+            st.dataframe(scenario_errors.head(1000), hide_index=True)
+
+# Example usage: get the symbol for a currency code
+col1,col2,col3=st.columns(3)
+currency_code = col2.selectbox("Select Currency", CURRENCY_CODES, key='currency_code')
+currency_symbol = c.get_symbol(currency_code)
+
+col1,col2,col3=st.columns(3)
+col2.write(f"Selected Currency: {currency_code} ({currency_symbol})")
+
+# CSS & HTML
+def styled_text_block(text, font_size='24px', color='#000000', background_color='#DBEAFE'):
+    html_code = f"""
+    <div class="styled-text" style="font-size: {font_size}; color: {color}; background-color: {background_color};">
+        {text}
+    </div>
+    """
+    st.markdown(html_code, unsafe_allow_html=True)
+    
+def render_centered_text_block(title, main_text, title_tag='h3', main_text_tag='h2', width='400px', background_color='#ffffff', fa_icon=None, icon_color=None):
+    # Centered text block with reduced width and hover effect; the shared CSS is in text_block_css
+    icon_html = f'<i class="{fa_icon} fa-icon" style="color: {icon_color};"></i>' if fa_icon else ''
+    centered_text_html = f"""
+        <div class="centered-text-container" style="background-color: {background_color}; max-width: {width};">
+            {icon_html}
+            <{title_tag} class="centered-title">{title}</{title_tag}>
+            <{main_text_tag} class="centered-main">{main_text}</{main_text_tag}>
+        </div>
+    """
+    
+    # Render HTML in Streamlit
+    st.markdown(centered_text_html, unsafe_allow_html=True)
+
+# Input form
+# Form Sections for User Inputs
 
 # Begin form container div
 st.markdown('<div class="form-container">', unsafe_allow_html=True)
 
+# Live mode: the inputs rerun the page as they change and only the headline metrics are recalculated;
+# charts, tables and the PDF wait for Calculate
+col1, col2 = st.columns(2)
+live_mode = col1.toggle("Live mode (headline metrics update as you type)", key='live_mode')
+live_surrogate = col2.toggle("Instant estimates from an interpolated grid", key='live_surrogate', disabled=not live_mode)
+
 # Input form
-with st.form(key='solar_form'):
+with st.container() if live_mode else st.form(key='solar_form'):
     col1, col2 = st.columns(2)
     with col1:
         st.write("### Client Details")
-        client_name = st.text_input("Client Name")
-        client_address = st.text_input("Client Address")
-        client_email = st.text_input("Client Email")
+        client_name = st.text_input("Client Name", key='client_name')
+        client_address = st.text_input("Client Address", key='client_address')
+        client_email = st.text_input("Client Email", key='client_email')
     with col2:
         st.write("### Company Details")
-        company_name = st.text_input("Company Name")
-        company_prepared_by = st.text_input("Prepared by")
-        company_email = st.text_input("Company Email")
+        company_name = st.text_input("Company Name", key='company_name')
+        company_prepared_by = st.text_input("Prepared by", key='company_prepared_by')
+        company_email = st.text_input("Company Email", key='company_email')
     
     st.write('_____')
     st.write("## Solar PV System & Financial Details")
     
     col1, col2 = st.columns(2)
     with col1:
-        initial_investment = st.number_input(f"Initial Investment ({currency_symbol}/Wp)", min_value=0.000, value=1.000, step=0.001)
-        project_capacity = st.number_input("Project Capacity (kWp)", min_value=0.00, value=1.00, step=0.01)
-        o_and_m_cost = st.number_input(f"O&M Cost ({currency_symbol}/kWp per year)", min_value=0.000, value=10.000, step=0.001)
-        electricity_cost = st.number_input(f"Cost of Electricity ({currency_symbol}/kWh)", min_value=0.000, value=0.100, step=0.001)
-        project_life = st.number_input("Project Life (years)", min_value=1, value=25, step=1)
-        energy_generation_first_year = st.number_input("Energy Generation for First Year (kWh)", min_value=0.0, value=1500.0, step=1.0)
+        initial_investment = st.number_input(f"Initial Investment ({currency_symbol}/Wp)", min_value=0.000, value=1.000, step=0.001, key='initial_investment')
+        project_capacity = st.number_input("Project Capacity (kWp)", min_value=0.00, value=1.00, step=0.01, key='project_capacity')
+        o_and_m_cost = st.number_input(f"O&M Cost ({currency_symbol}/kWp per year)", min_value=0.000, value=10.000, step=0.001, key='o_and_m_cost')
+        electricity_cost = st.number_input(f"Cost of Electricity ({currency_symbol}/kWh)", min_value=0.000, value=0.100, step=0.001, key='electricity_cost')
+        project_life = st.number_input("Project Life (years)", min_value=1, value=25, step=1, key='project_life')
+        energy_generation_first_year = st.number_input("Energy Generation for First Year (kWh)", min_value=0.0, value=1500.0, step=1.0, key='energy_generation_first_year')
     with col2:
-        yearly_degradation = st.number_input("Yearly Degradation in Generation (%)", min_value=0.000, value=0.500, step=0.001)
-        o_and_m_escalation = st.number_input("O&M Cost Escalation (%)", min_value=0.0, value=2.0, step=0.1)
-        electricity_tariff_escalation = st.number_input("Electricity Tariff Escalation (%)", min_value=0.0, value=2.0, step=0.1)
-        escalation_years = st.number_input("Escalation Period (years)", min_value=1, value=1, step=1)
-        discount_rate = st.number_input("Discount Rate (%)", min_value=0.0, value=5.0, step=0.1) / 100
-        project_name = st.text_input('Name of the Project')
-    
-    submit_button = st.form_submit_button(label='Calculate')
+        yearly_degradation = st.number_input("Yearly Degradation in Generation (%)", min_value=0.000, value=0.500, step=0.001, key='yearly_degradation')
+        o_and_m_escalation = st.number_input("O&M Cost Escalation (%)", min_value=0.0, value=2.0, step=0.1, key='o_and_m_escalation')
+        electricity_tariff_escalation = st.number_input("Electricity Tariff Escalation (%)", min_value=0.0, value=2.0, step=0.1, key='electricity_tariff_escalation')
+        escalation_years = st.number_input("Escalation Period (years)", min_value=1, value=1, step=1, key='escalation_years')
+        discount_rate = st.number_input("Discount Rate (%)", min_value=0.0, value=5.0, step=0.1, key='discount_rate_percent') / 100
+        project_name = st.text_input('Name of the Project', key='project_name')
+        grid_region = st.selectbox("Grid Emission Factor Region", list(environment.GRID_EMISSION_FACTORS), key='grid_region')
+        grid_decarbonization = st.checkbox("Model a decarbonizing grid", value=True, key='grid_decarbonization')
+
+    col1, col2 = st.columns(2)
+    with col1:
+        scenario_name = st.text_input("Scenario Name (for comparison)", key='scenario_name')
+    with col2:
+        st.write('\n')
+        add_to_comparison = st.checkbox("Add to scenario comparison", value=True)
+
+    # Costs and tariff may be quoted in other currencies; cash flows are converted into the selected currency
+    with st.expander("Currencies of capex, O&M and tariff"):
+        currency_options = ["Selected currency"] + list(fx.CURRENCIES)
+        col1, col2, col3 = st.columns(3)
+        capex_currency = col1.selectbox("Capex currency", currency_options, key='capex_currency')
+        o_and_m_currency = col2.selectbox("O&M currency", currency_options, key='o_and_m_currency')
+        tariff_currency = col3.selectbox("Tariff currency", currency_options, key='tariff_currency')
+        col1, col2 = st.columns(2)
+        fx_drift = col1.number_input("FX forward drift (% per year)", value=0.0, step=0.1, key='fx_drift')
+        fx_source = col2.radio("Exchange rates", ["Offline rates file", "Live (Yahoo Finance)"], key='fx_source')
+
+    # Other ways for tariff and O&M prices to rise; the default is the escalation rate and period above
+    with st.expander("Escalation schedules"):
+        schedule_options = ["Step (escalation period)", "Compound yearly", "CPI-indexed", "Custom per-year"]
+        col1, col2 = st.columns(2)
+        tariff_schedule = col1.selectbox("Tariff escalation", schedule_options, key='tariff_schedule')
+        o_and_m_schedule = col2.selectbox("O&M escalation", schedule_options, key='o_and_m_schedule')
+        cpi_series = st.text_input("CPI inflation by year (%, comma-separated, the last value repeats)", value="3.0", key='cpi_series')
+        cpi_pass_through = st.number_input("CPI pass-through (%)", min_value=0.0, value=100.0, step=5.0, key='cpi_pass_through')
+        custom_multipliers = st.text_input("Custom price index by year (comma-separated, year 1 = 1.0, the last value repeats)",
+                                           value="1.0", key='custom_multipliers')
+        col1, col2 = st.columns(2)
+        escalation_cap = col1.number_input("Cap on yearly escalation (%)", value=None, step=0.1, key='escalation_cap')
+        escalation_floor = col2.number_input("Floor on yearly escalation (%)", value=None, step=0.1, key='escalation_floor')
+
+    # Degradation curve; the default compounds the yearly degradation above
+    with st.expander("Degradation model"):
+        degradation_model = st.selectbox("Degradation model", ["Constant yearly rate", "Linear", "First-year LID, then yearly rate",
+                                                              "Accelerating ageing", "Custom per-year"], key='degradation_model')
+        col1, col2 = st.columns(2)
+        lid_loss = col1.number_input("First-year LID (%)", min_value=0.0, max_value=100.0, value=2.0, step=0.1, key='lid_loss')
+        degradation_acceleration = col2.number_input("Yearly increase of the degradation rate (% points)", min_value=0.0,
+                                                     value=0.02, step=0.01, format="%.3f", key='degradation_acceleration')
+        custom_generation = st.text_input("Custom generation multipliers by year (comma-separated, the last value repeats)",
+                                          value="1.0", key='custom_generation')
+        warranty_cap = st.checkbox("Cap losses at the linear power warranty", key='warranty_cap')
+        col1, col2, col3 = st.columns(3)
+        warranty_first_year = col1.number_input("Warranted output in year 1 (%)", min_value=0.0, max_value=100.0, value=97.5,
+                                                step=0.1, key='warranty_first_year')
+        warranty_yearly = col2.number_input("Warranted yearly decline (% points)", min_value=0.0, value=0.5, step=0.05,
+                                            key='warranty_yearly')
+        warranty_term = col3.number_input("Warranty term (years)", min_value=1, value=25, step=1, key='warranty_term')
+
+    # Inverter replacements, battery augmentation, decommissioning...
+    with st.expander("Capex events"):
+        st.write("Costs in today's money in the capex currency, escalated yearly to the event year. "
+                 "Events below 100% probability are charged at their expected cost, and drawn per sample in Monte Carlo.")
+        capex_event_rows = st.data_editor(
+            pd.DataFrame({'Event': pd.Series(dtype=str), 'Year': pd.Series(dtype=int), 'Cost': pd.Series(dtype=float),
+                          'Escalation (%)': pd.Series(dtype=float), 'Probability (%)': pd.Series(dtype=float)}),
+            num_rows='dynamic', hide_index=True, key='capex_events',
+            column_config={'Year': st.column_config.NumberColumn(min_value=1, step=1),
+                           'Cost': st.column_config.NumberColumn(min_value=0.0),
+                           'Escalation (%)': st.column_config.NumberColumn(default=0.0),
+                           'Probability (%)': st.column_config.NumberColumn(min_value=0.0, max_value=100.0, default=100.0)})
+
+    # Battery charged from PV and discharged into the time-of-use peak
+    with st.expander("Battery storage"):
+        include_battery = st.checkbox("Add a battery", key='include_battery')
+        col1, col2, col3 = st.columns(3)
+        battery_capacity = col1.number_input("Capacity (kWh)", min_value=0.0, value=2.0, step=0.5, key='battery_capacity')
+        battery_power = col2.number_input("Power (kW)", min_value=0.0, value=1.0, step=0.5, key='battery_power')
+        battery_efficiency = col3.number_input("Round-trip efficiency (%)", min_value=1.0, max_value=100.0, value=90.0, step=1.0,
+                                               key='battery_efficiency')
+        col1, col2 = st.columns(2)
+        battery_fade = col1.number_input("Capacity fade (% per full cycle)", min_value=0.0, value=0.004, step=0.001, format="%.4f",
+                                         key='battery_fade')
+        battery_cost = col2.number_input("Battery cost (per kWh, capex currency)", min_value=0.0, value=300.0, step=10.0,
+                                         key='battery_cost')
+        col1, col2, col3 = st.columns(3)
+        peak_start = col1.number_input("Peak tariff from (hour)", min_value=0, max_value=23, value=17, step=1, key='peak_start')
+        peak_end = col2.number_input("Peak tariff until (hour)", min_value=1, max_value=24, value=22, step=1, key='peak_end')
+        peak_multiplier = col3.number_input("Peak tariff (x base tariff)", min_value=0.0, value=1.5, step=0.1, key='peak_multiplier')
+        pv_profile_file = st.file_uploader("Hourly PV output profile (CSV, 8760 hourly or 15-minute values; optional)", type=['csv'],
+                                           key='pv_profile_file')
+
+    # Customer consumption: generation is worth the retail tariff only when used on site or netted
+    with st.expander("Load profile and net metering"):
+        load_profile_file = st.file_uploader("Customer load profile (CSV of kWh, 8760 hourly or 15-minute values)", type=['csv'],
+                                             key='load_profile_file')
+        col1, col2 = st.columns(2)
+        export_tariff = col1.number_input("Export Tariff (per kWh)", min_value=0.0, value=0.04, step=0.01, format="%.3f",
+                                          key='export_tariff')
+        banking_labels = {'none': "No banking (net billing)", 'monthly': "Monthly netting", 'annual': "Annual banking"}
+        banking_rule = col2.selectbox("Net-metering banking", list(banking_labels), format_func=banking_labels.get, key='banking_rule')
+    
+    submit_button = st.button('Calculate', key='calculate') if live_mode else st.form_submit_button(label='Calculate')
 
 # End the form container div
 st.markdown('</div>', unsafe_allow_html=True)
 
+# Headline metrics of live mode, filled in once the inputs are read
+if live_mode and not submit_button:
+    live_metrics = st.empty()
+    live_status = st.empty()
+
+def show_headline(metrics):
+    # NaN where the surrogate cannot interpolate; the exact figures follow
+    def shown(value, text):
+        return "…" if np.isnan(value) else text
+    with live_metrics.container():
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("LCoE", shown(metrics['lcoe'], f"{currency_symbol}{metrics['lcoe']:.4f}/kWh"))
+        col2.metric("NPV", shown(metrics['npv'], f"{currency_symbol}{metrics['npv']:,.3f}"))
+        col3.metric("IRR", shown(metrics['irr'], f"{metrics['irr'] * 100:.3f}%"))
+        col4.metric("Simple Payback", shown(metrics['payback_period'], payback.describe(metrics['payback_period'])))
+
+
+
+# Form inputs as entered
+model_inputs = {
+    'initial_investment': initial_investment,
+    'project_capacity': project_capacity,
+    'o_and_m_cost': o_and_m_cost,
+    'electricity_cost': electricity_cost,
+    'project_life': project_life,
+    'energy_generation_first_year': energy_generation_first_year,
+    'yearly_degradation': yearly_degradation,
+    'o_and_m_escalation': o_and_m_escalation,
+    'electricity_tariff_escalation': electricity_tariff_escalation,
+    'escalation_years': escalation_years,
+    'discount_rate': discount_rate,
+}
+
+# Exchange-rate curves into the selected currency (all ones when nothing is in another currency)
+fx_currencies = {cost: currency_code if choice == "Selected currency" else choice
+                 for cost, choice in (('capex', capex_currency), ('o_and_m', o_and_m_currency), ('tariff', tariff_currency))}
+try:
+    fx_model_inputs = fx.fx_inputs(fx_currencies, currency_code, int(project_life), fx_drift,
+                                   source='live' if fx_source.startswith('Live') else 'offline')
+except ValueError as error:
+    st.error(f"Exchange rates: {error}")
+    fx_model_inputs = {}
+
+# Price indices for the chosen escalation schedules; left out for the default step schedule
+def escalation_schedule(choice, rate):
+    if choice == "Compound yearly":
+        schedule = escalation.compound(rate)
+    elif choice == "CPI-indexed":
+        schedule = escalation.cpi([float(value) for value in cpi_series.split(',')], cpi_pass_through)
+    elif choice == "Custom per-year":
+        schedule = escalation.custom([float(value) for value in custom_multipliers.split(',')])
+    else:
+        schedule = escalation.step(rate, escalation_years)
+    if escalation_cap is not None or escalation_floor is not None:
+        schedule = escalation.capped(schedule, escalation_cap, escalation_floor)
+    return schedule
+
+escalation_model_inputs = {}
+try:
+    for name, choice, rate in (('tariff_index', tariff_schedule, electricity_tariff_escalation),
+                               ('o_and_m_index', o_and_m_schedule, o_and_m_escalation)):
+        schedule = escalation_schedule(choice, rate)
+        if schedule != escalation.step(rate, escalation_years):
+            escalation_model_inputs[name] = escalation.multipliers(schedule, int(project_life))[None, :]
+except ValueError:
+    st.error("Escalation schedules: the CPI and custom values must be comma-separated numbers")
+    escalation_model_inputs = {}
+
+# Generation multipliers for the chosen degradation model; left out for the constant yearly rate
+try:
+    if degradation_model == "Linear":
+        generation_model = degradation.linear(yearly_degradation)
+    elif degradation_model == "First-year LID, then yearly rate":
+        generation_model = degradation.lid(lid_loss, yearly_degradation)
+    elif degradation_model == "Accelerating ageing":
+        generation_model = degradation.nonlinear(yearly_degradation, degradation_acceleration)
+    elif degradation_model == "Custom per-year":
+        generation_model = degradation.custom([float(value) for value in custom_generation.split(',')])
+    else:
+        generation_model = degradation.compound(yearly_degradation)
+    if warranty_cap:
+        generation_model = degradation.warranty_capped(generation_model, warranty_first_year, warranty_yearly, int(warranty_term))
+except ValueError:
+    st.error("Degradation model: the custom multipliers must be comma-separated numbers")
+    generation_model = degradation.compound(yearly_degradation)
+degradation_model_inputs = {}
+if generation_model != degradation.compound(yearly_degradation):
+    degradation_model_inputs['generation_index'] = degradation.multipliers(generation_model, int(project_life))[None, :]
+
+# Capex events from the complete rows of the table
+capex_event_rows = capex_event_rows.dropna(subset=['Year', 'Cost']).fillna({'Escalation (%)': 0.0, 'Probability (%)': 100.0})
+event_model_inputs = {}
+if len(capex_event_rows):
+    event_model_inputs['capex_events'] = capex_events.event_table([
+        capex_events.event(int(row['Year']), float(row['Cost']), float(row['Escalation (%)']), float(row['Probability (%)']) / 100)
+        for _, row in capex_event_rows.iterrows()])
+
+# Battery settings and the rows they add to the PDF inputs table
+battery_model_inputs = {}
+extra_report_inputs = {}
+if include_battery:
+    try:
+        pv_profile = profiles.read_profile(pv_profile_file.getvalue()) if pv_profile_file is not None else None
+        battery_model_inputs['battery'] = battery.battery(
+            battery_capacity, battery_power, battery_efficiency, battery_fade, battery_cost,
+            pv_profile=pv_profile, tariff_profile=profiles.tou_profile(peak_start, peak_end, peak_multiplier))
+        extra_report_inputs = {
+            "Battery (kWh / kW)": f"{battery_capacity:.1f} kWh / {battery_power:.1f} kW",
+            "Battery Round-trip Efficiency (%)": f"{battery_efficiency:.1f}%",
+            f"Battery Cost ({currency_symbol}/kWh)": f"{currency_symbol}{battery_cost:,.2f}",
+            "Peak Tariff": f"{peak_multiplier:.2f}x from {peak_start}:00 to {peak_end}:00",
+        }
+    except ValueError as error:
+        st.error(f"PV profile: {error}")
+
+# Self-consumption and exports against the uploaded load profile
+metering_model_inputs = {}
+if load_profile_file is not None:
+    try:
+        pv_shape = profiles.read_profile(pv_profile_file.getvalue()) if pv_profile_file is not None else None
+        metering_model_inputs['metering'] = metering.net_metering(
+            profiles.read_profile(load_profile_file.getvalue()), export_tariff, banking_rule, pv_profile=pv_shape)
+        extra_report_inputs = dict(extra_report_inputs, **{
+            f"Export Tariff ({currency_symbol}/kWh)": f"{currency_symbol}{export_tariff:.3f}",
+            "Net-metering Banking": banking_labels[banking_rule],
+        })
+    except ValueError as error:
+        st.error(f"Load profile: {error}")
+
+# Everything the model takes from the form
+form_model_inputs = dict(model_inputs, **fx_model_inputs, **escalation_model_inputs, **degradation_model_inputs, **event_model_inputs,
+                         **battery_model_inputs, **metering_model_inputs)
+
+# Live mode: an instant estimate now, the exact figures at the end of the run
+if live_mode and not submit_button and live_surrogate:
+    estimate = live.estimate(form_model_inputs)
+    if estimate is not None:
+        show_headline(estimate)
+        live_status.caption("Estimated from the interpolated grid; exact figures follow when the inputs settle")
+
+# Save the form as a scenario file; refused while inputs the schema cannot hold are set, since loading
+# the file back would give other results
+try:
+    scenario_json = scenario_files.to_json(dict(
+        scenario_name=scenario_name, client_name=client_name, client_address=client_address, client_email=client_email,
+        company_name=company_name, company_prepared_by=company_prepared_by, company_email=company_email,
+        project_name=project_name, currency_code=currency_code, grid_region=grid_region,
+        grid_decarbonization=grid_decarbonization, **form_model_inputs))
+except scenario_files.ScenarioFileError:
+    scenario_json = None
+st.download_button("Save scenario (JSON)", scenario_json or b'', disabled=scenario_json is None,
+                   file_name=f"{scenario_name or project_name or 'scenario'}.json", mime='application/json')
+if scenario_json is None:
+    st.caption("Scenario files hold the basic inputs only. Reset the currencies, escalation schedules, degradation model, "
+               "capex events, battery and load profile to save this scenario.")
+
+# Upload the company logo and choose the PDF quality. They only feed the report, so they run as a fragment:
+# changing them reruns this function alone, and the next Calculate reads them from the session state
+pdf_quality_labels = {
+    'standard': "Standard",
+    'compact': "Compact (smaller file, reduced colours)",
+    'vector': "Vector charts (sharp at any zoom, slower)",
+    'draft': "Draft (fastest, smallest)",
+}
 
 
-# Upload the company logo
-logo_file = st.file_uploader("Choose a company logo (PNG/JPEG)", type=["png", "jpeg", "jpg"])
+@st.fragment
+def report_options():
+    st.file_uploader("Choose a company logo (PNG/JPEG)", type=["png", "jpeg", "jpg"], key='logo_file')
+    st.selectbox("PDF report quality", list(pdf_quality_labels), format_func=pdf_quality_labels.get, key='pdf_quality')
 
-# Calculations
-if submit_button:
-    initial_investment_total = initial_investment * project_capacity * 1000  # Convert kWp to Wp
-    yearly_generation = energy_generation_first_year
-    total_revenue = 0
-    total_o_and_m_cost = 0
-    cash_flows = [-initial_investment_total]
-    yearly_generations = []
-    yearly_degradations = []
-    yearly_gross_revenues = []
-    yearly_o_and_m_expenses = []
-    cumulative_net_revenues = []
-    cumulative_net_revenue = -initial_investment_total
-    annual_rois = []
-
-    for year in range(1, project_life + 1):
-        annual_revenue = yearly_generation * electricity_cost
-        annual_o_and_m_cost = o_and_m_cost * project_capacity
-
-        if year % escalation_years == 0 and year != 1:
-            o_and_m_cost *= (1 + o_and_m_escalation / 100)
-            electricity_cost *= (1 + electricity_tariff_escalation / 100)
-
-        cash_flow = annual_revenue - annual_o_and_m_cost
-        cash_flows.append(cash_flow)
-
-        cumulative_net_revenue += cash_flow
-        cumulative_net_revenues.append(cumulative_net_revenue)
-
-        yearly_generations.append(yearly_generation)
-        yearly_degradations.append(yearly_generation * yearly_degradation / 100)
-        yearly_gross_revenues.append(annual_revenue)
-        yearly_o_and_m_expenses.append(annual_o_and_m_cost)
-
-        total_revenue += annual_revenue
-        total_o_and_m_cost += annual_o_and_m_cost
-        yearly_generation *= (1 - yearly_degradation / 100)
-
-        # Calculate ROI for the year
-        annual_roi = (cash_flow / initial_investment_total) * 100
-        annual_rois.append(annual_roi)
-
-    # NPV calculation
-    npv = npf.npv(discount_rate, cash_flows)
-    
-    # IRR calculation
-    irr = npf.irr(cash_flows) * 100
 
-    # Simple payback period calculation
-    cumulative_cash_flow = np.cumsum(cash_flows)
-    payback_period_years = np.argmax(cumulative_cash_flow > 0)
-    
-    if payback_period_years == 0:
-        payback_period_months = 0
-    else:
-        previous_year_cash_flow = cumulative_cash_flow[payback_period_years - 1]
-        year_cash_flow = cumulative_cash_flow[payback_period_years]
-        additional_months_fraction = (previous_year_cash_flow) / (previous_year_cash_flow - year_cash_flow)
-        additional_months = int(additional_months_fraction * 12)
-        payback_period_years -= 1
-
-    # Calculate annual average ROI
-    annual_average_roi = np.mean(annual_rois)
-    
-    # LCoE calculation
-    total_costs = initial_investment_total + sum(yearly_o_and_m_expenses[i] / (1 + discount_rate) ** (i + 1) for i in range(project_life))
-    total_generation = sum(yearly_generations[i] / (1 + discount_rate) ** (i + 1) for i in range(project_life))
-    lcoe = total_costs / total_generation
-
-    st.subheader("Results")
-    #st.write(f"Total Gross Revenue: {currency_symbol}{total_revenue:,.3f}")
-    #st.write(f"Total O&M Cost: {currency_symbol}{total_o_and_m_cost:,.3f}")
-    #st.write(f"Total Net Revenue: {currency_symbol}{cumulative_net_revenue:,.3f}")
-    #st.write(f"NPV: {currency_symbol}{npv:,.3f}")
-    #st.write(f"IRR: {irr:.3f}%")
-    #st.write(f"Simple Payback Period: {payback_period_years} years and {additional_months} months")
-    #st.write(f"Annual Average ROI: {annual_average_roi:.3f}%")
-    #st.write(f"LCoE: {currency_symbol}{lcoe:.4f}/kWh")
-
-    # Key Metrics Display
-    render_centered_text_block("Levelized Cost of Energy", f"{currency_symbol}{lcoe:.4f}/kWh", width='800px', fa_icon='fas fa-balance-scale', icon_color='darkblue')
-    col1, col2 = st.columns(2)
-    with col1:
-        render_centered_text_block("Total Gross Revenue", f"{currency_symbol}{total_revenue:,.3f}", background_color='#DBD46D', fa_icon='fas fa-dollar-sign', icon_color='green')
-    with col2:
-        render_centered_text_block("Total O&M Cost", f"{currency_symbol}{total_o_and_m_cost:,.3f}", background_color='#DBEAFE', fa_icon='fas fa-tools', icon_color='red')
-    render_centered_text_block("Total Net Revenue", f"{currency_symbol}{cumulative_net_revenue:,.3f}", background_color='#DBEAFE', fa_icon='fas fa-chart-line', icon_color='blue')
-    
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        render_centered_text_block("NPV", f"{currency_symbol}{npv:,.3f}", background_color='#DBD46D', fa_icon='fas fa-money-bill-wave', icon_color='orange')
-    with col2:
-        render_centered_text_block("IRR", f"{irr:.3f}%", background_color='#DBEAFE', fa_icon='fas fa-percentage', icon_color='purple')
-    with col3:
-        render_centered_text_block("Annual Avg ROI", f"{annual_average_roi:.3f}%", background_color='#DBEAFE', fa_icon='fas fa-chart-pie', icon_color='darkgreen')
-    render_centered_text_block("Simple Payback Period", f"{payback_period_years} years and {additional_months} months", background_color='#DBEAFE', fa_icon='fas fa-hourglass-half', icon_color='brown')
-
-    # Data for plots
-    # Calculating % Yearly Degradation
-    percentage_yearly_degradation = [((initial_gen - current_gen) / initial_gen) * 100 
-                                     for initial_gen, current_gen in zip([energy_generation_first_year]*project_life, yearly_generations)]
-    
-    # Constructing the DataFrame with an additional column for % Yearly Degradation
-    df_cash_flows = pd.DataFrame({
-        'Year': range(1, project_life + 1),
-        'Energy Yield (kWh)': yearly_generations,
-        'Yearly Degradation (kWh)': yearly_degradations,
-        '% Yearly Degradation': percentage_yearly_degradation,
-        f'Gross Revenue ({currency_symbol})': yearly_gross_revenues,
-        f'O&M Expense ({currency_symbol})': yearly_o_and_m_expenses,
-        f'Cash Flow ({currency_symbol})': cash_flows[1:],
-        f'Cumulative Net Revenue ({currency_symbol})': cumulative_net_revenues
-    })
-    
-    # Create a figure and axis with a specified figure size
-    fig1, ax1 = plt.subplots()  # Set a reasonable size for the figure
-    
-    # Bar chart for Yearly Generation (Energy Yield)
-    bars = ax1.bar(df_cash_flows['Year'], df_cash_flows['Energy Yield (kWh)'], color='#1E90FF', label='Energy Yield (kWh)')
-    
-    # Create a second y-axis for the line chart of Yearly Degradation (%)
-    ax2 = ax1.twinx()
-    
-    # Line chart for Yearly Degradation (%)
-    ax2.plot(df_cash_flows['Year'], df_cash_flows['% Yearly Degradation'], color='orange', linewidth=2.5, marker='o', label='% Yearly Degradation')
-    
-    # Set axis labels and title
-    ax1.set_xlabel('Year')
-    ax1.set_ylabel('Energy Yield (kWh)', color='#1E90FF')
-    ax2.set_ylabel('% Yearly Degradation', color='orange')
-    plt.title('Year-On-Year Degradation Analysis – For 25 Years', fontsize=14)
-    
-    # Set the limits for the y-axes
-    ax1.set_ylim(df_cash_flows['Energy Yield (kWh)'].min() * 0.5, df_cash_flows['Energy Yield (kWh)'].max() * 1.05)  # Dynamic limits based on data
-    ax2.set_ylim(0, df_cash_flows['% Yearly Degradation'].max() * 1.1)  # Adjust the limits for Yearly Degradation (%)
-    
-    # Set the ticks for the x-axis to show all the years
-    ax1.set_xticks(df_cash_flows['Year'])
-    
-    # Add integer data labels inside the bars at the top edge
-    for bar in bars:
-        yval = int(bar.get_height())  # Convert to integer
-        ax1.text(bar.get_x() + bar.get_width() / 2, yval - 5, f'{yval}', ha='center', va='top', fontsize=9, color='white', rotation=90, fontweight='bold')
-    
-    # Legends for both the bar chart and the line chart
-    ax1.legend(loc='upper left')
-    ax2.legend(loc='upper right')
-    
-    # Save and display the chart
-    plt.savefig('yearly_generation_degradation.png')
-    st.pyplot(fig1)
-    plt.close(fig1)
-    
-    # Cumulative Cash Flow and Break-even
-    fig33, ax3 = plt.subplots()
-    ax3.plot(df_cash_flows['Year'], cumulative_cash_flow[1:], marker='o', label='Cumulative Cash Flow')
-    ax3.axhline(0, color='red', linestyle='--')
-    ax3.annotate(f'Simple Payback in: {payback_period_years} years and {additional_months} months',
-                 xy=(payback_period_years, 0), xytext=(payback_period_years, -0.1 * max(cumulative_cash_flow)),
-                 arrowprops=dict(facecolor='black', arrowstyle='->'))
-    ax3.set_xlabel('Year')
-    ax3.set_ylabel(f'Cumulative Cash Flow ({currency_symbol})')
-    ax3.set_title('Cumulative Cash Flow and Break-even')
-    ax3.legend()
-    
-    # Save the chart as an image
-    plt.savefig('cumulative_cash_flow.png')
-    
-    # Yearly Gross Revenue and O&M Expense
-    fig44, ax4 = plt.subplots()
-    width = 0.35  # Width of the bars
-    ax4.bar(df_cash_flows['Year'] - width/2, df_cash_flows[f'Gross Revenue ({currency_symbol})'], width, label='Yearly Gross Revenue')
-    ax4.bar(df_cash_flows['Year'] + width/2, df_cash_flows[f'O&M Expense ({currency_symbol})'], width, label='Yearly O&M Expense', color='red')
-    ax4.set_xlabel('Year')
-    ax4.set_ylabel(f'Amount ({currency_symbol})')
-    ax4.set_title('Yearly Gross Revenue and O&M Expense')
-    ax4.legend()
-    
-    # Save the chart as an image
-    plt.savefig('yearly_gross_revenue_om_expense.png')
-    
-    # Display the charts in Streamlit
-    st.pyplot(fig33)
-    st.pyplot(fig44)
-
-
-    # Table display
-    styled_df = df_cash_flows.style.format({
-        'Year': '{:.0f}',
-        'Energy Yield (kWh)': '{:.3f}',
-        'Yearly Degradation (kWh)': '{:.3f}',
-        '% Yearly Degradation':'{:.3f}',
-        f'Gross Revenue ({currency_symbol})': '{:.3f}',
-        f'O&M Expense ({currency_symbol})': '{:.3f}',
-        f'Cash Flow ({currency_symbol})': '{:.3f}',
-        f'Cumulative Net Revenue ({currency_symbol})': '{:.3f}'
-    }).set_table_styles(
-        [{'selector': 'td', 'props': [('text-align', 'center')]},
-         {'selector': 'th', 'props': [('text-align', 'center')]}]
+report_options()
+logo_file = st.session_state['logo_file']
+pdf_quality = st.session_state['pdf_quality']
+
+# Background job queue, one process pool shared by every session of this server
+@st.cache_resource
+def job_queue():
+    return JobQueue(
+        max_workers=int(os.environ.get('SOLAR_FIN_JOB_WORKERS', 0)) or None,
+        max_queued=int(os.environ.get('SOLAR_FIN_MAX_JOBS', 16)),
+        max_per_session=int(os.environ.get('SOLAR_FIN_JOBS_PER_SESSION', 2)),
     )
 
-    html_cash_flows_df = styled_df.to_html(index=False)
-    styled_text_block("Lifetime Energy Yield (kWh) and Cash Flows", color='#333333', background_color='#FFFFE0')
 
-    # Center the table using HTML and CSS
-    centered_table = f"""
-    <div style="display: flex; justify-content: center;text-align: center;">
-        {html_cash_flows_df}</div>
-    """
+# Persistent result store (SQLite, SOLAR_FIN_STORE), shared by every session
+@st.cache_resource
+def open_result_store():
+    return ResultStore()
 
-    st.markdown(centered_table, unsafe_allow_html=True)
 
-    # Environmental Benefits
-    houses_energized = yearly_generation / KWH_PER_HOUSEHOLD
-    co2_saved_kg = yearly_generation * CO2_PER_KWH
-    gallons_gas_saved = co2_saved_kg / GALLON_GAS_CO2
-    co2_saved_tonnes = co2_saved_kg / 1000
-    cars_taken_off_road = co2_saved_tonnes / CO2_PER_CAR
-    tree_seedlings = co2_saved_tonnes / TREE_SEEDLING_CO2
+result_store = open_result_store()
 
-    st.write('\n')
-    st.write('\n')
-    st.write('\n')
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = uuid.uuid4().hex
 
+# Scenario comparison store, kept across reruns of this session
+if 'scenario_store' not in st.session_state:
+    st.session_state['scenario_store'] = ScenarioStore()
+scenario_store = st.session_state['scenario_store']
 
-    st.markdown(f"""
-        <div style="text-align: center;">
-            <h2>Environmental Benefits</h2>
-            <div style="display: flex; justify-content: space-around; align-items: center; flex-wrap: wrap;">
-                <div style="margin: 20px;">
-                    <i class="fas fa-home fa-3x" style="color: orange;"></i>
-                    <h3>{houses_energized:.3f}</h3>
-                    <p>Houses Energized per Year</p>
-                </div>
-                <div style="margin: 20px;">
-                    <i class="fas fa-gas-pump fa-3x" style="color: skyblue;"></i>
-                    <h3>{gallons_gas_saved:.3f}</h3>
-                    <p>Gallons of Gas Saved per Year</p>
-                </div>
-                <div style="margin: 20px;">
-                    <i class="fas fa-car fa-3x" style="color: blue;"></i>
-                    <h3>{cars_taken_off_road:.3f}</h3>
-                    <p>Cars Taken Off Road per Year</p>
-                </div>
-                <div style="margin: 20px;">
-                    <i class="fas fa-tree fa-3x" style="color: green;"></i>
-                    <h3>{tree_seedlings:.3f}</h3>
-                    <p>Tree Seedlings Grown for 10 Years</p>
-                </div>
-                <div style="margin: 20px;">
-                    <i class="fas fa-cloud fa-3x" style="color: gray;"></i>
-                    <h3>{co2_saved_tonnes:.3f}</h3>
-                    <p>Tonnes of CO2 Emissions Saved per Year</p>
+# Portfolio roll-up of saved proposals, updated project by project
+if 'portfolio_rollup' not in st.session_state:
+    st.session_state['portfolio_rollup'] = portfolio.Portfolio()
+portfolio_rollup = st.session_state['portfolio_rollup']
+
+#-----Results (nodes of the calculation graph)-----#
+
+def yearly_results(timeline, generation, revenue, o_and_m, cash_flow):
+    # Per-year series of the (single) project in one record array
+    return yearly_array(dict(timeline, **generation, **revenue, **o_and_m, **cash_flow))
+
+
+def result_summary(yearly, timeline, cash_flow, revenue, o_and_m, discounted, returns, environment):
+    # Headline metrics of the project, as shown on the page and in the PDF
+    stages = dict(timeline, **cash_flow, **revenue, **o_and_m, **discounted, **returns, **environment)
+    return ProjectResult.from_results(stages, yearly=yearly)
+
+
+def project_cash_flow_chart(yearly, cash_flow, currency_symbol):
+    return cash_flow_chart(yearly, cash_flow['payback_period'][0], currency_symbol)
+
+
+# Rendered outputs saved with each proposal in the result store
+REPORT_ARTIFACTS = {'generation_chart', 'cash_flow_chart', 'revenue_chart', 'report'}
+
+# Longer cash-flow tables are shown with st.dataframe instead of HTML
+TABLE_HTML_MAX_ROWS = 100
+
+# Calculation graph, memoized across reruns of this session
+if 'calc_graph' not in st.session_state:
+    st.session_state['calc_graph'] = model_graph()
+calc_graph = st.session_state['calc_graph']
+calc_graph.add('yearly', yearly_results, deps=('timeline', 'generation', 'revenue', 'o_and_m', 'cash_flow'))
+calc_graph.add('summary', result_summary, deps=('yearly', 'timeline', 'cash_flow', 'revenue', 'o_and_m', 'discounted', 'returns', 'environment'))
+calc_graph.add('table_html', cash_flow_table_html, params=('currency_symbol',), deps=('yearly',))
+calc_graph.add('generation_chart', generation_chart, deps=('yearly',))
+calc_graph.add('cash_flow_chart', project_cash_flow_chart, params=('currency_symbol',), deps=('yearly', 'cash_flow'))
+calc_graph.add('revenue_chart', revenue_chart, params=('currency_symbol',), deps=('yearly',))
+
+# Calculations
+if submit_button:
+    # Optional profile of the whole calculation (SOLAR_FIN_PROFILE, or ?profile= where SOLAR_FIN_PROFILE_QUERY allows it);
+    # the profiler stops even when the calculation raises
+    profile_mode = instrumentation.requested_profile(st.query_params)
+    with instrumentation.Profile(profile_mode) if profile_mode else contextlib.nullcontext() as profiler:
+
+        if add_to_comparison:
+            scenario_store.update({scenario_name or project_name or f"Scenario {len(scenario_store) + 1}": form_model_inputs})
+
+        # Incremental calculation: only nodes downstream of a changed input are recomputed
+        calc_graph.begin_run()
+        graph_inputs = dict(
+            model.broadcast_inputs(form_model_inputs),
+            grid_region=grid_region,
+            grid_decarbonization=grid_decarbonization,
+            start_year=datetime.now().year,
+            currency_symbol=currency_symbol,
+        )
+        # Client and company details only feed the report
+        graph_inputs['form'] = dict(model_inputs, client_name=client_name, client_address=client_address, project_name=project_name,
+                                    company_name=company_name, company_prepared_by=company_prepared_by, company_email=company_email,
+                                    extra_inputs=extra_report_inputs)
+        graph_inputs['logo'] = logo_file.getvalue() if logo_file is not None else None
+        graph_inputs['pdf_quality'] = pdf_quality
+
+        # A proposal saved earlier with identical inputs is read back instead of recomputed
+        proposal_inputs = {name: graph_inputs[name] for name in ('form', 'logo', 'pdf_quality', 'grid_region', 'grid_decarbonization', 'start_year', 'currency_symbol') + model.FX_PARAMETERS + model.INDEX_PARAMETERS + ('capex_events',)}
+        # Hourly profiles are keyed by content rather than stored value by value
+        for name in ('battery', 'metering'):
+            if graph_inputs[name] is not None:
+                proposal_inputs[name] = {key: value.tobytes() if key.endswith('_profile') or key == 'load' else value
+                                         for key, value in graph_inputs[name].items()}
+        stored_key = proposal_key(proposal_inputs)
+        with run_timer.stage('store'):
+            stored = result_store.get(stored_key)
+        if stored is not None and not REPORT_ARTIFACTS <= set(stored.artifacts):
+            stored = None
+        with run_timer.stage('model'):
+            result = stored.result if stored is not None else calc_graph.compute('summary', graph_inputs)
+        initial_investment_total = result.initial_investment_total
+        total_revenue = result.total_revenue
+        total_o_and_m_cost = result.total_o_and_m_cost
+        cumulative_net_revenue = result.cumulative_net_revenue
+        npv = result.npv
+        irr = result.irr
+        payback_text = payback.describe(result.payback_period)
+        discounted_payback_text = payback.describe(result.discounted_payback_period)
+        annual_average_roi = result.annual_average_roi
+        lcoe = result.lcoe
+
+        st.subheader("Results")
+        #st.write(f"Total Gross Revenue: {currency_symbol}{total_revenue:,.3f}")
+        #st.write(f"Total O&M Cost: {currency_symbol}{total_o_and_m_cost:,.3f}")
+        #st.write(f"Total Net Revenue: {currency_symbol}{cumulative_net_revenue:,.3f}")
+        #st.write(f"NPV: {currency_symbol}{npv:,.3f}")
+        #st.write(f"IRR: {irr:.3f}%")
+        #st.write(f"Simple Payback Period: {payback_text}")
+        #st.write(f"Annual Average ROI: {annual_average_roi:.3f}%")
+        #st.write(f"LCoE: {currency_symbol}{lcoe:.4f}/kWh")
+
+        # Key Metrics Display
+        render_centered_text_block("Levelized Cost of Energy", f"{currency_symbol}{lcoe:.4f}/kWh", width='800px', fa_icon='fas fa-balance-scale', icon_color='darkblue')
+        col1, col2 = st.columns(2)
+        with col1:
+            render_centered_text_block("Total Gross Revenue", f"{currency_symbol}{total_revenue:,.3f}", background_color='#DBD46D', fa_icon='fas fa-dollar-sign', icon_color='green')
+        with col2:
+            render_centered_text_block("Total O&M Cost", f"{currency_symbol}{total_o_and_m_cost:,.3f}", background_color='#DBEAFE', fa_icon='fas fa-tools', icon_color='red')
+        render_centered_text_block("Total Net Revenue", f"{currency_symbol}{cumulative_net_revenue:,.3f}", background_color='#DBEAFE', fa_icon='fas fa-chart-line', icon_color='blue')
+    
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            render_centered_text_block("NPV", f"{currency_symbol}{npv:,.3f}", background_color='#DBD46D', fa_icon='fas fa-money-bill-wave', icon_color='orange')
+        with col2:
+            render_centered_text_block("IRR", f"{irr:.3f}%", background_color='#DBEAFE', fa_icon='fas fa-percentage', icon_color='purple')
+        with col3:
+            render_centered_text_block("Annual Avg ROI", f"{annual_average_roi:.3f}%", background_color='#DBEAFE', fa_icon='fas fa-chart-pie', icon_color='darkgreen')
+        col1, col2 = st.columns(2)
+        with col1:
+            render_centered_text_block("Simple Payback Period", payback_text, background_color='#DBEAFE', fa_icon='fas fa-hourglass-half', icon_color='brown')
+        with col2:
+            render_centered_text_block("Discounted Payback Period", discounted_payback_text, background_color='#DBEAFE', fa_icon='fas fa-hourglass-end', icon_color='brown')
+        if graph_inputs['battery'] is not None:
+            storage = calc_graph.compute('storage', graph_inputs)
+            # With a load profile the battery follows the load, as dispatched by the metering
+            moved = storage if graph_inputs['metering'] is None else calc_graph.compute('metering', graph_inputs)
+            render_centered_text_block(
+                "Battery", f"{moved['battery_discharged'][0, 0]:,.1f} kWh moved to peak hours in year 1, "
+                           f"{storage['battery_capacity'][0, -1] / battery_capacity * 100 if battery_capacity else 0:.0f}% capacity left in year {int(project_life)}",
+                main_text_tag='h4', width='800px', background_color='#DBEAFE', fa_icon='fas fa-battery-three-quarters', icon_color='green')
+        if graph_inputs['metering'] is not None:
+            metered = calc_graph.compute('metering', graph_inputs)
+            first_year_generation = metered['self_consumed'][0, 0] + metered['exported'][0, 0]
+            render_centered_text_block(
+                "Self-consumption", f"{metered['self_consumed'][0, 0] / first_year_generation * 100 if first_year_generation else 0:.1f}% used on site, "
+                                    f"{metered['exported'][0, 0]:,.1f} kWh exported and {metered['imported'][0, 0]:,.1f} kWh imported in year 1",
+                main_text_tag='h4', width='800px', background_color='#DBEAFE', fa_icon='fas fa-plug', icon_color='darkblue')
+
+        # Charts read column views of result.yearly
+        with run_timer.stage('charts'):
+            if stored is not None:
+                chart_images = stored.artifacts
+            else:
+                chart_images = {name: calc_graph.compute(name, graph_inputs) for name in ('generation_chart', 'cash_flow_chart', 'revenue_chart')}
+    
+        # Display the charts in Streamlit
+        st.image(chart_images['generation_chart'])
+        st.image(chart_images['cash_flow_chart'])
+        st.image(chart_images['revenue_chart'])
+
+
+        # Table display
+        styled_text_block("Lifetime Energy Yield (kWh) and Cash Flows", color='#333333', background_color='#FFFFE0')
+        if result.project_life <= TABLE_HTML_MAX_ROWS:
+            with run_timer.stage('table_html'):
+                if stored is not None:
+                    html_cash_flows_df = cash_flow_table_html(result.yearly, currency_symbol)
+                else:
+                    html_cash_flows_df = calc_graph.compute('table_html', graph_inputs)
+
+            # Center the table using HTML and CSS
+            centered_table = f"""
+            <div style="display: flex; justify-content: center;text-align: center;">
+                {html_cash_flows_df}</div>
+            """
+
+            st.markdown(centered_table, unsafe_allow_html=True)
+        else:
+            # Long tables go through the native dataframe widget, which only renders the visible rows
+            columns = cash_flow_columns(currency_symbol)
+            st.dataframe(result.frame({label: field for label, field, _ in columns}), hide_index=True, column_config={
+                name: st.column_config.NumberColumn(name, format=number_format)
+                for name, number_format in cash_flow_formats(currency_symbol).items()
+            })
+
+        # The cash-flow table as a workbook with live NPV and IRR formulas, written when the button is clicked
+        if workbook.available():
+            st.download_button("Download cash flows (Excel)", partial(workbook.project_workbook, result, discount_rate, currency_symbol),
+                               file_name=f"{project_name or 'cash_flows'}.xlsx", mime=XLSX_MIME)
+        else:
+            st.caption(workbook.XLSX_MISSING)
+
+        # Environmental Benefits
+        houses_energized = result.houses_energized
+        gallons_gas_saved = result.gallons_gas_saved
+        cars_taken_off_road = result.cars_taken_off_road
+        tree_seedlings = result.tree_seedlings
+        co2_saved_tonnes = result.co2_saved_tonnes
+        lifetime_co2_saved_tonnes = result.lifetime_co2_saved_tonnes
+
+        st.write('\n')
+        st.write('\n')
+        st.write('\n')
+
+
+        st.markdown(f"""
+            <div style="text-align: center;">
+                <h2>Environmental Benefits</h2>
+                <div style="display: flex; justify-content: space-around; align-items: center; flex-wrap: wrap;">
+                    <div style="margin: 20px;">
+                        <i class="fas fa-home fa-3x" style="color: orange;"></i>
+                        <h3>{houses_energized:.3f}</h3>
+                        <p>Houses Energized per Year</p>
+                    </div>
+                    <div style="margin: 20px;">
+                        <i class="fas fa-gas-pump fa-3x" style="color: skyblue;"></i>
+                        <h3>{gallons_gas_saved:.3f}</h3>
+                        <p>Gallons of Gas Saved per Year</p>
+                    </div>
+                    <div style="margin: 20px;">
+                        <i class="fas fa-car fa-3x" style="color: blue;"></i>
+                        <h3>{cars_taken_off_road:.3f}</h3>
+                        <p>Cars Taken Off Road per Year</p>
+                    </div>
+                    <div style="margin: 20px;">
+                        <i class="fas fa-tree fa-3x" style="color: green;"></i>
+                        <h3>{tree_seedlings:.3f}</h3>
+                        <p>Tree Seedlings Grown for 10 Years</p>
+                    </div>
+                    <div style="margin: 20px;">
+                        <i class="fas fa-cloud fa-3x" style="color: gray;"></i>
+                        <h3>{co2_saved_tonnes:.3f}</h3>
+                        <p>Tonnes of CO2 Emissions Saved per Year</p>
+                    </div>
+                    <div style="margin: 20px;">
+                        <i class="fas fa-globe fa-3x" style="color: teal;"></i>
+                        <h3>{lifetime_co2_saved_tonnes:.3f}</h3>
+                        <p>Tonnes of CO2 Saved over Project Life</p>
+                    </div>
                 </div>
             </div>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    df_cash_flows_pdf = pd.DataFrame({
-        'Year': range(1, project_life + 1),
-        f'Gross Revenue ({currency_symbol})': yearly_gross_revenues,
-        f'O&M Expense ({currency_symbol})': yearly_o_and_m_expenses,
-        f'Cash Flow ({currency_symbol})': cash_flows[1:],
-        f'Cumulative Net Revenue ({currency_symbol})': cumulative_net_revenues
-    })
-    
-    df_cash_flows_pdf = df_cash_flows_pdf.round({
-        'Year': 0,
-    f'Gross Revenue ({currency_symbol})': 2,
-    f'O&M Expense ({currency_symbol})': 2,
-    f'Cash Flow ({currency_symbol})': 2,
-    f'Cumulative Net Revenue ({currency_symbol})': 2
-    })
-
-    # Enhanced PDF Class with Improved Table Format and Centered Table
-    class PDF(FPDF):
-        def __init__(self, logo_path=None):
-            super().__init__()
-            self.logo_path = logo_path
+        """, unsafe_allow_html=True)
     
-            
-        def footer(self):
-            self.set_y(-15)
-            self.set_font('Arial', 'I', 8)
-            self.cell(0, 5, f'Page {self.page_no()}', 0, 1, 'C')
-            self.set_y(-10)  # Adjust position for the link
-            self.cell(0, 5, 'App link: https://solarfinc-v01.streamlit.app/', 0, 0, 'C', link='https://energy-eda-v01.streamlit.app/')
-
-        def cover_page(self, client_name, client_address, project_name, company_name, prepared_by, company_email):
-            self.add_page()
-        
-            # Background color (optional - this will be a colored rectangle)
-            self.set_fill_color(230, 240, 255)  # Light blue color
-            self.rect(0, 0, 210, 297, 'F')  # Cover the entire page (A4 dimensions)
-    
-            # Add the logo centered on the cover page
-            if self.logo_path:
-                self.image(self.logo_path, x=75, y=20, w=60)
-    
-            self.ln(45)  # Move below the logo
-            # Title
-            self.set_font('Arial', 'B', 24)
-            self.set_text_color(0, 51, 102)  # Dark blue color
-            self.cell(0, 10, 'Solar PV System Financial Report', 0, 1, 'C')
-            self.ln(10)
-            # Decorative Line below title
-            self.set_line_width(0.5)
-            self.set_draw_color(0, 51, 102)  # Dark blue color
-            self.line(60, self.get_y(), 150, self.get_y())
-            self.ln(5)
-            self.set_font('Arial', 'I', 16)
-            self.cell(0, 10, 'Generated by Energy Data Updater and Analytics App', 0, 1, 'C')
-            self.ln(10)
-            
-            
-            # Client Details Table
-            self.set_font('Arial', 'B', 16)
-            self.cell(0, 10, 'Client Details', 0, 1, 'C')
-            
-            # Calculate x position for centering the table
-            table_width = 150  # Define the width of the table
-            x_position = (self.w - table_width) / 2
-            
-            # Draw the Client Details table
-            self.set_x(x_position)
-            self.set_font('Arial', '', 12)
-            self.cell(45, 10, 'Client Name:', 1, 0, 'C')
-            self.cell(105, 10, client_name, 1, 1, 'C')
-        
-            self.set_x(x_position)
-            self.cell(45, 10, 'Client Address:', 1, 0, 'C')
-            self.cell(105, 10, client_address, 1, 1, 'C')
-            
-            self.set_x(x_position)
-            self.cell(45, 10, 'Project Details:', 1, 0, 'C')
-            self.cell(105, 10, project_name, 1, 1, 'C')
-            
-            self.ln(10)
+        def provide_pdf_download_link(pdf_buffer, file_name):
+            # Encode the PDF content as base64
+            b64 = base64.b64encode(pdf_buffer.read()).decode('utf-8')  # Read and encode the binary PDF content
         
-            # Company Details Table
-            self.set_font('Arial', 'B', 16)
-            self.cell(0, 10, 'Company Details', 0, 1, 'C')
-            
-            # Draw the Company Details table
-            self.set_x(x_position)
-            self.set_font('Arial', '', 12)
-            self.cell(45, 10, 'Company Name:', 1, 0, 'C')
-            self.cell(105, 10, company_name, 1, 1, 'C')
-        
-            self.set_x(x_position)
-            self.cell(45, 10, 'Prepared By:', 1, 0, 'C')
-            self.cell(105, 10, prepared_by, 1, 1, 'C')
-            
-            self.set_x(x_position)
-            self.cell(45, 10, 'Company Email:', 1, 0, 'C')
-            self.cell(105, 10, company_email, 1, 1, 'C')
-        
-            self.ln(30)
-            
-            # Report Generated Date
-            self.set_font('Arial', 'I', 12)
-            self.cell(0, 10, f'Report Generated: {pd.Timestamp.now().strftime("%Y-%m-%d")}', 0, 1, 'C')
-            self.ln(10)
-    
-    
-        def header(self):
-            if self.logo_path:
-                self.image(self.logo_path, 10, 6, 33)  # Adjust y-position to 6
-            self.set_font('Arial', 'B', 12)
-            self.cell(0, 10, 'Solar PV System Financial Report', 0, 1, 'C')
-            self.set_font('Arial', 'I', 10)
-            self.cell(0, 10, 'Generated by Energy Data Updater and Analytics App', 0, 1, 'C')
-            self.ln(5)
-            self.set_line_width(0.5)
-            self.line(10, self.get_y(), 200, self.get_y())
-            self.ln(5)
-            
-    
-        def chapter_title(self, title):
-            self.set_font('Arial', 'B', 18)
-            self.set_fill_color(216, 248, 171)
-            self.set_text_color(0, 102, 204)
-            self.cell(0, 10, title, 0, 1, 'C', fill=True)
-            self.ln(5)
-    
-        def chapter_subtitle(self, subtitle):
-            self.set_font('Arial', 'B', 14)
-            self.set_fill_color(230, 230, 250)
-            self.set_text_color(0, 0, 0)
-            self.cell(0, 10, subtitle, 0, 1, 'C', fill=True)
-            self.ln(5)
-    
-        def add_form_inputs(self, form_data):
-            # Title for Inputs
-            self.set_font('Arial', 'B', 16)
-            self.set_fill_color(230, 230, 250)
-            self.cell(0, 10, 'Project and Financial Inputs', 0, 1, 'C', fill=True)
-            self.ln(7)
-            
-            # Styling for Form Data Display in colorful tabular format
-            self.set_font('Arial', 'B', 12)
-            self.set_fill_color(255, 228, 225)
-            self.cell(90, 7, 'Input Parameter', 1, 0, 'C', fill=True)
-            self.cell(0, 7, 'Value', 1, 1, 'C', fill=True)
-    
-            for title, value in form_data.items():
-                self.set_font('Arial', 'B', 12)
-                self.set_fill_color(255, 255, 240)
-                self.cell(90, 8, f'{title}:', 1, 0, 'L', fill=True)
-                self.set_font('Arial', '', 12)
-                self.set_fill_color(240, 248, 255)
-                self.cell(0, 8, f'{value}', 1, 1, 'R', fill=True)
-            self.ln(7)
-            
-            
-        def card(self, title, value, fill_color):
-            self.set_font('Arial', 'B', 12)
-            self.set_fill_color(*fill_color)
-            self.set_text_color(0, 0, 255)
-            self.cell(90, 10, f"{title}", 0, 0, 'L', fill=True)
-            self.cell(0, 10, f"{value}", 0, 1, 'R', fill=True)
-            self.ln(5)
-    
-        def metric_table(self, metrics, bg_color):
-            icon_size = 10
-            col_widths = [20, 25, 105]  # Adjusted column widths for better alignment
-            row_height = 15  # Adjusted row height
-            
-            # Calculate total table width
-            table_width = sum(col_widths)
-            
-            # Calculate the center position for the table
-            page_width = self.w - 2 * self.l_margin
-            x_offset = (page_width - table_width) / 2 + self.l_margin  # Center the table on the page
-            
-            for metric in metrics:
-                self.set_x(x_offset)
-                
-                # Icon column
-                self.set_fill_color(*bg_color)
-                self.cell(col_widths[0], row_height, "", border=0, align='C', fill=True)
-                self.image(metric['image'], x=self.get_x() - col_widths[0] + icon_size / 2, y=self.get_y() + 2.5, w=icon_size, h=icon_size)
-                
-                # Value column
-                self.cell(col_widths[1], row_height, metric['value'], border=0, align='R', fill=True)
-                
-                # Description column
-                self.cell(col_widths[2], row_height, metric['description'], border=0, align='L', fill=True)
-                
-                # Move to the next line for the next metric
-                self.ln(row_height)
-            
-            # Space after the table
-            self.ln(5)
-
-    
-        def add_metric_table(self, title, value, bg_color, x_offset, y_start, width=60):
-            self.set_fill_color(*bg_color)
-            self.set_text_color(255, 255, 255)
-    
-            self.set_xy(x_offset, y_start)
-            self.cell(width, 10, title, border=1, align='C', fill=True)
-            self.ln(10)
-    
-            self.set_x(x_offset)
-            self.set_fill_color(255, 255, 255)
-            self.set_text_color(0, 0, 0)
-            self.cell(width, 10, value, border=1, align='C', fill=True)
-    
-        def add_two_column_metrics(self, metrics, column_spacing=10, row_spacing=10):
-            page_width = self.w - 2 * self.l_margin
-            column_width = (page_width - column_spacing) / 2
-            x_offset1 = self.l_margin
-            x_offset2 = x_offset1 + column_width + column_spacing
-    
-            max_rows = len(metrics) // 2 + len(metrics) % 2
-            y_start = self.get_y()
-    
-            for row in range(max_rows):
-                y_position = y_start + row * (15 + row_spacing)
-                title1, value1, bg_color1 = metrics[row * 2]
-                self.add_metric_table(title1, value1, bg_color1, x_offset1, y_position, column_width)
-                if row * 2 + 1 < len(metrics):
-                    title2, value2, bg_color2 = metrics[row * 2 + 1]
-                    self.add_metric_table(title2, value2, bg_color2, x_offset2, y_position, column_width)
-
-        def add_cash_flow_table(self, df_cash_flows_pdf, currency_symbol):
-            self.add_page()
-            self.chapter_title('Cash Flow Analysis')
-        
-            # Setting up the table headers with a line break in the 'Cumulative Net Revenue' header
-            self.set_font('Arial', 'B', 12)
-            self.set_fill_color(240, 240, 240)
-            col_widths = [15, 40, 40, 40, 40]  # Adjust column widths as needed
-            table_width = sum(col_widths)  # Total width of the table
-            # Calculate the starting x position to center the table
-            page_width = self.w - 2 * self.l_margin  # Page width minus margins
-            x_start_T = (page_width - table_width) / 2 + self.l_margin
-            
-            # Set the position for the table
-            self.set_x(x_start_T)
-            
-            
-            # Regular header for 'Year'
-            self.cell(col_widths[0], 20, 'Year', border=1, align='C', fill=True)
-            x_start = self.get_x()
-        
-            # Multi-cell headers for the other columns with a line break before the currency symbol
-            self.multi_cell(col_widths[1], 10, f'Gross Revenue\n({currency_symbol})', border=1, align='C', fill=True)
-            self.set_xy(x_start + col_widths[1], self.get_y() - 20)  # Reset the position for the next cell in the same row
-            self.multi_cell(col_widths[2], 10, f'O&M Expense\n({currency_symbol})', border=1, align='C', fill=True)
-            self.set_xy(x_start + col_widths[1] + col_widths[2], self.get_y() - 20)  # Reset the position for the next cell in the same row
-            self.multi_cell(col_widths[3], 10, f'Cash Flow\n({currency_symbol})', border=1, align='C', fill=True)
-            self.set_xy(x_start + col_widths[1] + col_widths[2] + col_widths[3], self.get_y() - 20)  # Reset the position for the next cell in the same row
-            self.multi_cell(col_widths[4], 6.667, f'Cumulative\nNet Revenue\n({currency_symbol})', border=1, align='C', fill=True)
-
-            self.ln(1)
+            # HTML for the download button with center alignment
+            href = f'''
+            <div style="display: flex; justify-content: center; align-items: center; margin-top: 20px;">
+                <a href="data:application/octet-stream;base64,{b64}" download="{file_name}">
+                    <button style="padding:10px 20px; background-color: #4CAF50; color: white; border: none; border-radius: 5px; font-size: 16px;">
+                        Download PDF Report
+                    </button>
+                </a>
+            </div>
+            '''
         
-            # Filling in the table rows with reduced row height and currency symbols in the values
-            self.set_font('Arial', '', 10)
-            for index, row in df_cash_flows_pdf.iterrows():
-                self.set_x(x_start_T)
-                self.cell(col_widths[0], 7, str(int(row['Year'])), border=1, align='C')
-                self.cell(col_widths[1], 7, f"{row[f'Gross Revenue ({currency_symbol})']:.0f}", border=1, align='C')
-                self.cell(col_widths[2], 7, f"{row[f'O&M Expense ({currency_symbol})']:.0f}", border=1, align='C')
-                self.cell(col_widths[3], 7, f"{row[f'Cash Flow ({currency_symbol})']:.0f}", border=1, align='C')
-                self.cell(col_widths[4], 7, f"{row[f'Cumulative Net Revenue ({currency_symbol})']:.0f}", border=1, align='C')
-                self.ln()
+            # Render the button in Streamlit
+            st.markdown(href, unsafe_allow_html=True)
+    
+    
+    
+        def pdf_report(summary, generation_chart, cash_flow_chart, revenue_chart, form, logo, currency_symbol, pdf_quality):
+            options = pdf_options(pdf_quality)
+            chart_images = {
+                'generation_chart': generation_chart,
+                'cash_flow_chart': cash_flow_chart,
+                'revenue_chart': revenue_chart,
+            }
+            if options['vector_charts']:
+                # The page shows PNG charts; the PDF gets SVG versions of the same charts
+                chart_images = report_charts(summary, currency_symbol, options)
+            pdf_buffer = generate_pdf_report(
+                BytesIO(logo) if logo is not None else None,
+                summary,
+                initial_investment=form['initial_investment'],
+                project_capacity=form['project_capacity'],
+                o_and_m_cost=form['o_and_m_cost'],
+                electricity_cost=form['electricity_cost'],
+                project_life=form['project_life'],
+                energy_generation_first_year=form['energy_generation_first_year'],
+                yearly_degradation=form['yearly_degradation'],
+                o_and_m_escalation=form['o_and_m_escalation'],
+                electricity_tariff_escalation=form['electricity_tariff_escalation'],
+                discount_rate=form['discount_rate'],
+                chart_images=chart_images,
+                currency_symbol=currency_symbol,
+                client_name=form['client_name'],
+                client_address=form['client_address'],
+                project_name=form['project_name'],
+                company_name=form['company_name'],
+                company_prepared_by=form['company_prepared_by'],
+                company_email=form['company_email'],
+                extra_inputs=form['extra_inputs'],
+                options=options,
+            )
+            return pdf_buffer.getvalue()
+
+        calc_graph.add('report', pdf_report, params=('form', 'logo', 'currency_symbol', 'pdf_quality'),
+                       deps=('summary', 'generation_chart', 'cash_flow_chart', 'revenue_chart'))
+        with run_timer.stage('report'):
+            if stored is not None:
+                report_bytes = stored.artifacts['report']
+            else:
+                report_bytes = calc_graph.compute('report', graph_inputs)
+        if stored is None:
+            with run_timer.stage('store'):
+                result_store.put(stored_key, proposal_inputs, result, dict(chart_images, report=report_bytes),
+                                 client_name=client_name, project_name=project_name)
+                result_store.flush()
+
+        # Provide download link as HTML button
+        provide_pdf_download_link(BytesIO(report_bytes), "solar_pv_system_financial_report.pdf")
+    
+        # Provide download link in the sidebar
+        with st.sidebar:
+            st.write('_________')
+            provide_pdf_download_link(BytesIO(report_bytes), "solar_pv_system_financial_report.pdf")
+
+    with st.expander("Calculation details"):
+        if stored is not None:
+            st.write(f"Loaded from the result store (saved {stored.created})")
+        else:
+            st.write(f"Recomputed this run: {', '.join(calc_graph.recomputed) or 'nothing (all results reused)'}")
+        if run_timer.enabled:
+            st.write({name: f"{seconds * 1000:.1f} ms" for name, seconds in run_timer.stages.items()})
+        if profiler is not None:
+            st.code(profiler.report)
+    
+
+# Scenario Comparison
+if len(scenario_store) > 0:
+    st.write('\n')
+    styled_text_block("Scenario Comparison", color='#333333', background_color='#FFFFE0')
+
+    selected_scenarios = st.multiselect("Scenarios to compare", scenario_store.names, default=scenario_store.names[-10:])
+    if selected_scenarios:
+        df_comparison = scenario_store.comparison_frame(selected_scenarios, currency_symbol)
+        st.dataframe(df_comparison, hide_index=True)
+
+        # Overlay charts of the selected scenarios
+        col1, col2 = st.columns(2)
+        fig_cmp1, ax_cmp1 = plt.subplots()
+        cumulative = scenario_store.series_for('cumulative_cash_flow', selected_scenarios)
+        for name, values in zip(selected_scenarios, cumulative):
+            ax_cmp1.plot(np.arange(len(values)), values, label=name)
+        ax_cmp1.axhline(0, color='red', linestyle='--')
+        ax_cmp1.set_xlabel('Year')
+        ax_cmp1.set_ylabel(f'Cumulative Cash Flow ({currency_symbol})')
+        ax_cmp1.set_title('Cumulative Cash Flow by Scenario')
+        ax_cmp1.legend(fontsize=8)
+        col1.pyplot(fig_cmp1)
+        plt.close(fig_cmp1)
+
+        fig_cmp2, ax_cmp2 = plt.subplots()
+        generation = scenario_store.series_for('generation', selected_scenarios)
+        for name, values in zip(selected_scenarios, generation):
+            ax_cmp2.plot(np.arange(1, len(values) + 1), values, label=name)
+        ax_cmp2.set_xlabel('Year')
+        ax_cmp2.set_ylabel('Energy Yield (kWh)')
+        ax_cmp2.set_title('Energy Yield by Scenario')
+        ax_cmp2.legend(fontsize=8)
+        col2.pyplot(fig_cmp2)
+        plt.close(fig_cmp2)
 
-        
+    col1, col2 = st.columns(2)
+    removed_scenarios = col1.multiselect("Remove scenarios", scenario_store.names)
+    if col2.button("Remove selected") and removed_scenarios:
+        scenario_store.remove(removed_scenarios)
+        st.rerun()
 
-        def add_energy_table(self, df_cash_flows):
-            self.add_page()
-            self.chapter_title('25 Years Energy Yield Data Analysis')
-        
-            # Set the table column widths
-            col_widths = [15, 60, 60]  # Adjust column widths as needed
-            table_width = sum(col_widths)  # Total width of the table
-            
-            # Calculate the starting x position to center the table
-            page_width = self.w - 2 * self.l_margin  # Page width minus margins
-            x_start = (page_width - table_width) / 2 + self.l_margin
-            
-            # Set the position for the table
-            self.set_x(x_start)
-            
-            # Set the font for the table headers
-            self.set_font('Arial', 'B', 12)
-            self.set_fill_color(240, 240, 240)
-        
-            # Regular headers (single-line headers)
-            self.cell(col_widths[0], 10, 'Year', border=1, align='C', fill=True)
-            self.cell(col_widths[1], 10, f'Energy Yield (kWh)', border=1, align='C', fill=True)
-            self.cell(col_widths[2], 10, f'% Yearly Degradation', border=1, align='C', fill=True)
-            self.ln()  # Move to the next line after the headers
-        
-            # Filling in the table rows with reduced row height
-            self.set_font('Arial', '', 10)
-            for index, row in df_cash_flows.iterrows():
-                self.set_x(x_start)  # Set x position to center the rows
-                self.cell(col_widths[0], 7, str(int(row['Year'])), border=1, align='C')
-                self.cell(col_widths[1], 7, f"{row[f'Energy Yield (kWh)']:.0f}", border=1, align='C')
-                self.cell(col_widths[2], 7, f"{row[f'% Yearly Degradation']:.3f}", border=1, align='C')
-                self.ln()  # Move to the next line after each row
-
-
-
-
-    def generate_pdf_report(
-        logo_file,
-        initial_investment,
-        initial_investment_total,
-        project_capacity,
-        o_and_m_cost,
-        electricity_cost,
-        project_life,
-        energy_generation_first_year,
-        yearly_degradation,
-        o_and_m_escalation,
-        electricity_tariff_escalation,
-        discount_rate,
-        total_revenue,
-        total_o_and_m_cost,
-        cumulative_net_revenue,
-        npv,
-        irr,
-        payback_period_years,
-        additional_months,
-        annual_average_roi,
-        lcoe,
-        houses_energized,
-        gallons_gas_saved,
-        cars_taken_off_road,
-        tree_seedlings,
-        co2_saved_tonnes,
-        df_cash_flows_pdf,
-        df_cash_flows
-    ):
-
-        #pdf = PDF()
-        # Save the logo file temporarily if provided
-        logo_path = None
-        if logo_file is not None:
-            logo = Image.open(logo_file)
-            logo_path = tempfile.NamedTemporaryFile(delete=False, suffix=".png").name
-            logo.save(logo_path)
-    
-        pdf = PDF(logo_path=logo_path)
-        pdf.cover_page(client_name, client_address, company_name, company_prepared_by, company_email, project_name)
-        pdf.add_page()
-    
-        # Title and Subtitle
-        pdf.set_font('Arial', 'BI', 16)
-        pdf.set_text_color(0, 0, 0)
-        pdf.cell(0, 10, 'Comprehensive analysis of financial and environmental benefits', 0, 1, 'C')
-        #pdf.set_font('Arial', 'I', 16)
-        #pdf.set_text_color(105, 105, 105)
-        #pdf.cell(0, 10, 'Comprehensive analysis of financial and environmental benefits', 0, 1, 'C')
-        pdf.ln(10)
-        
-        # Connect Form Data to Input Data
-        form_data = {
-            f"Total Initial Investment ({currency_symbol})": f"{currency_symbol}{initial_investment_total:.3f}",
-            "Project Capacity (kWp)": f"{project_capacity} kWp",
-            f"O&M Cost ({currency_symbol}/kWp per year)": f"{currency_symbol}{o_and_m_cost:.3f}",
-            f"Cost of Electricity ({currency_symbol}/kWh)": f"{currency_symbol}{electricity_cost:.3f}",
-            "Project Life (years)": f"{project_life} years",
-            "Energy Generation for First Year (kWh)": f"{energy_generation_first_year:.3f} kWh",
-            "Yearly Degradation (%)": f"{yearly_degradation:.3f}%",
-            "O&M Cost Escalation (%)": f"{o_and_m_escalation:.3f}%",
-            "Electricity Tariff Escalation (%)": f"{electricity_tariff_escalation:.3f}%",
-            "Discount Rate (%)": f"{discount_rate:.3f}%",
-        }
-    
-        
-    
-        # Add Form Inputs to the Report
-        pdf.add_form_inputs(form_data)
-        
-        # Center the image in the PDF
-        pdf_width = pdf.w - 2 * pdf.l_margin  # The effective width of the PDF (excluding margins)
-        image_width = 120  # Set the desired image width
-        
-        # Calculate the x position to center the image
-        x_position = (pdf_width - image_width) / 2 + pdf.l_margin
 
-        # Yearly Generation and Degradation
-        pdf.chapter_subtitle('Yearly Generation and Degradation')
-        pdf.image('yearly_generation_degradation.png', x=x_position, y=None, w=image_width, h=90)  # Set width (w) and height (h)
-        
-        pdf.add_page()
-    
-        # Financial Metrics Section
-        pdf.chapter_subtitle('Financial Metrics')
-        financial_metrics = [
-            ("Total Gross Revenue", f"{currency_symbol}{total_revenue:,.3f}", (0, 102, 204)),
-            ("Total O&M Cost", f"{currency_symbol}{total_o_and_m_cost:,.3f}", (255, 165, 0)),
-            ("Total Net Revenue", f"{currency_symbol}{cumulative_net_revenue:,.3f}", (34, 139, 34)),
-            ("NPV", f"{currency_symbol}{npv:,.3f}", (255, 69, 0)),
-            ("IRR", f"{irr:.3f}%", (75, 0, 130)),
-            ("Simple Payback Period", f"{payback_period_years} years and {additional_months} months", (255, 215, 0)),
-            ("Annual Average ROI", f"{annual_average_roi:.3f}%", (30, 144, 255)),
-            ("LCoE", f"{currency_symbol}{lcoe:.4f}/kWh", (220, 20, 60)),
-        ]
-        pdf.add_two_column_metrics(financial_metrics)
-    
-        pdf.ln(20)
-    
-        # Environmental Benefits Section
-        pdf.chapter_subtitle('Environmental Benefits')
-        
-        bg_color = (230, 240, 255)  # Light blue background color
-        metrics = [
-            {"image": "house.png", "value": f"{houses_energized:.3f}", "description": "Houses\nEnergized per Year"},
-            {"image": "petrol-pump.png", "value": f"{gallons_gas_saved:.3f}", "description": "Gallons of Gas\nSaved per Year"},
-            {"image": "car-wash.png", "value": f"{cars_taken_off_road:.3f}", "description": "Cars Taken Off\nRoad per Year"},
-            {"image": "forest.png", "value": f"{tree_seedlings:.3f}", "description": "Tree Seedlings\nGrown for 10 Years"},
-            {"image": "co2.png", "value": f"{co2_saved_tonnes:.3f}", "description": "Tonnes of CO2\nEmissions Saved per Year"},
-        ]
-        
-        pdf.metric_table(metrics, bg_color)
-    
-        pdf.ln(20)
-    
-        # Charts Section
-        pdf.chapter_title('Charts')
-        
-        
-        
-        # Yearly Gross Revenue and O&M Expense
-        pdf.chapter_subtitle('Yearly Gross Revenue and O&M Expense')
-        pdf.image('yearly_gross_revenue_om_expense.png', x=x_position, y=None, w=image_width, h=90)  # Set width (w) and height (h)
+# Saved Proposals
+st.write('\n')
+styled_text_block("Saved Proposals", color='#333333', background_color='#FFFFE0')
+with st.expander("Find a saved proposal"):
+    col1, col2, col3 = st.columns(3)
+    search_client = col1.text_input("Client name starts with")
+    search_project = col2.text_input("Project name starts with")
+    search_dates = col3.date_input("Saved between", value=())
+    since = until = None
+    if len(search_dates) == 2:
+        since, until = search_dates[0], search_dates[1] + pd.Timedelta(days=1)
+    saved = result_store.find(client=search_client, project=search_project, since=since, until=until)
+    if saved:
+        df_saved = pd.DataFrame(saved, columns=['Key', 'Client', 'Project', 'Saved', f'NPV ({currency_symbol})', 'IRR (%)', f'LCoE ({currency_symbol}/kWh)'])
+        st.dataframe(df_saved.drop(columns='Key'), hide_index=True)
+        labels = {row[0]: f"{row[3]} - {row[1] or 'no client'} / {row[2] or 'no project'}" for row in saved}
+        saved_key = st.selectbox("Proposal", list(labels), format_func=labels.get)
+        saved_proposal = result_store.get(saved_key)
+        if saved_proposal is not None and 'report' in saved_proposal.artifacts:
+            st.download_button("Download saved PDF report", saved_proposal.artifacts['report'],
+                               file_name="solar_pv_system_financial_report.pdf", mime='application/pdf')
+    else:
+        st.write("No saved proposals match.")
+
+with st.expander("Portfolio roll-up of the proposals found"):
+    # Only proposals that joined or left the search results are added to or removed from the running sums
+    saved_keys = {row[0] for row in saved}
+    portfolio_rollup.remove([key for key in portfolio_rollup.projects if key not in saved_keys])
+    for key in [row[0] for row in saved if row[0] not in portfolio_rollup.projects]:
+        saved_proposal = result_store.get(key, artifacts=False)
+        if saved_proposal is not None:
+            portfolio_rollup.add_proposal(saved_proposal)
+    if len(portfolio_rollup):
+        groupings = {'portfolio': "Whole portfolio", 'region': "Grid region", 'client': "Client", 'commissioning_year': "Commissioning year"}
+        rollup_grouping = st.selectbox("Group by", list(groupings), format_func=groupings.get)
+        df_rollup = portfolio_rollup.summary(rollup_grouping).reset_index()
+        df_rollup.columns = [groupings[rollup_grouping], 'Projects', 'Capacity (kWp)', f'NPV ({currency_symbol})', 'IRR (%)',
+                             f'Net Cash Flow ({currency_symbol})', 'Generation (kWh)', 'CO2 Saved (tonnes)', 'First Year', 'Last Year']
+        st.dataframe(df_rollup, hide_index=True)
+        st.caption("NPV adds up each project's own NPV; IRR is that of the group's combined cash flows by calendar year. "
+                   "Investments are booked in the year before the first operating year.")
+
+        col1, col2 = st.columns(2)
+        calendar_years = portfolio_rollup.calendar_years()
+        fig_pf1, ax_pf1 = plt.subplots()
+        for label, values in portfolio_rollup.series(rollup_grouping, 'cash_flow').iterrows():
+            ax_pf1.plot(calendar_years, np.cumsum(values.to_numpy()), label=str(label))
+        ax_pf1.axhline(0, color='red', linestyle='--')
+        ax_pf1.set_xlabel('Calendar Year')
+        ax_pf1.set_ylabel(f'Cumulative Cash Flow ({currency_symbol})')
+        ax_pf1.set_title('Combined Cumulative Cash Flow')
+        ax_pf1.legend(fontsize=8)
+        col1.pyplot(fig_pf1)
+        plt.close(fig_pf1)
+
+        fig_pf2, ax_pf2 = plt.subplots()
+        for label, values in portfolio_rollup.series(rollup_grouping, 'co2_saved_tonnes').iterrows():
+            ax_pf2.plot(calendar_years, values.to_numpy(), label=str(label))
+        ax_pf2.set_xlabel('Calendar Year')
+        ax_pf2.set_ylabel('CO2 Saved (tonnes)')
+        ax_pf2.set_title('Combined CO2 Savings')
+        ax_pf2.legend(fontsize=8)
+        col2.pyplot(fig_pf2)
+        plt.close(fig_pf2)
+    else:
+        st.write("No saved proposals to roll up.")
 
-        # Cumulative Cash Flow and Break-even
-        pdf.chapter_subtitle('Cumulative Cash Flow and Break-even')
-        pdf.image('cumulative_cash_flow.png', x=x_position, y=None, w=image_width, h=90)  # Set width (w) and height (h)
-        #pdf.add_page()
 
-        
-        
-        # Adding the Energy Flow & Cash Flow table on the last page
-        pdf.add_energy_table(df_cash_flows)
-        pdf.add_cash_flow_table(df_cash_flows_pdf, currency_symbol)
-        
+# Background Simulations (Monte Carlo and parameter sweeps run in the shared process pool)
+st.write('\n')
+styled_text_block("Background Simulations", color='#333333', background_color='#FFFFE0')
+jobs = job_queue()
+session_id = st.session_state['session_id']
 
-        # Create a BytesIO buffer to store the PDF content
-        pdf_output = pdf.output(dest='S')  # Get PDF as string
-        pdf_buffer = BytesIO(pdf_output)
-        pdf_buffer.seek(0)
+with st.expander("Start a background simulation from the form inputs"):
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("#### Monte Carlo")
+        mc_samples = st.number_input("Samples", min_value=1_000, max_value=2_000_000, value=100_000, step=10_000)
+        mc_parameters = st.multiselect("Uncertain inputs", [name for name in model.PARAMETERS if name not in model.INTEGER_PARAMETERS],
+                                       default=['electricity_cost', 'energy_generation_first_year'])
+        mc_spread = st.number_input("Relative standard deviation (%)", min_value=0.0, value=10.0, step=1.0) / 100
+        mc_button = st.button("Run Monte Carlo in background")
+    with col2:
+        st.write("#### Parameter sweep")
+        sweep_parameter = st.selectbox("Swept input", [name for name in model.PARAMETERS if name not in model.INTEGER_PARAMETERS])
+        sweep_low = st.number_input("From", value=float(model_inputs[sweep_parameter]) * 0.5)
+        sweep_high = st.number_input("To", value=float(model_inputs[sweep_parameter]) * 1.5)
+        sweep_steps = st.number_input("Steps", min_value=2, max_value=1_000_000, value=1_000, step=100)
+        sweep_button = st.button("Run sweep in background")
+
+    st.write("#### Portfolio grid sweep")
+    st.caption("Every combination of the ranges below, optionally for every loaded scenario as a site, "
+               "summarized as the chunks finish.")
+    sweepable = [name for name in model.PARAMETERS if name not in model.INTEGER_PARAMETERS]
+    if 'grid_ranges_start' not in st.session_state:
+        st.session_state['grid_ranges_start'] = pd.DataFrame({
+            'Input': ['electricity_cost', 'initial_investment', 'discount_rate'],
+            'From': [float(model_inputs[name]) * 0.5 for name in ('electricity_cost', 'initial_investment', 'discount_rate')],
+            'To': [float(model_inputs[name]) * 1.5 for name in ('electricity_cost', 'initial_investment', 'discount_rate')],
+            'Steps': [20, 10, 5],
+        })
+    grid_ranges = st.data_editor(st.session_state['grid_ranges_start'], num_rows='dynamic', hide_index=True, key='grid_ranges',
+                                 column_config={'Input': st.column_config.SelectboxColumn(options=sweepable, required=True),
+                                                'Steps': st.column_config.NumberColumn(min_value=1, step=1)})
+    col1, col2 = st.columns(2)
+    grid_sites = col1.checkbox("Sweep every loaded scenario as a site", value='scenario_batch' in st.session_state,
+                               disabled='scenario_batch' not in st.session_state)
+    grid_objective = col2.selectbox("Rank rows by", METRICS)
+    grid_button = st.button("Run grid sweep in background")
 
-    
-        return pdf_buffer
-    
-    def provide_pdf_download_link(pdf_buffer, file_name):
-        # Encode the PDF content as base64
-        b64 = base64.b64encode(pdf_buffer.read()).decode('utf-8')  # Read and encode the binary PDF content
-        
-        # HTML for the download button with center alignment
-        href = f'''
-        <div style="display: flex; justify-content: center; align-items: center; margin-top: 20px;">
-            <a href="data:application/octet-stream;base64,{b64}" download="{file_name}">
-                <button style="padding:10px 20px; background-color: #4CAF50; color: white; border: none; border-radius: 5px; font-size: 16px;">
-                    Download PDF Report
-                </button>
-            </a>
-        </div>
-        '''
-        
-        # Render the button in Streamlit
-        st.markdown(href, unsafe_allow_html=True)
-    
-    
-    
-    pdf_buffer = generate_pdf_report(
-        logo_file,
-        initial_investment=initial_investment,
-        initial_investment_total=initial_investment_total,
-        project_capacity=project_capacity,
-        o_and_m_cost=o_and_m_cost,
-        electricity_cost=electricity_cost,
-        project_life=project_life,
-        energy_generation_first_year=energy_generation_first_year,
-        yearly_degradation=yearly_degradation,
-        o_and_m_escalation=o_and_m_escalation,
-        electricity_tariff_escalation=electricity_tariff_escalation,
-        discount_rate=discount_rate,
-        total_revenue=total_revenue,
-        total_o_and_m_cost=total_o_and_m_cost,
-        cumulative_net_revenue=cumulative_net_revenue,
-        npv=npv,
-        irr=irr,
-        payback_period_years=payback_period_years,
-        additional_months=additional_months,
-        annual_average_roi=annual_average_roi,
-        lcoe=lcoe,
-        houses_energized=houses_energized,
-        gallons_gas_saved=gallons_gas_saved,
-        cars_taken_off_road=cars_taken_off_road,
-        tree_seedlings=tree_seedlings,
-        co2_saved_tonnes=co2_saved_tonnes,
-        df_cash_flows_pdf=df_cash_flows_pdf,
-        df_cash_flows=df_cash_flows
-    )
-    
-    
+    try:
+        if mc_button:
+            jobs.submit(session_id, 'monte_carlo', inputs=form_model_inputs, n_samples=int(mc_samples),
+                        spreads={name: mc_spread for name in mc_parameters})
+        if sweep_button:
+            sweep_inputs = dict(form_model_inputs, **{sweep_parameter: np.linspace(sweep_low, sweep_high, int(sweep_steps))})
+            jobs.submit(session_id, 'sweep', inputs=sweep_inputs)
+        if grid_button:
+            grid_axes, grid_labels = {}, {}
+            if grid_sites and 'scenario_batch' in st.session_state:
+                _, loaded_scenarios, valid_rows, _ = st.session_state['scenario_batch']
+                grid_axes['site'] = scenario_files.batch_inputs(loaded_scenarios[valid_rows])
+                grid_labels['site'] = loaded_scenarios.loc[valid_rows, 'scenario_name'].to_numpy()
+            for row in grid_ranges.dropna().itertuples():
+                grid_axes[row.Input] = np.linspace(row.From, row.To, int(row.Steps))
+            grid_spec = sweeps.grid(form_model_inputs, grid_axes, grid_labels)
+            jobs.submit(session_id, 'grid_sweep', spec=grid_spec, objective=grid_objective)
+    except JobRejected as error:
+        st.warning(str(error))
+
+# Scenarios loaded from a file go straight to the batch engine
+if 'scenario_batch' in st.session_state:
+    batch_file_name, loaded_scenarios, valid_rows, scenario_errors = st.session_state['scenario_batch']
+    batch_scenarios = loaded_scenarios[valid_rows]
+    if len(batch_scenarios) > 1:
+        col1, col2, col3 = st.columns(3)
+        if col1.button(f"Run {len(batch_scenarios)} loaded scenarios now"):
+            batch_results = model.evaluate(scenario_files.batch_inputs(batch_scenarios))
+            df_batch = batch_scenarios[['scenario_name', 'client_name', 'project_name']].assign(
+                **{name: batch_results[name] for name in ('npv', 'irr', 'lcoe', 'payback_period', 'discounted_payback_period')})
+            st.dataframe(df_batch, hide_index=True)
+        if col2.button(f"Run {len(batch_scenarios)} loaded scenarios in background"):
+            try:
+                jobs.submit(session_id, 'sweep', inputs=scenario_files.batch_inputs(batch_scenarios))
+            except JobRejected as error:
+                st.warning(str(error))
+        # Evaluated and streamed into the workbook chunk by chunk when the button is clicked
+        if workbook.available():
+            col3.download_button(f"Download {len(batch_scenarios)} loaded scenarios (Excel)", partial(
+                workbook.portfolio_workbook, scenario_files.batch_inputs(batch_scenarios),
+                batch_scenarios['scenario_name'].astype(str).tolist(), currency_symbol),
+                file_name=f"{os.path.splitext(batch_file_name)[0]}.xlsx", mime=XLSX_MIME)
+
+
+def show_jobs():
+    # Progress and results of this session's jobs; polled while any of them is active
+    for job in sorted(jobs.session_jobs(session_id), key=lambda job: job.submitted, reverse=True):
+        col1, col2 = st.columns([4, 1])
+        col1.write(f"**{job.kind.replace('_', ' ').title()}** ({job.id}) - {job.status}")
+        if job.status in ('queued', 'running'):
+            col1.progress(job.progress)
+            if job.kind == 'grid_sweep' and job.result is not None:
+                best = job.result['best']['metrics'][job.result['objective']][0]
+                col1.caption(f"{job.result['count']:,} rows so far, best {job.result['objective']} {best:,.4g}")
+            if col2.button("Cancel", key=f"cancel_{job.id}"):
+                jobs.cancel(job.id)
+                st.rerun(scope='fragment')
+        else:
+            if job.status == 'failed':
+                col1.error(job.error)
+            elif job.status == 'done' and job.kind == 'grid_sweep':
+                # Every chunk carries the grid spec as its first argument
+                col1.dataframe(sweeps.percentiles(job.result))
+                col1.dataframe(sweeps.best_rows(job.chunk_args[0][0], job.result), hide_index=True)
+            elif job.status == 'done':
+                percentiles = pd.DataFrame(job.result).quantile([0.1, 0.5, 0.9])
+                percentiles.index = ['P10', 'P50', 'P90']
+                col1.dataframe(percentiles)
+            if col2.button("Remove", key=f"remove_{job.id}"):
+                jobs.forget(job.id)
+                st.rerun(scope='fragment')
+
+
+active_jobs = any(job.status in ('queued', 'running') for job in jobs.session_jobs(session_id))
+st.fragment(show_jobs, run_every=1.0 if active_jobs else None)()
 
-    # Provide download link as HTML button
-    provide_pdf_download_link(pdf_buffer, "solar_pv_system_financial_report.pdf")
-    # Generate a new PDF buffer for the sidebar to avoid data corruption issues
-    pdf_buffer_sidebar = generate_pdf_report(
-        logo_file,
-        df_cash_flows_pdf=df_cash_flows_pdf,
-        df_cash_flows=df_cash_flows,
-        initial_investment=initial_investment,
-        initial_investment_total=initial_investment_total,
-        project_capacity=project_capacity,
-        o_and_m_cost=o_and_m_cost,
-        electricity_cost=electricity_cost,
-        project_life=project_life,
-        energy_generation_first_year=energy_generation_first_year,
-        yearly_degradation=yearly_degradation,
-        o_and_m_escalation=o_and_m_escalation,
-        electricity_tariff_escalation=electricity_tariff_escalation,
-        discount_rate=discount_rate,
-        total_revenue=total_revenue,
-        total_o_and_m_cost=total_o_and_m_cost,
-        cumulative_net_revenue=cumulative_net_revenue,
-        npv=npv,
-        irr=irr,
-        payback_period_years=payback_period_years,
-        additional_months=additional_months,
-        annual_average_roi=annual_average_roi,
-        lcoe=lcoe,
-        houses_energized=houses_energized,
-        gallons_gas_saved=gallons_gas_saved,
-        cars_taken_off_road=cars_taken_off_road,
-        tree_seedlings=tree_seedlings,
-        co2_saved_tonnes=co2_saved_tonnes
-    )
-    
-    # Provide download link in the sidebar
-    with st.sidebar:
-        st.write('_________')
-        provide_pdf_download_link(pdf_buffer_sidebar, "solar_pv_system_financial_report.pdf")
-    
 
-st.sidebar.markdown(sidebar_css, unsafe_allow_html=True)
 st.sidebar.markdown(sidebar_menu, unsafe_allow_html=True)
-st.sidebar.markdown(contact_css, unsafe_allow_html=True)
 st.sidebar.markdown(contact_section, unsafe_allow_html=True)
         
+
+# Live mode, debounced: an edit made during the pause restarts the script at the next element,
+# so the model only runs for inputs that have settled
+if live_mode and not submit_button:
+    time.sleep(LIVE_DEBOUNCE)
+    live_status.caption("Calculating…")
+    try:
+        show_headline(live.headline(form_model_inputs))
+        live_status.caption("Exact figures; press Calculate for the charts, tables and PDF report")
+    except ValueError as error:
+        live_status.caption(f"Cannot calculate these inputs: {error}")
+
+
+run_timer.finish(submitted=bool(submit_button), recomputed=calc_graph.recomputed if submit_button else [])